@@ -0,0 +1,111 @@
+# Strict JSON schema for the AI action, and the validator every LLM answer goes through.
+# The schema goes out as Ollama's structured-output "format", so decoding is constrained to it:
+# a play names one of the turn's legal card guids (a wild one only together with a color), a draw
+# names none. Models and backends that ignore the schema are caught by ActionValidator, which
+# checks an answer against the same rules and maps it to an AIAction in one pass.
+
+import functools
+import json
+
+from cards import BLACK, CARD_COLOR, CARD_LABEL, COLOR_CODES, COLORS
+
+SCHEMA_FIELDS = ("action_type", "card_guid_to_play", "declared_color", "call_uno", "banter")
+
+def _variant(action_type, card_guid, declared_color):
+    # One allowed shape of the action object; the properties keep the prompt's order, banter last
+    return {"type": "object",
+            "properties": {"action_type": {"enum": [action_type]},
+                           "card_guid_to_play": card_guid,
+                           "declared_color": declared_color,
+                           "call_uno": {"type": "boolean"},
+                           "banter": {"type": "string"}},
+            "required": list(SCHEMA_FIELDS),
+            "additionalProperties": False}
+
+@functools.lru_cache(maxsize=4096)
+def action_schema(legal):
+    # JSON schema for the turn with legal card ids `legal` (a tuple). Shared between calls: do not mutate.
+    colored = [str(card) for card in legal if CARD_COLOR[card] != BLACK]
+    wild = [str(card) for card in legal if CARD_COLOR[card] == BLACK]
+    variants = [_variant("DRAW_CARD", {"type": "null"}, {"type": "null"})]
+    if colored:
+        variants.append(_variant("PLAY_CARD", {"enum": colored}, {"type": "null"}))
+    if wild:
+        variants.append(_variant("PLAY_CARD", {"enum": wild}, {"enum": list(COLORS)}))
+    return {"anyOf": variants}
+
+class InvalidAction(ValueError):
+    """An LLM answer that is not a legal action; `field` names the first part that is wrong."""
+
+    def __init__(self, field, message):
+        super().__init__(message)
+        self.field = field
+
+class AIAction:
+    """A checked move: the card id to play (None to draw), the declared color code, the UNO call and the banter."""
+
+    __slots__ = ("card", "declared_color", "call_uno", "banter")
+
+    def __init__(self, card=None, declared_color=None, call_uno=False, banter=None):
+        self.card = card
+        self.declared_color = declared_color # Color code for a wild; None lets apply pick one
+        self.call_uno = call_uno
+        self.banter = banter
+
+    @property
+    def action_type(self):
+        return "DRAW_CARD" if self.card is None else "PLAY_CARD"
+
+    @classmethod
+    def from_move(cls, move):
+        # From an in-process move dict (heuristic, Monte Carlo, decision cache), which is legal by construction
+        card = move.get("card_guid_to_play") if move.get("action_type") == "PLAY_CARD" else None
+        return cls(card, COLOR_CODES.get(move.get("declared_color")), bool(move.get("call_uno", False)), move.get("banter"))
+
+    def __repr__(self):
+        if self.card is None:
+            return f"AIAction(draw, banter={self.banter!r})"
+        color = f", declared {COLORS[self.declared_color]}" if self.declared_color is not None else ""
+        return f"AIAction(play {CARD_LABEL[self.card]}{color}, call_uno={self.call_uno}, banter={self.banter!r})"
+
+class ActionValidator:
+    """Checks an LLM answer against the turn's legal moves and maps it to an AIAction.
+
+    The lookup tables are built once, so an answer costs its json.loads plus a few dict lookups.
+    """
+
+    def __init__(self):
+        guids = {str(card): card for card in range(len(CARD_LABEL))}
+        guids.update({card: card for card in range(len(CARD_LABEL))}) # Models sometimes drop the quotes
+        self._guids = guids
+        self._colors = {name: COLOR_CODES[name] for name in COLORS} # Not "black", which is a card color only
+        self._colors[None] = None
+
+    def parse(self, content, legal):
+        # The whole answer text; json.JSONDecodeError for text that is not JSON
+        fields = json.loads(content)
+        if not isinstance(fields, dict):
+            raise InvalidAction("action_type", f"Expected a JSON object, got {type(fields).__name__}")
+        return self.check(fields, legal)
+
+    def check(self, fields, legal):
+        # Decoded fields (a streamed answer may not have its banter yet); `legal` is the turn's legal card ids
+        action_type = fields.get("action_type")
+        if action_type == "DRAW_CARD":
+            card = None
+        elif action_type == "PLAY_CARD":
+            guid = fields.get("card_guid_to_play")
+            card = self._guids.get(guid) if not isinstance(guid, bool) and isinstance(guid, (str, int)) else None
+            if card is None or card not in legal:
+                raise InvalidAction("card_guid_to_play", f"{guid!r} is not one of the legal moves")
+        else:
+            raise InvalidAction("action_type", f"Unknown action_type {action_type!r}")
+
+        declared_color = None
+        if card is not None and CARD_COLOR[card] == BLACK: # Any other move ignores the color
+            name = fields.get("declared_color")
+            if not isinstance(name, (str, type(None))) or name not in self._colors:
+                raise InvalidAction("declared_color", f"Unknown color {name!r}")
+            declared_color = self._colors[name]
+        banter = fields.get("banter")
+        return AIAction(card, declared_color, fields.get("call_uno") is True, banter if isinstance(banter, str) else None)
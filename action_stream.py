@@ -0,0 +1,74 @@
+# Incremental parser for a streamed LLM action.
+# Ollama streams the JSON action a few characters at a time. The parser picks out each top-level
+# field as soon as its value is complete, so the move can be applied before the banter (which
+# the prompt asks for last) has finished generating.
+
+import json
+import re
+
+# Everything apply_ai_decision needs; the prompt asks for these before the banter
+ACTION_FIELDS = ("action_type", "card_guid_to_play", "declared_color", "call_uno")
+_FIELD_PATTERNS = {key: re.compile(r'"%s"\s*:\s*' % key) for key in ACTION_FIELDS + ("banter",)}
+_DECODER = json.JSONDecoder()
+
+def _complete_value(text, key):
+    # Returns (True, value) once the value for `key` is fully in `text`, else (False, None)
+    match = _FIELD_PATTERNS[key].search(text)
+    if match is None:
+        return False, None
+    try:
+        value, end = _DECODER.raw_decode(text, match.end())
+    except json.JSONDecodeError:
+        return False, None
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and end == len(text):
+        return False, None # "12" could still become "123"
+    return True, value
+
+class ActionStreamParser:
+    """Accumulates streamed content and exposes the action fields parsed so far."""
+
+    def __init__(self):
+        self.text = ""
+        self.fields = {}
+
+    def feed(self, content):
+        self.text += content
+        for key in ACTION_FIELDS:
+            if key not in self.fields:
+                done, value = _complete_value(self.text, key)
+                if done:
+                    self.fields[key] = value
+
+    @property
+    def action_ready(self):
+        # A draw needs nothing else; a play needs its card, color and UNO call. A model that skips
+        # a field has moved on to the banter by the time it starts it.
+        if self.fields.get("action_type") == "DRAW_CARD":
+            return True
+        if all(key in self.fields for key in ACTION_FIELDS):
+            return True
+        return "action_type" in self.fields and _FIELD_PATTERNS["banter"].search(self.text) is not None
+
+    def banter(self):
+        # The banter text generated so far (possibly mid-word), or None before it starts
+        match = _FIELD_PATTERNS["banter"].search(self.text)
+        if match is None or match.end() >= len(self.text) or self.text[match.end()] != '"':
+            return None
+        done, value = _complete_value(self.text, "banter")
+        if done:
+            return value if isinstance(value, str) else None
+        partial = self.text[match.end() + 1:]
+        for trim in range(min(6, len(partial)) + 1): # Drop a trailing, half-received escape sequence
+            try:
+                return json.loads(f'"{partial[:len(partial) - trim]}"')
+            except json.JSONDecodeError:
+                continue
+        return None
+
+    def action(self):
+        # LLM-style action dict from the fields parsed so far
+        return {"action_type": self.fields.get("action_type"),
+                "card_guid_to_play": self.fields.get("card_guid_to_play"),
+                "declared_color": self.fields.get("declared_color"),
+                "call_uno": bool(self.fields.get("call_uno", False)),
+                "banter": self.banter()}
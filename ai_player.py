@@ -0,0 +1,721 @@
+# AI player for the UNO server.
+# An AI turn runs in three phases: prepare (penalty draw + prompt) and apply (play or draw)
+# run under the game lock, while the LLM round-trip in between runs without it. When the
+# response is streamed, the move is applied as soon as its fields arrive and the banter follows.
+# Each phase is timed as a span; a finished turn publishes its spans to /metrics and the log.
+
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+import metrics
+import montecarlo
+from action_schema import ActionValidator, AIAction, InvalidAction, action_schema
+from action_stream import ActionStreamParser
+from cards import BLACK, CARD_COLOR, CARD_LABEL, COLOR_NAMES, COLORS, HandIndex, is_valid_play
+from decision_cache import DecisionCache, canonical_key
+from heuristic import choose_move
+from llm_client import OllamaClient
+from llm_pool import LLMPool, load_config
+from llm_transport import make_transport
+
+logger = logging.getLogger(__name__)
+
+# --- Ollama Configuration ---
+OLLAMA_API_ENDPOINT = "http://localhost:11434/api/chat" # Or your actual Ollama endpoint; UNO_LLM_BACKENDS(_FILE) sets a pool instead (see llm_pool)
+OLLAMA_MODEL = "gemma3:4b" # Using a smaller model for potentially faster responses initially
+OLLAMA_REQUEST_TIMEOUT = 60 # seconds, per HTTP attempt
+OLLAMA_MAX_CONCURRENT_REQUESTS = 4 # In-flight /api/chat calls per process; extra turns queue for a slot
+OLLAMA_MAX_RETRIES = 2 # Retries after connection errors, timeouts, 429 and 5xx
+OLLAMA_RETRY_BACKOFF = 0.25 # seconds, doubled per retry (with jitter)
+OLLAMA_BATCH_SIZE = 0 # Send calls from all games in batches of up to this many (match OLLAMA_NUM_PARALLEL); 0 sends each call on its own
+OLLAMA_BATCH_WINDOW_MS = 5 # A batch that is not full goes out this long after its first call, if the backend has room
+
+OLLAMA_STRUCTURED_OUTPUT = True # Send the action's JSON schema (legal guids only) as "format"; False sends "json". Needs Ollama 0.5+
+OLLAMA_STREAM = True # Stream the response: the move is applied before the banter has finished generating
+OLLAMA_KEEP_ALIVE = "30m" # How long Ollama keeps the model (and its prompt cache) loaded after a call
+OLLAMA_OPTIONS = {
+    "num_ctx": 2048, # Context window; the prompt is well under 1k tokens
+    "num_predict": 192, # Cap on generated tokens; a full action with banter needs about 80
+}
+
+# --- LLM Transport Configuration (see llm_transport) ---
+LLM_TRANSPORT = os.environ.get("UNO_LLM_TRANSPORT", "live") # "live", "record" (live, logged to the corpus), "replay" or "synthetic"
+LLM_CORPUS = os.environ.get("UNO_LLM_CORPUS", "llm-corpus.jsonl.gz") # Written by record, read by replay
+LLM_REPLAY_LATENCY = "original" # "original": replay the recorded latencies; "zero": answer at once
+LLM_SYNTHETIC_LATENCY_MS = 300 # Mean synthetic latency
+LLM_SYNTHETIC_DISTRIBUTION = "lognormal" # "fixed", "exponential" or "lognormal"
+LLM_SYNTHETIC_RATE = 0 # Calls per second the synthetic backend starts; 0 for no limit
+LLM_SYNTHETIC_ERROR_RATE = 0.0 # Share of synthetic calls that fail like a backend error
+LLM_SYNTHETIC_SLIP_RATE = 0.0 # Share of synthetic answers that break the rules when OLLAMA_STRUCTURED_OUTPUT is off
+
+# --- AI Strategy Configuration ---
+AI_PLAYER_MODE = "llm" # "llm": ask the model; "heuristic": rule-based moves only, no LLM (load testing)
+AI_LLM_LATENCY_BUDGET_MS = 60000 # Max time an AI turn waits on the LLM (queueing and retries included)
+AI_HEURISTIC_FALLBACK = True # Play the heuristic move when the LLM is late, fails or picks an illegal move
+
+# --- Monte Carlo Evaluator Configuration ---
+AI_MONTE_CARLO_MODE = "off" # "hint": add simulated win chances to the LLM prompt; "drive": play the best-ranked move, no LLM
+AI_MONTE_CARLO_BUDGET_MS = 50 # CPU time per turn spent on rollouts (checked between batches of 256 samples)
+AI_MONTE_CARLO_HORIZON = 12 # Turns played out after each candidate move
+
+# --- Decision Cache Configuration ---
+AI_DECISION_CACHE_ENABLED = True # Reuse earlier LLM decisions for identical (canonical) game states
+AI_DECISION_CACHE_SIZE = 4096 # entries
+AI_DECISION_CACHE_TTL = 600 # seconds
+AI_DECISION_CACHE_BANTER = True # False: cached moves get a stock line instead of replaying old banter
+
+# --- Background Turn Configuration ---
+AI_TURN_WORKERS = 8 # Max AI turns in flight per process
+
+# --- Speculation Configuration ---
+AI_SPECULATION_ENABLED = True # Start the AI's decision after each human action, before end_turn arrives
+AI_SPECULATION_MAX_IN_FLIGHT = 2 # Speculative decisions at once per process; actions beyond this are not speculated on
+
+# Shared by every game so connections are pooled and kept alive between turns. With a backend pool
+# configured, each backend gets its own client with these options.
+llm_client_options = dict(max_concurrent=OLLAMA_MAX_CONCURRENT_REQUESTS, request_timeout=OLLAMA_REQUEST_TIMEOUT,
+                          max_retries=OLLAMA_MAX_RETRIES, retry_backoff=OLLAMA_RETRY_BACKOFF,
+                          latency_budget=AI_LLM_LATENCY_BUDGET_MS / 1000.0,
+                          batch_window=OLLAMA_BATCH_WINDOW_MS / 1000.0, batch_size=OLLAMA_BATCH_SIZE)
+llm_backends = load_config()
+if llm_backends:
+    llm_client = LLMPool.from_config(llm_backends, OLLAMA_MODEL, **llm_client_options)
+else:
+    llm_client = OllamaClient(OLLAMA_API_ENDPOINT, **llm_client_options)
+llm_client = make_transport(LLM_TRANSPORT, llm_client, LLM_CORPUS, LLM_REPLAY_LATENCY,
+                            latency=LLM_SYNTHETIC_LATENCY_MS / 1000.0, distribution=LLM_SYNTHETIC_DISTRIBUTION,
+                            rate=LLM_SYNTHETIC_RATE, error_rate=LLM_SYNTHETIC_ERROR_RATE, slip_rate=LLM_SYNTHETIC_SLIP_RATE)
+action_validator = ActionValidator()
+decision_cache = DecisionCache(AI_DECISION_CACHE_SIZE, AI_DECISION_CACHE_TTL, AI_DECISION_CACHE_BANTER)
+if AI_MONTE_CARLO_MODE != "off" and not montecarlo.AVAILABLE:
+    logger.warning("AI_MONTE_CARLO_MODE is %r but NumPy is not installed; the evaluator is disabled.", AI_MONTE_CARLO_MODE)
+
+# --- Metrics ---
+# Phases: penalty_draw, prompt_build, monte_carlo, llm_http, json_parse, move_apply. In a streamed turn llm_http
+# spans the whole stream, so it also contains the incremental json_parse and the early move_apply.
+AI_TURN_SECONDS = metrics.histogram("uno_ai_turn_seconds", "Whole AI turns, from prepare to the last banter update.")
+AI_TURN_PHASE_SECONDS = metrics.histogram("uno_ai_turn_phase_seconds", "Time spent in each phase of an AI turn.", ("phase",))
+AI_DECISIONS = metrics.counter("uno_ai_decisions_total", "AI moves by where the decision came from.", ("source",))
+AI_FALLBACKS = metrics.counter("uno_ai_fallbacks_total", "AI turns where the LLM gave nothing usable, by reason.", ("reason",))
+AI_FALLBACK_DRAWS = metrics.counter("uno_ai_fallback_draws_total", "Fallback AI turns that ended in a draw instead of a play.")
+AI_ILLEGAL_MOVES = metrics.counter("uno_ai_illegal_moves_total", "LLM answers rejected by the action validator, by the field at fault.",
+                                   ("field",))
+AI_SPECULATIONS = metrics.counter("uno_ai_speculations_total",
+                                  "Speculative AI decisions: started, capped, hit, mismatch, superseded, failed or fallback.", ("outcome",))
+# Read from whatever decision_cache is current when /metrics is scraped
+metrics.callback("uno_decision_cache_hits_total", "Decision cache lookups that hit.", lambda: decision_cache.hits, "counter")
+metrics.callback("uno_decision_cache_misses_total", "Decision cache lookups that missed.", lambda: decision_cache.misses, "counter")
+metrics.callback("uno_decision_cache_evictions_total", "Decision cache entries dropped by size or TTL.", lambda: decision_cache.evictions, "counter")
+metrics.callback("uno_decision_cache_entries", "Decisions currently cached.", lambda: len(decision_cache))
+metrics.callback("uno_decision_cache_hit_ratio", "Hits over lookups since start.", lambda: decision_cache.stats()["hit_rate"])
+
+# Static rules and response format. Keep per-turn values out of it: any change here busts the
+# model's prompt cache for every game.
+AI_SYSTEM_PROMPT = """
+You are an AI player named 'Player2' in a game of UNO. It's your turn.
+Each message gives the current game state as JSON:
+- "legal_moves": the cards you can legally play, as guid: card
+- "hand_colors" and "hand_size": your hand by color and its total size
+- "discard_top_card" and "current_game_color": the card to match and the color in play
+- "opponent_card_count": how many cards your opponent (Player1) holds
+
+Choose one of the legal cards to play, or draw. Respond ONLY with a JSON object:
+{
+  "action_type": "PLAY_CARD" | "DRAW_CARD",
+  "card_guid_to_play": guid from legal_moves, or null when drawing,
+  "declared_color": "red" | "yellow" | "green" | "blue" | null (MUST be provided if playing a 'wild' or 'wildDrawFour'),
+  "call_uno": true | false (set to true if playing this card leaves you with 1 card),
+  "banter": "A short, witty remark about your move or the game."
+}
+Prefer cards that hurt your opponent or keep your strongest color; declare the color you hold most of.
+A message may end with simulated win chances for your moves; prefer the best one unless you have a good reason.
+"""
+
+# --- AI Turn Phases ---
+class AITurn:
+    """Carries one AI turn across its phases so the LLM call can run without the game lock."""
+
+    __slots__ = ("player_name", "original_banter_for_draw_action", "llm_payload", "llm_action", "banter",
+                 "hand", "top_card", "chosen_color", "legal_moves", "cache_key", "source",
+                 "committed", "banter_base", "cacheable", "played_card", "started", "spans",
+                 "seen_cards", "opponent_card_count", "game_id", "speculative")
+
+    def __init__(self, player_name, game_id=None):
+        self.player_name = player_name
+        self.game_id = game_id # Keeps the game on one LLM backend of a pool
+        self.original_banter_for_draw_action = "" # Store initial banter if AI has to draw first
+        self.llm_payload = None
+        self.llm_action = None
+        self.banter = ""
+        self.hand = [] # Snapshot of the AI hand, top card and color the decision is made for
+        self.top_card = None
+        self.chosen_color = None
+        self.legal_moves = None # Legal card ids, computed unless in heuristic mode
+        self.cache_key = None
+        self.source = "llm" # Where llm_action came from: "llm", "cache", "forced", "heuristic", "montecarlo" or "fallback"
+        self.committed = False # True once a streamed move has been applied ahead of its banter
+        self.banter_base = "" # Banter set by the early apply; the streamed remark is appended to it
+        self.cacheable = False # Set by apply when the LLM decision is worth caching
+        self.played_card = None
+        self.started = time.perf_counter()
+        self.spans = {} # phase -> seconds
+        self.seen_cards = None # Discard pile snapshot for the Monte Carlo evaluator; None when it is off
+        self.opponent_card_count = 0
+        self.speculative = False # Built ahead of the human's end_turn; its fallbacks are not counted
+
+def prepare_ai_turn(game):
+    # Phase 1 (caller holds game.lock): serve any penalty and build the LLM request
+    ai_player_name = game.current_player_name
+    if ai_player_name != "Player2": # Safety check
+        logger.error("AI turn started for %s", ai_player_name)
+        return None
+
+    logger.debug("AI (%s) is starting its turn.", ai_player_name)
+    turn = AITurn(ai_player_name, game.game_id)
+    game.ai_banter_stream = None # A new turn supersedes the previous turn's streaming banter
+
+    # 1. Handle any pending draw amount for the AI FIRST
+    if game.pending_draw_amount > 0:
+        with metrics.span(turn.spans, "penalty_draw"):
+            num_to_draw = game.pending_draw_amount
+            logger.debug("AI (%s) must draw %d cards due to pending_draw_amount.", ai_player_name, num_to_draw)
+            drawn_cards = game.draw_cards(ai_player_name, num_to_draw) # Reshuffles the discard pile if needed
+            if len(drawn_cards) < num_to_draw:
+                logger.warning("AI (%s) could only draw %d/%d - deck and discard pile exhausted.", ai_player_name, len(drawn_cards), num_to_draw)
+            drawn_cards_for_penalty_details = [CARD_LABEL[card] for card in drawn_cards]
+            turn.original_banter_for_draw_action = f"AI drew {len(drawn_cards_for_penalty_details)} card(s) due to a penalty: {', '.join(drawn_cards_for_penalty_details)}."
+            game.ai_last_banter = turn.original_banter_for_draw_action # Set this as the current banter
+            logger.info("%s", turn.original_banter_for_draw_action)
+            game.pending_draw_amount = 0 # Penalty served by AI
+            # Rule: If AI drew from a Wild Draw Four, its turn might end. For now, we let it proceed.
+
+    with metrics.span(turn.spans, "prompt_build"):
+        build_ai_prompt(game, turn, game.player_hands.get(ai_player_name, []))
+    return turn
+
+def speculative_ai_turn(game):
+    # The turn prepare_ai_turn would build if the human ended the turn now, without touching the
+    # game: penalty cards are read off the top of the draw pile. None if a reshuffle would make them random.
+    ai_player_name = "Player2"
+    penalty = game.pending_draw_amount
+    if penalty > len(game.draw_pile.cards):
+        return None
+    ai_hand = game.player_hands.get(ai_player_name, [])
+    if penalty:
+        ai_hand = ai_hand + game.draw_pile.cards[-penalty:] # The order draw_cards would add them in
+    turn = AITurn(ai_player_name, game.game_id)
+    turn.speculative = True
+    build_ai_prompt(game, turn, ai_hand)
+    return turn
+
+def build_ai_prompt(game, turn, ai_hand):
+    # Snapshots the AI hand and, unless the move is forced or heuristic, builds the LLM request
+    # 2. Gather Game State for LLM
+    hand_index = HandIndex(ai_hand)
+
+    other_player_name = "Player1"
+    other_player_card_count = len(game.player_hands.get(other_player_name, []))
+
+    turn.hand = list(ai_hand)
+    turn.top_card = game.discard_pile_top_card
+    turn.chosen_color = game.current_chosen_color
+    if AI_PLAYER_MODE == "heuristic":
+        return # No prompt needed
+
+    turn.legal_moves = hand_index.legal_moves(game.discard_pile_top_card, game.current_chosen_color)
+    if len(turn.legal_moves) <= 1:
+        return # Forced move; the LLM is skipped
+
+    if AI_MONTE_CARLO_MODE != "off" and montecarlo.AVAILABLE:
+        turn.seen_cards = list(game.draw_pile.discard) # The rollouts run later, without the lock
+        turn.opponent_card_count = other_player_card_count
+
+    if AI_DECISION_CACHE_ENABLED:
+        turn.cache_key = canonical_key(ai_hand, game.discard_pile_top_card, game.current_chosen_color, other_player_card_count)
+
+    # Determine current valid color for LLM (especially if top card is wild)
+    effective_game_color = COLOR_NAMES[game.current_chosen_color] if game.current_chosen_color is not None else None
+    if game.discard_pile_top_card is not None and CARD_COLOR[game.discard_pile_top_card] == BLACK and game.current_chosen_color is None:
+        # This state should ideally not happen if a wild is played and color is chosen.
+        # If it does, default to a color or have LLM pick one if it plays another wild.
+        logger.warning("Top card is wild but no current_chosen_color. AI might need to re-declare if playing a non-wild.")
+        effective_game_color = "any" # Or prompt LLM to be careful
+
+    # Only the legal candidates are sent (guid -> card); the rest of the hand is summarised by color
+    legal_moves_for_prompt = {str(card): CARD_LABEL[card] for card in turn.legal_moves}
+    hand_colors_for_prompt = {color: hand_index.color_count(code) for code, color in enumerate(COLORS)}
+    hand_colors_for_prompt["wild"] = hand_index.color_count(BLACK)
+
+    game_state_for_llm = {
+        "legal_moves": legal_moves_for_prompt,
+        "hand_colors": hand_colors_for_prompt,
+        "hand_size": len(ai_hand),
+        "discard_top_card": CARD_LABEL[game.discard_pile_top_card],
+        "current_game_color": effective_game_color,
+        "opponent_card_count": other_player_card_count,
+    }
+
+    # 3. Construct LLM Prompt
+    # The system prompt is a constant, so every request shares it as a byte-identical prefix that
+    # Ollama keeps in its KV cache; only the trailing user message changes between turns.
+    turn.llm_payload = {
+        "model": OLLAMA_MODEL,
+        "messages": [
+            {"role": "system", "content": AI_SYSTEM_PROMPT},
+            {"role": "user", "content": f"Current game state for your decision: {json.dumps(game_state_for_llm, separators=(',', ':'))}. What is your action in the specified JSON format?"}
+        ],
+        "format": action_schema(tuple(turn.legal_moves)) if OLLAMA_STRUCTURED_OUTPUT else "json",
+        "stream": OLLAMA_STREAM,
+        "keep_alive": OLLAMA_KEEP_ALIVE,
+        "options": OLLAMA_OPTIONS,
+    }
+
+def request_ai_decision(turn, on_action=None, on_banter=None):
+    # Phase 2 (no lock held): the slow LLM round-trip; fills in turn.llm_action and turn.banter.
+    # With a streamed response and on_action given, on_action(turn) is called as soon as the move
+    # is known and sets turn.committed; on_banter(turn, remark) then follows the banter as it grows.
+    ai_player_name = turn.player_name
+    original_banter_for_draw_action = turn.original_banter_for_draw_action
+    llm_action = None
+    action_str_for_error_logging = ""
+
+    if turn.llm_payload is None: # Heuristic mode, or zero/one legal move so there is nothing to decide
+        turn.llm_action = AIAction.from_move(choose_move(turn.hand, turn.top_card, turn.chosen_color, legal=turn.legal_moves))
+        turn.source = "heuristic" if turn.legal_moves is None else "forced"
+        turn.banter = f"{original_banter_for_draw_action} {turn.llm_action.banter}".strip() if original_banter_for_draw_action else turn.llm_action.banter
+        return
+
+    if turn.seen_cards is not None and AI_MONTE_CARLO_MODE == "drive":
+        turn.llm_action = AIAction.from_move(evaluate_ai_moves(turn).to_action(turn.hand))
+        turn.source = "montecarlo"
+        turn.banter = f"{original_banter_for_draw_action} {turn.llm_action.banter}".strip() if original_banter_for_draw_action else turn.llm_action.banter
+        return
+
+    if turn.cache_key is not None:
+        cached = decision_cache.get(turn.cache_key)
+        move = cached.to_action(turn.hand, stock_banter="Been here before...") if cached else None
+        if move is not None:
+            llm_action = AIAction.from_move(move)
+            new_banter = llm_action.banter
+            turn.banter = f"{original_banter_for_draw_action} {new_banter}".strip() if original_banter_for_draw_action else new_banter
+            turn.llm_action = llm_action
+            turn.source = "cache"
+            logger.debug("AI (%s) reused cached decision: %s", ai_player_name, llm_action)
+            return
+
+    if turn.seen_cards is not None: # Hint mode: the ranking goes at the end of the user message
+        user_message = turn.llm_payload["messages"][-1]
+        turn.llm_payload["messages"][-1] = dict(user_message, content=user_message["content"] + evaluate_ai_moves(turn).prompt_hint())
+
+    try:
+        logger.debug("AI (%s) sending prompt to Ollama (%s)...", ai_player_name, OLLAMA_MODEL)
+        if turn.llm_payload.get("stream"):
+            result = stream_ai_decision(turn, on_action, on_banter)
+            if turn.committed:
+                return
+        else:
+            with metrics.span(turn.spans, "llm_http"):
+                result = llm_client.chat(turn.llm_payload, latency_budget=AI_LLM_LATENCY_BUDGET_MS / 1000.0,
+                                         affinity=turn.game_id)
+        logger.debug("AI (%s) got LLM response in %.0f ms (queued %.0f ms, %d attempt(s)).",
+                     ai_player_name, result.elapsed * 1000, result.queue_wait * 1000, result.attempts)
+
+        response_data = result.data
+        # Assuming Ollama with format:"json" directly puts the JSON string in message.content
+        action_str_for_error_logging = response_data.get("message", {}).get("content", "")
+        if not action_str_for_error_logging: # Fallback for different Ollama structures
+             action_str_for_error_logging = response_data.get("response", "") # Common for /api/generate
+
+        if action_str_for_error_logging:
+            with metrics.span(turn.spans, "json_parse"):
+                llm_action = action_validator.parse(action_str_for_error_logging, turn.legal_moves)
+            # Combine banters if AI drew penalty cards earlier
+            new_banter = llm_action.banter or "AI is focused..."
+            llm_action.banter = new_banter
+            turn.banter = f"{original_banter_for_draw_action} {new_banter}".strip() if original_banter_for_draw_action else new_banter
+            logger.debug("AI (%s) received action from LLM: %s", ai_player_name, llm_action)
+        else:
+            raise ValueError("LLM response content is empty or not in expected structure.")
+
+    except requests.exceptions.RequestException as e:
+        logger.warning("Error calling Ollama API: %s", e)
+        llm_action = fallback_move(turn, "AI had trouble thinking", "llm_error")
+    except json.JSONDecodeError as e:
+        logger.warning("Error parsing LLM JSON response: %s. Response text: '%s'", e, action_str_for_error_logging)
+        llm_action = fallback_move(turn, "AI's thoughts were jumbled", "bad_json")
+    except InvalidAction as e:
+        logger.warning("AI (%s) answered with an illegal move: %s. Response text: '%s'", ai_player_name, e, action_str_for_error_logging)
+        AI_ILLEGAL_MOVES.inc(field=e.field)
+        llm_action = fallback_move(turn, "AI tried to bend the rules", "illegal_move")
+    except Exception as e:
+        logger.exception("An unexpected error occurred during LLM interaction: %s", e)
+        llm_action = fallback_move(turn, "AI encountered an unexpected glitch", "unexpected_error")
+
+    turn.llm_action = llm_action
+
+def evaluate_ai_moves(turn):
+    # Monte Carlo ranking of the turn's legal moves, within the per-turn CPU budget
+    with metrics.span(turn.spans, "monte_carlo"):
+        evaluation = montecarlo.evaluate_moves(turn.hand, turn.legal_moves, turn.top_card, turn.chosen_color,
+                                               turn.seen_cards, turn.opponent_card_count,
+                                               budget=AI_MONTE_CARLO_BUDGET_MS / 1000.0, horizon=AI_MONTE_CARLO_HORIZON,
+                                               seed=random.getrandbits(64)) # From `random`, so seeded simulator runs repeat
+    logger.debug("AI (%s) Monte Carlo ranking from %d samples in %.1f ms CPU: %s", turn.player_name,
+                 evaluation.samples, evaluation.cpu_time * 1000, evaluation.ranking)
+    return evaluation
+
+def stream_ai_decision(turn, on_action, on_banter):
+    # Streams the LLM response, committing the move early through on_action when one is given.
+    # Returns the LLMCallResult, or None if the stream failed after the move was committed.
+    parser = ActionStreamParser()
+    remark = None
+    rejected = False # The early fields failed validation; the whole answer is then judged once it is in
+
+    def on_chunk(chunk):
+        nonlocal remark, rejected
+        with metrics.span(turn.spans, "json_parse"):
+            parser.feed(chunk.get("message", {}).get("content", ""))
+        if on_action is None:
+            return
+        if not turn.committed and not rejected and parser.action_ready:
+            try:
+                turn.llm_action = action_validator.check(parser.fields, turn.legal_moves)
+            except InvalidAction:
+                rejected = True
+                return
+            turn.banter = turn.original_banter_for_draw_action # The remark is streamed in on top
+            turn.committed = True
+            logger.debug("AI (%s) committing streamed move: %s", turn.player_name, turn.llm_action)
+            on_action(turn)
+        if turn.committed and on_banter is not None:
+            new_remark = parser.banter()
+            if new_remark and new_remark != remark:
+                remark = new_remark
+                on_banter(turn, remark)
+
+    try:
+        with metrics.span(turn.spans, "llm_http"):
+            result = llm_client.chat_stream(turn.llm_payload, on_chunk, latency_budget=AI_LLM_LATENCY_BUDGET_MS / 1000.0,
+                                            affinity=turn.game_id)
+    except Exception as e:
+        if not turn.committed:
+            raise
+        logger.warning("AI (%s) banter stream ended early: %s", turn.player_name, e)
+        return None
+    if turn.committed:
+        turn.llm_action.banter = parser.banter()
+        logger.debug("AI (%s) finished streaming in %.0f ms.", turn.player_name, result.elapsed * 1000)
+    return result
+
+def fallback_move(turn, reason, kind):
+    # Heuristic move (or None, meaning draw) when the LLM gave nothing usable; sets the banter to match.
+    # `kind` labels the fallback in the uno_ai_fallbacks_total metric, which counts real turns only:
+    # a speculative fallback is never adopted (the real turn asks the LLM again).
+    if not turn.speculative:
+        AI_FALLBACKS.inc(reason=kind)
+    turn.source = "fallback"
+    if AI_HEURISTIC_FALLBACK:
+        action = AIAction.from_move(choose_move(turn.hand, turn.top_card, turn.chosen_color, legal=turn.legal_moves))
+        banter = f"{reason}, so it plays on instinct ..."
+    else:
+        action = None
+        banter = f"{reason}... will draw a card."
+    original_banter_for_draw_action = turn.original_banter_for_draw_action
+    turn.banter = f"{original_banter_for_draw_action} {banter}".strip() if original_banter_for_draw_action else banter
+    return action
+
+def apply_ai_decision(game, turn):
+    # Phase 3 (caller holds game.lock): play or draw according to the decision
+    ai_player_name = turn.player_name
+    original_banter_for_draw_action = turn.original_banter_for_draw_action
+    llm_action = turn.llm_action
+    ai_hand = game.player_hands.get(ai_player_name, [])
+    game.ai_last_banter = turn.banter
+    top_before_play, color_before_play = game.discard_pile_top_card, game.current_chosen_color
+
+    # The action was checked against the turn's hand snapshot; only a hand that has changed since can miss
+    if AI_HEURISTIC_FALLBACK and llm_action and llm_action.card is not None and llm_action.card not in ai_hand:
+        logger.warning("AI (%s) tried to play card GUID %s, but it's not in its hand. Using heuristic move.",
+                       ai_player_name, llm_action.card)
+        llm_action = fallback_move(turn, "AI seems to have misplaced a card", "misplaced_card")
+        game.ai_last_banter = turn.banter
+
+    # 5. Execute AI's Chosen Action
+    if llm_action and llm_action.card is not None:
+        played_card = llm_action.card if llm_action.card in ai_hand else None
+
+        if played_card is not None:
+            logger.info("AI (%s) plays: %s (GUID: %s)", ai_player_name, CARD_LABEL[played_card], played_card)
+            if is_valid_play(played_card, top_before_play, color_before_play):
+                turn.cacheable, turn.played_card = True, played_card
+
+            chosen_color = None
+            if CARD_COLOR[played_card] == BLACK:
+                if llm_action.declared_color is not None:
+                    chosen_color = llm_action.declared_color
+                    logger.info("AI (%s) declared color: %s", ai_player_name, COLORS[chosen_color])
+                    game.ai_last_banter = game.ai_last_banter.replace("...", f"and chose {COLORS[chosen_color]}.") # Update banter
+                else:
+                    chosen_color = random.randrange(len(COLORS)) # Default if LLM fails
+                    logger.warning("AI (%s) failed to declare a valid color or none provided, defaulting to %s",
+                                   ai_player_name, COLORS[chosen_color])
+                    game.ai_last_banter = game.ai_last_banter.replace("...", f"defaulting to {COLORS[chosen_color]}.")
+            game.play_card(ai_player_name, played_card, chosen_color)
+
+            if llm_action.call_uno and len(game.player_hands[ai_player_name]) == 1:
+                logger.info("AI (%s) calls UNO!", ai_player_name)
+                game.ai_last_banter += " UNO!"
+
+            if len(game.player_hands[ai_player_name]) == 0:
+                logger.info("AI (%s) has won!", ai_player_name)
+                game.game_winner = ai_player_name
+                game.ai_last_banter += " And that's the game! I win!"
+        else:
+            logger.warning("AI (%s) tried to play card GUID %s, but it's not in its hand. Defaulting to draw.",
+                           ai_player_name, llm_action.card)
+            AI_FALLBACKS.inc(reason="misplaced_card")
+            turn.source = "fallback"
+            llm_action = AIAction()
+            game.ai_last_banter = f"{original_banter_for_draw_action} AI seems to have misplaced a card... draws instead.".strip() if original_banter_for_draw_action else "AI seems to have misplaced a card... draws instead."
+
+
+    if not llm_action or llm_action.card is None:
+        if turn.source == "fallback":
+            AI_FALLBACK_DRAWS.inc()
+        elif llm_action is turn.llm_action: # The model chose to draw
+            turn.cacheable, turn.played_card = True, None
+        if not game.game_winner: # Don't draw if AI already won
+            logger.debug("AI (%s) chooses to draw a card (or defaulted to it).", ai_player_name)
+            drawn_cards = game.draw_cards(ai_player_name, 1) # Reshuffles the discard pile if needed
+            drawn_card = drawn_cards[0] if drawn_cards else None
+            # Ensure banter isn't overwritten if it was set due to error/penalty draw
+            fell_back = turn.source == "fallback"
+            penalty_told = "drew" in game.ai_last_banter.lower()
+            if drawn_card is not None:
+                logger.info("AI (%s) drew: %s", ai_player_name, CARD_LABEL[drawn_card])
+                if not penalty_told and not fell_back:
+                    game.ai_last_banter = f"{original_banter_for_draw_action} AI draws a card ({CARD_LABEL[drawn_card]}).".strip() if original_banter_for_draw_action else f"AI draws a card ({CARD_LABEL[drawn_card]})."
+                elif not original_banter_for_draw_action and fell_back:
+                    # If error banter was set, append draw info
+                    game.ai_last_banter += f" So, AI draws {CARD_LABEL[drawn_card]}."
+            else:
+                logger.info("AI (%s) has no cards to draw, deck is empty.", ai_player_name)
+                if not penalty_told:
+                    game.ai_last_banter = f"{original_banter_for_draw_action} AI has no cards to draw, deck is empty.".strip() if original_banter_for_draw_action else "AI has no cards to draw, deck is empty."
+
+    game.record_event(("decision", ai_player_name, turn.source)) # Kept in the journal for auditing; replay skips it
+    if not turn.committed: # A streamed decision is cached once its banter is complete
+        remember_decision(turn)
+    logger.debug("AI (%s) turn ended. Final Banter: '%s'", ai_player_name, game.ai_last_banter)
+
+def stream_banter(game, turn, remark):
+    # Called for each banter update after an early commit; takes the lock itself
+    with game.lock:
+        if game.ai_banter_stream is turn:
+            game.ai_last_banter = f"{turn.banter_base} {remark}".strip()
+            game.mark_changed()
+
+def finish_streamed_turn(game, turn):
+    # Phase 3 for a committed stream (caller holds game.lock): settle the banter and cache the decision
+    if game.ai_banter_stream is turn:
+        remark = turn.llm_action.banter
+        if remark:
+            game.ai_last_banter = f"{turn.banter_base} {remark}".strip()
+        game.ai_banter_stream = None
+        game.mark_changed()
+    remember_decision(turn)
+
+def remember_decision(turn):
+    # Stores a fresh, usable LLM decision under the turn's canonical state
+    if turn.cache_key is None or turn.source != "llm" or not turn.llm_action or not turn.cacheable:
+        return
+    action = turn.llm_action
+    declared_color = COLORS[action.declared_color] if action.declared_color is not None else None
+    decision_cache.put(turn.cache_key, action.action_type, turn.played_card, declared_color, action.call_uno, action.banter)
+
+def record_ai_turn(game, turn):
+    # Publishes a finished turn's spans to the metrics and logs them as one key=value line
+    elapsed = time.perf_counter() - turn.started
+    AI_TURN_SECONDS.observe(elapsed)
+    AI_DECISIONS.inc(source=turn.source)
+    for phase, seconds in turn.spans.items():
+        AI_TURN_PHASE_SECONDS.observe(seconds, phase=phase)
+    if logger.isEnabledFor(logging.INFO):
+        phases = " ".join(f"{phase}_ms={seconds * 1000:.2f}" for phase, seconds in turn.spans.items())
+        logger.info("ai_turn game=%s source=%s total_ms=%.2f %s", game.game_id, turn.source, elapsed * 1000, phases)
+
+def execute_ai_turn(game):
+    # Runs a whole AI turn synchronously; caller must hold game.lock
+    turn = prepare_ai_turn(game)
+    if turn is None:
+        return
+    request_ai_decision(turn)
+    with metrics.span(turn.spans, "move_apply"):
+        apply_ai_decision(game, turn)
+    record_ai_turn(game, turn)
+
+# --- Background AI Turns ---
+class Speculation:
+    """An AI decision started for the state the AI expects to see when the human ends the turn."""
+
+    __slots__ = ("key", "turn", "future", "cancelled")
+
+    def __init__(self, key, turn):
+        self.key = key # The LLM user message; the real turn must produce exactly the same one
+        self.turn = turn
+        self.future = None
+        self.cancelled = False # Set when superseded or mismatched; the result is then dropped
+
+def speculation_key(turn):
+    return turn.llm_payload["messages"][-1]["content"]
+
+class AITurnRunner:
+    """Runs AI turns on a bounded thread pool so HTTP handlers never wait on the LLM.
+
+    After each human action it can also start the AI's decision speculatively, on a separate
+    pool capped at max_speculative, so a matching end_turn finds the LLM answer already done.
+    """
+
+    def __init__(self, max_workers=AI_TURN_WORKERS, max_speculative=AI_SPECULATION_MAX_IN_FLIGHT):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ai-turn")
+        # One worker per slot, so a speculation never queues behind another and always starts at once
+        self._speculation_executor = (ThreadPoolExecutor(max_workers=max_speculative, thread_name_prefix="ai-speculate")
+                                      if max_speculative > 0 else None)
+        self._speculation_slots = threading.BoundedSemaphore(max(1, max_speculative))
+
+    def speculate(self, game):
+        # Caller holds game.lock, right after a human action. Starts the decision the AI would make
+        # if the human ended the turn now; the game's previous speculation is superseded.
+        self.cancel_speculation(game, "superseded")
+        if not AI_SPECULATION_ENABLED or AI_PLAYER_MODE == "heuristic" or self._speculation_executor is None:
+            return
+        if game.game_winner or game.awaiting_color_choice or game.ai_turn_pending:
+            return
+        if game.players[(game.current_player_index + game.play_direction) % len(game.players)] != "Player2":
+            return
+        turn = speculative_ai_turn(game)
+        if turn is None or turn.llm_payload is None: # Forced or heuristic moves are instant anyway
+            return
+        if not self._speculation_slots.acquire(blocking=False):
+            AI_SPECULATIONS.inc(outcome="capped")
+            return
+        speculation = Speculation(speculation_key(turn), turn)
+        speculation.future = self._speculation_executor.submit(self._run_speculation, speculation)
+        game.ai_speculation = speculation
+        AI_SPECULATIONS.inc(outcome="started")
+
+    def cancel_speculation(self, game, outcome):
+        # Caller holds game.lock. An LLM call already in flight runs to completion (and keeps its
+        # slot until then), but its result is never used.
+        speculation, game.ai_speculation = game.ai_speculation, None
+        if speculation is not None:
+            speculation.cancelled = True
+            AI_SPECULATIONS.inc(outcome=outcome)
+
+    def _run_speculation(self, speculation):
+        try:
+            if not speculation.cancelled:
+                request_ai_decision(speculation.turn)
+        finally:
+            self._speculation_slots.release()
+
+    def _claim_speculation(self, game, turn):
+        # Caller holds game.lock. Returns the game's speculation if it was made for exactly this turn.
+        speculation = game.ai_speculation
+        if speculation is None:
+            return None
+        if turn is None or turn.llm_payload is None or speculation_key(turn) != speculation.key:
+            self.cancel_speculation(game, "mismatch")
+            return None
+        game.ai_speculation = None
+        return speculation
+
+    def _use_speculation(self, turn, speculation):
+        # Waits for a matching speculation (it may still be in flight) and adopts its decision
+        with metrics.span(turn.spans, "speculation_wait"):
+            try:
+                speculation.future.result()
+            except Exception:
+                logger.exception("Speculative AI decision failed")
+                AI_SPECULATIONS.inc(outcome="failed")
+                return False
+        decided = speculation.turn
+        if decided.source == "fallback": # The LLM failed or timed out; the real turn gets its own try
+            AI_SPECULATIONS.inc(outcome="fallback")
+            return False
+        turn.llm_action, turn.source = decided.llm_action, decided.source
+        original_banter_for_draw_action = turn.original_banter_for_draw_action # The real penalty, drawn by prepare
+        turn.banter = f"{original_banter_for_draw_action} {decided.banter}".strip() if original_banter_for_draw_action else decided.banter
+        AI_SPECULATIONS.inc(outcome="hit")
+        logger.debug("AI (%s) using speculative decision: %s", turn.player_name, turn.llm_action)
+        return True
+
+    def start_turn(self, game):
+        # Caller holds game.lock and has already advanced the turn to the AI player.
+        # Human actions are rejected while ai_turn_pending is set.
+        game.ai_turn_pending = True
+        return self._executor.submit(self._run_turn, game)
+
+    def _run_turn(self, game):
+        turn = None
+        ended = False
+        try:
+            with game.lock:
+                turn = prepare_ai_turn(game)
+                speculation = self._claim_speculation(game, turn)
+                game.mark_changed() # Penalty cards drawn
+            if turn is not None:
+                if speculation is None or not self._use_speculation(turn, speculation):
+                    request_ai_decision(turn, on_action=functools.partial(self._commit_early, game),
+                                        on_banter=functools.partial(stream_banter, game))
+                with game.lock:
+                    if turn.committed:
+                        finish_streamed_turn(game, turn)
+                    else:
+                        with metrics.span(turn.spans, "move_apply"):
+                            apply_ai_decision(game, turn)
+                        # In the same lock hold: the move is journaled before anyone (a snapshot
+                        # included) can see it
+                        self._end_turn(game, turn)
+                        ended = True
+                record_ai_turn(game, turn)
+        except Exception:
+            logger.exception("AI turn for game %s failed", game.game_id)
+        finally:
+            if not ended and (turn is None or not turn.committed):
+                with game.lock:
+                    self._end_turn(game, turn)
+
+    def _commit_early(self, game, turn):
+        # The streamed move is known: apply it and hand the turn back while the banter streams on
+        with game.lock:
+            try:
+                with metrics.span(turn.spans, "move_apply"):
+                    apply_ai_decision(game, turn)
+                turn.banter_base = game.ai_last_banter
+                game.ai_banter_stream = turn
+            finally:
+                self._end_turn(game, turn)
+
+    def _end_turn(self, game, turn):
+        # Caller holds game.lock
+        if turn is not None:
+            # After AI's turn, advance turn to the next player (Player1)
+            game.advance_turn()
+            logger.debug("AI (%s) turn finished. Next player is now: %s", turn.player_name, game.current_player_name)
+        game.ai_turn_pending = False
+        game.mark_changed()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        if self._speculation_executor is not None:
+            self._speculation_executor.shutdown(wait=wait)
+
@@ -0,0 +1,1158 @@
+# Offline benchmarks for the UNO server.
+# Usage:
+#   python bench.py loadtest [--games 1 2 4 8 16] [--duration 3] [--think-ms 0] [--ai-mode heuristic]
+#   python bench.py shard [--workers 1 2 4] [--games 32] [--duration 5] [--clients N]
+#   python bench.py cards
+#   python bench.py prompt [--games 200] [--seed 1]
+#   python bench.py ttft [--games 50] [--seed 1] [--prefill-us-per-char 100]
+#   python bench.py stream [--games 20] [--seed 1] [--token-ms 20]
+#   python bench.py delta [--games 20] [--seed 1]
+#   python bench.py speculate [--games 3] [--seed 1] [--llm-latency-ms 200] [--think-ms 100]
+#   python bench.py pool [--games 8] [--duration 5] [--think-ms 50]
+#   python bench.py persist [--games 2000] [--moves 50000] [--threads 16]
+#   python bench.py soak [--games 1000000] [--max-resident 5000] [--idle-ttl 1] [--moves 6] [--spill]
+#   python bench.py batch [--games 8] [--duration 5] [--batch-ms 200] [--parallel 4] [--think-ms 100] [--windows 0 5 20]
+#   python bench.py transport [--games 30] [--seed 1] [--llm-latency-ms 20]
+#   python bench.py schema [--games 200] [--seed 1] [--slip-rate 0.1]
+#   python bench.py suite [--out bench-results.json] [--iterations 500] [--llm-latency-ms 50]
+#   python bench.py compare BASE.json NEW.json [--threshold 0.1]
+
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import timeit
+import tracemalloc
+
+import requests
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+import ai_player
+import app as uno_app
+import cards
+from fake_ollama import FakeOllamaServer
+from game_engine import GameEngine
+from heuristic import choose_move
+from llm_client import LLMCallResult, OllamaClient
+from llm_pool import LLMPool
+from llm_transport import RecordingTransport, ReplayTransport, SyntheticTransport
+from persistence import SYNC_MODES, GameSpill, GameStore, encode_game
+from simulate import play_game, take_turn
+from stub_moves import first_legal_move
+
+# --- Helpers ---
+@contextlib.contextmanager
+def quiet():
+    # The server logs every action; keep it (and its formatting cost) out of the benchmark
+    logging.disable(logging.CRITICAL)
+    try:
+        yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+@contextlib.contextmanager
+def running_server(host="127.0.0.1", port=0):
+    server = make_server(host, port, uno_app.app, threaded=True, request_handler=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_port}"
+    finally:
+        server.shutdown()
+        thread.join()
+
+# --- Load Test: concurrent games ---
+def play_loop(base_url, deadline, think_s, counter, counter_lock):
+    # One client owning one game: poll state, draw, end turn (AI replies), repeat
+    session = requests.Session()
+    game_id = session.post(f"{base_url}/api/games").json()["game_id"]
+    game_url = f"{base_url}/api/games/{game_id}"
+    done = 0
+    while time.perf_counter() < deadline:
+        state = session.get(f"{game_url}/gamestate").json()
+        if state.get("game_winner"):
+            game_id = session.post(f"{base_url}/api/games").json()["game_id"]
+            game_url = f"{base_url}/api/games/{game_id}"
+            done += 1
+            continue
+        if state.get("ai_turn_pending"):
+            done += 1
+            continue
+        session.post(f"{game_url}/draw_card")
+        session.post(f"{game_url}/end_turn")
+        done += 3
+        if think_s:
+            time.sleep(think_s)
+    with counter_lock:
+        counter[0] += done
+
+def loadtest(game_counts, duration, think_ms):
+    print(f"{'games':>6} {'requests':>9} {'req/s':>9}")
+    with quiet(), running_server() as base_url:
+        results = []
+        for n_games in game_counts:
+            counter, counter_lock = [0], threading.Lock()
+            deadline = time.perf_counter() + duration
+            threads = [threading.Thread(target=play_loop, args=(base_url, deadline, think_ms / 1000.0, counter, counter_lock))
+                       for _ in range(n_games)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            elapsed = time.perf_counter() - start
+            results.append((n_games, counter[0], counter[0] / elapsed))
+    for n_games, total, rate in results:
+        print(f"{n_games:>6} {total:>9} {rate:>9.1f}")
+    return results
+
+# --- Sharded Serving ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def shard_clients(base_url, n_games, duration, think_s):
+    # One client process: n_games play_loop threads; returns the requests they made
+    counter, counter_lock = [0], threading.Lock()
+    deadline = time.perf_counter() + duration
+    threads = [threading.Thread(target=play_loop, args=(base_url, deadline, think_s, counter, counter_lock))
+               for _ in range(n_games)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return counter[0]
+
+def bench_shard(worker_counts, n_games, duration, think_ms, client_processes):
+    # Request throughput of serve.py (heuristic AI) by worker count, driven from several client
+    # processes so the load generator is not held back by one GIL
+    print(f"{'workers':>8} {'requests':>9} {'req/s':>9} {'speedup':>8}")
+    serve_py = os.path.join(os.path.dirname(os.path.abspath(__file__)), "serve.py")
+    per_process = [n_games // client_processes + (i < n_games % client_processes) for i in range(client_processes)]
+    results = []
+    for workers in worker_counts:
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        server = subprocess.Popen([sys.executable, serve_py, "--port", str(port), "--workers", str(workers), "--ai-mode", "heuristic"],
+                                  env=dict(os.environ, UNO_LOG_LEVEL="WARNING"), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            for _ in range(100):
+                try:
+                    requests.get(f"{base_url}/metrics", timeout=1)
+                    break
+                except requests.exceptions.ConnectionError:
+                    time.sleep(0.1)
+            time.sleep(0.5) # The other workers may still be importing
+            start = time.perf_counter()
+            with multiprocessing.Pool(client_processes) as pool:
+                total = sum(pool.starmap(shard_clients, [(base_url, n, duration, think_ms / 1000.0) for n in per_process if n]))
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        results.append((workers, total, total / elapsed))
+    for workers, total, rate in results:
+        print(f"{workers:>8} {total:>9} {rate:>9.1f} {rate / results[0][2]:>7.2f}x")
+    return results
+
+# --- Card Micro-benchmarks ---
+def best_of(fn, number, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+def bench_cards():
+    deck = cards.create_deck()
+    pairs = [(random.choice(deck), random.choice(deck)) for _ in range(1000)]
+    chosen = random.randrange(len(cards.COLORS))
+
+    def valid_batch():
+        for played, top in pairs:
+            cards.is_valid_play(played, top, chosen)
+
+    with quiet():
+        results = {
+            "create_deck_us": best_of(cards.create_deck, 1000) * 1e6,
+            "shuffle_deck_us": best_of(lambda: cards.shuffle_deck(deck), 1000) * 1e6,
+            "is_valid_play_ns": best_of(valid_batch, 100) / len(pairs) * 1e9,
+        }
+    tracemalloc.start()
+    decks = [cards.create_deck() for _ in range(100)]
+    results["deck_bytes"] = tracemalloc.get_traced_memory()[0] / len(decks)
+    tracemalloc.stop()
+    for name, value in results.items():
+        print(f"{name:>20} {value:>10.1f}")
+    return results
+
+# --- Prompt Size Corpus ---
+def human_action(client, game_url, state):
+    # Simulated human: play the first card the server accepts, otherwise draw
+    for card in state["player_hand"]:
+        body = {"color": card["color"], "value": card["value"], "chosen_color": random.choice(cards.COLORS)}
+        if client.post(f"{game_url}/play_card", json=body).status_code == 200:
+            return
+    client.post(f"{game_url}/draw_card")
+
+def play_human_turn(client, game_url, state):
+    human_action(client, game_url, state)
+    client.post(f"{game_url}/end_turn")
+
+def wait_for_ai(client, game_url):
+    while True:
+        state = client.get(f"{game_url}/gamestate").get_json()
+        if not state["ai_turn_pending"]:
+            return state
+        time.sleep(0.0005)
+
+def play_games(n_games, max_turns=200, turn_times=None):
+    # Plays n_games one after another through the Flask test client; returns the number of AI turns.
+    # turn_times, if given, collects the seconds from each human move until the AI's move is in.
+    client = uno_app.app.test_client()
+    ai_turns = 0
+    for _ in range(n_games):
+        game_url = f"/api/games/{client.post('/api/games').get_json()['game_id']}"
+        state = wait_for_ai(client, game_url)
+        for _ in range(max_turns):
+            if state["game_winner"]:
+                break
+            start = time.perf_counter()
+            play_human_turn(client, game_url, state)
+            ai_turns += 1
+            state = wait_for_ai(client, game_url)
+            if turn_times is not None:
+                turn_times.append(time.perf_counter() - start)
+    return ai_turns
+
+def bench_prompt(n_games, seed, max_turns=200):
+    # Plays simulated games and records every payload the AI would send to the LLM.
+    # Tokens are estimated as characters / 4.
+    random.seed(seed)
+    sent = []
+    def recording_chat(payload, latency_budget=None, affinity=None):
+        sent.append(sum(len(message["content"]) for message in payload["messages"]))
+        content = json.dumps(first_legal_move(payload))
+        return LLMCallResult({"message": {"content": content}}, 0.0, 0.0, 1)
+
+    saved = (ai_player.llm_client.chat, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+             ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED)
+    ai_player.llm_client.chat = recording_chat
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM = "llm", False, False
+    ai_player.AI_SPECULATION_ENABLED = False # One call per turn, as the corpus assumes
+    try:
+        with quiet():
+            ai_turns = play_games(n_games, max_turns)
+    finally:
+        (ai_player.llm_client.chat, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+         ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED) = saved
+
+    results = {
+        "ai_turns": ai_turns,
+        "llm_calls": len(sent),
+        "llm_calls_per_turn": len(sent) / ai_turns if ai_turns else 0.0,
+        "avg_prompt_tokens": sum(sent) / len(sent) / 4 if sent else 0.0,
+        "prompt_tokens_per_turn": sum(sent) / ai_turns / 4 if ai_turns else 0.0,
+    }
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.2f}")
+    return results
+
+# --- Time To First Token ---
+def bench_ttft(n_games, seed, prefill_per_char, max_turns=200):
+    # Plays simulated games against the fake Ollama with its prompt-cache model switched on, so a
+    # call only pays prefill for the prompt suffix that differs from the previous call. With
+    # generation cost at zero, the client-side latency of a call is its time to first token.
+    random.seed(seed)
+    ttfts, uncached = [], []
+    original_chat = ai_player.llm_client.chat
+    def timed_chat(payload, latency_budget=None, affinity=None):
+        result = original_chat(payload, latency_budget)
+        ttfts.append(result.elapsed)
+        uncached.append(result.data.get("prompt_eval_count", 0))
+        return result
+
+    saved = (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+             ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM = "llm", False, False
+    ai_player.AI_SPECULATION_ENABLED = False
+    ai_player.llm_client.chat = timed_chat
+    try:
+        with FakeOllamaServer(prefill_per_char=prefill_per_char, seed=seed) as stub, quiet():
+            ai_player.llm_client.endpoint = stub.url
+            play_games(n_games, max_turns)
+    finally:
+        del ai_player.llm_client.chat # Back to the class method
+        (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+         ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED) = saved
+
+    ttfts.sort()
+    n = len(ttfts)
+    results = {
+        "llm_calls": n,
+        "ttft_mean_ms": sum(ttfts) / n * 1000 if n else 0.0,
+        "ttft_p50_ms": ttfts[n // 2] * 1000 if n else 0.0,
+        "ttft_p95_ms": ttfts[int(n * 0.95)] * 1000 if n else 0.0,
+        "uncached_prompt_tokens": sum(uncached) / n / 4 if n else 0.0,
+    }
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.2f}")
+    return results
+
+# --- Streaming ---
+def bench_stream(n_games, seed, token_latency, max_turns=200):
+    # AI move latency with and without streaming, against a fake Ollama that generates one
+    # 4-character chunk per token_latency. Each mode replays the same seeded games.
+    saved = (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+             ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED = "llm", False
+    ai_player.AI_SPECULATION_ENABLED = False # The human ends its turn at once; measure the stream alone
+    results = {}
+    try:
+        for stream in (False, True):
+            random.seed(seed)
+            ai_player.OLLAMA_STREAM = stream
+            turn_times = []
+            with FakeOllamaServer(token_latency=token_latency, seed=seed) as stub, quiet():
+                ai_player.llm_client.endpoint = stub.url
+                play_games(n_games, max_turns, turn_times)
+            turn_times.sort()
+            n = len(turn_times)
+            mode = "stream" if stream else "blocking"
+            results[f"{mode}_turn_mean_ms"] = sum(turn_times) / n * 1000 if n else 0.0
+            results[f"{mode}_turn_p95_ms"] = turn_times[int(n * 0.95)] * 1000 if n else 0.0
+    finally:
+        (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+         ai_player.OLLAMA_STREAM, ai_player.AI_SPECULATION_ENABLED) = saved
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.2f}")
+    return results
+
+# --- Speculation ---
+SPECULATION_OUTCOMES = ("started", "capped", "hit", "mismatch", "superseded", "failed", "fallback")
+
+def bench_speculate(n_games, seed, llm_latency, think_s, max_turns=20):
+    # Time from end_turn until the AI's move is in, when the human pauses think_s between its
+    # play/draw and end_turn, with speculation off and on. Both modes replay the same seeded games.
+    saved = (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+             ai_player.AI_SPECULATION_ENABLED)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED = "llm", False
+    results = {}
+    try:
+        for enabled in (False, True):
+            random.seed(seed)
+            ai_player.AI_SPECULATION_ENABLED = enabled
+            before = {outcome: ai_player.AI_SPECULATIONS.value(outcome=outcome) for outcome in SPECULATION_OUTCOMES}
+            client = uno_app.app.test_client()
+            turn_times = []
+            with FakeOllamaServer(latency=llm_latency, seed=seed) as stub, quiet():
+                ai_player.llm_client.endpoint = stub.url
+                for _ in range(n_games):
+                    game_url = f"/api/games/{client.post('/api/games').get_json()['game_id']}"
+                    state = wait_for_ai(client, game_url)
+                    for _ in range(max_turns):
+                        if state["game_winner"]:
+                            break
+                        human_action(client, game_url, state)
+                        time.sleep(think_s)
+                        start = time.perf_counter()
+                        client.post(f"{game_url}/end_turn")
+                        state = wait_for_ai(client, game_url)
+                        turn_times.append(time.perf_counter() - start)
+                llm_calls = stub.calls
+            turn_times.sort()
+            n = len(turn_times)
+            mode = "speculate" if enabled else "baseline"
+            results[f"{mode}_turn_mean_ms"] = sum(turn_times) / n * 1000 if n else 0.0
+            results[f"{mode}_turn_p95_ms"] = turn_times[int(n * 0.95)] * 1000 if n else 0.0
+            results[f"{mode}_llm_calls_per_turn"] = llm_calls / n if n else 0.0
+            if enabled:
+                for outcome in SPECULATION_OUTCOMES:
+                    results[f"speculation_{outcome}"] = ai_player.AI_SPECULATIONS.value(outcome=outcome) - before[outcome]
+    finally:
+        (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED,
+         ai_player.AI_SPECULATION_ENABLED) = saved
+    for name, value in results.items():
+        print(f"{name:>28} {value:>10.2f}")
+    return results
+
+# --- Cross-game Batching ---
+def batch_caller(client, deadline, think_s, rng, results, results_lock):
+    # One game's AI: think, then ask the LLM; repeat until the deadline
+    payload = {"model": "stub", "stream": False, "messages": [{"role": "user", "content": "{}"}]}
+    while True:
+        time.sleep(rng.expovariate(1.0 / think_s) if think_s else 0.0)
+        if time.perf_counter() >= deadline:
+            return
+        result = client.chat(payload)
+        with results_lock:
+            results.append((result.elapsed, result.queue_wait))
+
+def bench_batch(n_games, duration, batch_latency, parallel, think_s, windows, seed=1):
+    # LLM call latency and backend batch fill with n_games games asking concurrently, against a
+    # stub that runs up to `parallel` requests per batch_latency: unbatched, then batched with each window
+    results = {}
+    configs = [("unbatched", None, 0.0)] + [(f"window_{window * 1000:g}ms", parallel, window) for window in windows]
+    for prefix, batch_size, window in configs:
+        results_list, results_lock = [], threading.Lock()
+        client = OllamaClient("", max_concurrent=parallel, batch_window=window, batch_size=batch_size)
+        with FakeOllamaServer(batch_latency=batch_latency, parallel=parallel) as stub:
+            client.endpoint = stub.url
+            deadline = time.perf_counter() + duration
+            threads = [threading.Thread(target=batch_caller, args=(client, deadline, think_s, random.Random(seed + i),
+                                                                   results_list, results_lock))
+                       for i in range(n_games)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            batches, batched = stub.batches, stub.batched_requests
+        client.close()
+        elapsed = sorted(e for e, _ in results_list)
+        n = len(elapsed)
+        results[f"{prefix}_calls_per_sec"] = n / duration
+        results[f"{prefix}_call_mean_ms"] = sum(elapsed) / n * 1000 if n else 0.0
+        results[f"{prefix}_call_p95_ms"] = elapsed[int(n * 0.95)] * 1000 if n else 0.0
+        results[f"{prefix}_queue_wait_mean_ms"] = sum(q for _, q in results_list) / n * 1000 if n else 0.0
+        results[f"{prefix}_inference_mean_ms"] = sum(e - q for e, q in results_list) / n * 1000 if n else 0.0
+        results[f"{prefix}_backend_batch_fill"] = batched / batches if batches else 0.0
+    for name, value in results.items():
+        print(f"{name:>36} {value:>10.2f}")
+    return results
+
+# --- Backend Pool ---
+# (model name, latency seconds, failure rate) of each stub backend; the pool also gets one dead URL
+POOL_STUBS = [("fast", 0.05, 0.0), ("slow", 0.25, 0.0), ("flaky", 0.08, 0.3)]
+DEAD_BACKEND = "http://127.0.0.1:9/api/chat"
+
+def pool_caller(client, model, game_id, deadline, think_s, rng, calls, calls_lock):
+    payload = {"model": model, "stream": False, "messages": [{"role": "user", "content": "{}"}]} # A pool swaps in each backend's model
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            result = client.chat(payload, latency_budget=2.0, affinity=game_id)
+            outcome = result.data.get("model")
+        except requests.exceptions.RequestException:
+            outcome = None
+        with calls_lock:
+            calls.append((game_id, outcome, time.perf_counter() - start))
+        time.sleep(rng.expovariate(1.0 / think_s) if think_s else 0.0)
+
+def bench_pool(n_games, duration, think_s, seed=1):
+    # n_games games calling the LLM concurrently, first through a plain client on the flaky backend
+    # (the single-endpoint setup), then through a pool of that backend, a fast one, a slow one and a dead URL
+    stubs = [FakeOllamaServer(latency=latency, failure_rate=failure_rate, seed=seed) for _, latency, failure_rate in POOL_STUBS]
+    for stub in stubs:
+        stub.start()
+    urls = {name: stub.url for (name, _, _), stub in zip(POOL_STUBS, stubs)}
+    configs = [
+        ("single_flaky", [{"url": urls["flaky"], "model": "flaky"}]),
+        ("pool", [{"url": url, "model": name} for name, url in urls.items()] + [{"url": DEAD_BACKEND, "model": "dead"}]),
+    ]
+    results = {}
+    try:
+        with quiet():
+            for prefix, backends in configs:
+                if len(backends) == 1:
+                    client = OllamaClient(backends[0]["url"], retry_backoff=0.05)
+                else:
+                    client = LLMPool(backends, health_interval=0.5, cooldown=1.0, retry_backoff=0.05)
+                calls, calls_lock = [], threading.Lock()
+                deadline = time.perf_counter() + duration
+                threads = [threading.Thread(target=pool_caller, args=(client, backends[0]["model"], f"game-{i}", deadline, think_s,
+                                                                      random.Random(seed + i), calls, calls_lock))
+                           for i in range(n_games)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                client.close()
+
+                latencies = sorted(elapsed for _, outcome, elapsed in calls if outcome)
+                n = len(calls)
+                results[f"{prefix}_calls_per_sec"] = n / duration
+                results[f"{prefix}_success_rate"] = len(latencies) / n if n else 0.0
+                results[f"{prefix}_call_mean_ms"] = sum(latencies) / len(latencies) * 1000 if latencies else 0.0
+                results[f"{prefix}_call_p95_ms"] = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+                for backend in backends:
+                    share = sum(1 for _, outcome, _ in calls if outcome == backend["model"])
+                    results[f"{prefix}_share_{backend['model']}"] = share / n if n else 0.0
+                # Affinity: the share of each game's successful calls that went to its most used backend
+                per_game = {}
+                for game_id, outcome, _ in calls:
+                    if outcome:
+                        per_game.setdefault(game_id, {}).setdefault(outcome, 0)
+                        per_game[game_id][outcome] += 1
+                home = sum(max(counts.values()) for counts in per_game.values())
+                results[f"{prefix}_affinity"] = home / len(latencies) if latencies else 0.0
+    finally:
+        for stub in stubs:
+            stub.stop()
+    for name, value in results.items():
+        print(f"{name:>28} {value:>10.3f}")
+    return results
+
+# --- Persistence ---
+def persist_worker(engine, n_games, n_moves, counts, counts_lock):
+    # Plays n_moves heuristic moves round-robin over n_games games of its own, replacing each
+    # finished game with a new one, the way with_game commits a human action
+    games = [engine.create_game() for _ in range(n_games)]
+    moves = 0
+    while moves < n_moves:
+        for i, game in enumerate(games):
+            if moves >= n_moves:
+                break
+            if game.game_winner is not None:
+                engine.remove_game(game.game_id)
+                games[i] = engine.create_game()
+                continue
+            with game.lock:
+                take_turn(game, game.current_player_name, choose_move)
+                game.advance_turn()
+                game.version += 1
+                ticket = game.journal_commit()
+            if ticket is not None:
+                game.journal.wait(ticket)
+            moves += 1
+    with counts_lock:
+        counts["moves"] += moves
+
+def persist_run(directory, sync, n_games, n_moves, n_threads):
+    # One write phase; returns (engine, store or None, moves, seconds). No store without a sync mode.
+    engine = GameEngine()
+    store = None
+    if sync is not None:
+        store = GameStore(directory, sync, snapshot_interval=3600, snapshot_records=10**9) # Snapshots only when asked
+        store.open(engine)
+    counts, counts_lock = {"moves": 0}, threading.Lock()
+    threads = [threading.Thread(target=persist_worker, args=(engine, n_games // n_threads, n_moves // n_threads, counts, counts_lock))
+               for _ in range(n_threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    if store is not None:
+        store.close()
+    return engine, store, counts["moves"], elapsed
+
+def persist_recover(directory, engine):
+    # Rebuilds the games in `directory`; returns (seconds, records replayed, games differing from engine's)
+    start = time.perf_counter()
+    games, replayed = GameStore(directory).recover()
+    elapsed = time.perf_counter() - start
+    live = {game.game_id: encode_game(game) for game in engine.games()}
+    mismatches = sum(1 for game_id, encoded in live.items() if game_id not in games or encode_game(games[game_id]) != encoded)
+    return elapsed, replayed, mismatches + len(games.keys() - live.keys())
+
+def bench_persist(n_games, n_moves, n_threads, seed=1):
+    # Write throughput of n_games live games without a store and with each sync mode, then recovery
+    # time of the "commit" log on its own and of a snapshot plus a tenth as many moves of log tail
+    results = {}
+    root = tempfile.mkdtemp(prefix="uno-persist-")
+    try:
+        with quiet():
+            for sync in (None,) + SYNC_MODES:
+                random.seed(seed)
+                prefix = sync or "memory"
+                directory = os.path.join(root, prefix)
+                engine, store, moves, elapsed = persist_run(directory, sync, n_games, n_moves, n_threads)
+                results[f"{prefix}_moves_per_sec"] = moves / elapsed
+                if store is None:
+                    continue
+                log_bytes = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+                results[f"{prefix}_records_per_flush"] = store.records / store.flushes if store.flushes else 0.0
+                results[f"{prefix}_bytes_per_record"] = log_bytes / store.records if store.records else 0.0
+                if sync != "commit":
+                    continue
+                seconds, replayed, mismatches = persist_recover(directory, engine)
+                results["recover_log_ms"] = seconds * 1000
+                results["recover_log_records"] = replayed
+                results["recover_log_mismatches"] = mismatches
+
+                # Restart on the same directory (which takes a snapshot), play a short tail, recover again
+                engine = GameEngine()
+                store = GameStore(directory, "none", snapshot_interval=3600, snapshot_records=10**9)
+                store.open(engine)
+                for game in engine.games()[:n_moves // 10]: # One move each in as many games
+                    with game.lock:
+                        if game.game_winner is None:
+                            take_turn(game, game.current_player_name, choose_move)
+                            game.advance_turn()
+                            game.version += 1
+                            game.journal_commit()
+                store.close()
+                seconds, replayed, mismatches = persist_recover(directory, engine)
+                results["recover_snapshot_ms"] = seconds * 1000
+                results["recover_snapshot_records"] = replayed
+                results["recover_snapshot_mismatches"] = mismatches
+                results["games"] = len(engine)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    for name, value in results.items():
+        print(f"{name:>30} {value:>10.3f}" if isinstance(value, float) else f"{name:>30} {value:>10}")
+    return results
+
+# --- Memory Soak ---
+def rss_bytes():
+    # Current resident set size; the peak where /proc is missing
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+def bench_soak(n_games, max_resident, idle_ttl, moves, report_every, spill=False, seed=1):
+    # Creates n_games games one after another, plays a few moves and renders the state of each, and
+    # sweeps every report_every games; RSS should level off once the cap and the TTLs kick in
+    random.seed(seed)
+    spill_dir = tempfile.mkdtemp(prefix="uno-spill-") if spill else None
+    engine = GameEngine(idle_ttl, idle_ttl / 2, max_resident, GameSpill(spill_dir) if spill else None)
+    print(f"{'games':>9} {'resident':>9} {'spilled':>8} {'rss_mb':>8} {'games_mb':>9} {'games/s':>9}")
+    rows = []
+    try:
+        with quiet():
+            start = last = time.perf_counter()
+            for i in range(1, n_games + 1):
+                game = engine.create_game()
+                with game.lock:
+                    for _ in range(moves):
+                        if game.game_winner is not None:
+                            break
+                        take_turn(game, game.current_player_name, choose_move)
+                        game.advance_turn()
+                        game.mark_changed()
+                        game.state_json("Player1")
+                if i % report_every == 0:
+                    engine.sweep()
+                    now = time.perf_counter()
+                    row = (i, len(engine), len(engine.spill) if spill else 0, rss_bytes() / 2**20,
+                           engine.memory_footprint()[0] / 2**20, report_every / (now - last))
+                    last = now
+                    rows.append(row)
+                    print(f"{row[0]:>9} {row[1]:>9} {row[2]:>8} {row[3]:>8.1f} {row[4]:>9.1f} {row[5]:>9.0f}", flush=True)
+            elapsed = time.perf_counter() - start
+    finally:
+        if spill_dir:
+            shutil.rmtree(spill_dir, ignore_errors=True)
+    # Growth over the second half of the run, once the registry is full
+    half = rows[len(rows) // 2]
+    print(f"{n_games} games in {elapsed:.0f} s; RSS {half[3]:.1f} MB at {half[0]} games, {rows[-1][3]:.1f} MB at the end")
+    return rows
+
+# --- LLM Transport ---
+class TimedClient:
+    # Keeps the elapsed time of every chat() call of the client it wraps
+    def __init__(self, client):
+        self.client = client
+        self.latencies = []
+
+    def chat(self, payload, latency_budget=None, affinity=None):
+        result = self.client.chat(payload, latency_budget, affinity)
+        self.latencies.append(result.elapsed)
+        return result
+
+def transport_games(client, seeds, max_turns=300):
+    # Heuristic vs AI games (simulate.play_game) with `client` as the AI's LLM; returns (calls, calls/s, mean ms)
+    timed = ai_player.llm_client = TimedClient(client)
+    start = time.perf_counter()
+    for seed in seeds:
+        play_game(seed, ["heuristic", "ai"], max_turns)
+    elapsed = time.perf_counter() - start
+    n = len(timed.latencies)
+    return n, n / elapsed, sum(timed.latencies) / n * 1000 if n else 0.0
+
+def bench_transport(n_games, seed, llm_latency):
+    # Records the AI's calls against a fake Ollama, then plays the same games (and new ones) from
+    # the corpus with recorded and with zero latency, and against the synthetic transport
+    seeds = [seed * 1000 + i for i in range(n_games)]
+    other_seeds = [seed * 1000 + n_games + i for i in range(n_games)]
+    corpus = os.path.join(tempfile.mkdtemp(prefix="uno-corpus-"), "corpus.jsonl.gz")
+    saved = (ai_player.llm_client, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM = "llm", False, False
+    rows = []
+    try:
+        with quiet():
+            with FakeOllamaServer(latency=llm_latency, seed=seed) as stub:
+                recorder = RecordingTransport(OllamaClient(stub.url), corpus)
+                rows.append(("record (live stub)", *transport_games(recorder, seeds), None))
+                recorder.close()
+            for label, latency, games in (("replay, original latency", "original", seeds),
+                                          ("replay, zero latency", "zero", seeds),
+                                          ("replay, zero, new games", "zero", other_seeds)):
+                replay = ReplayTransport(corpus, latency)
+                rows.append((label, *transport_games(replay, games), replay.matches))
+            for label, latency in (("synthetic, zero latency", 0.0), (f"synthetic, {llm_latency * 1000:.0f} ms lognormal", llm_latency)):
+                rows.append((label, *transport_games(SyntheticTransport(latency, "lognormal", seed=seed), seeds), None))
+    finally:
+        ai_player.llm_client, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM = saved
+    size = os.path.getsize(corpus)
+    shutil.rmtree(os.path.dirname(corpus), ignore_errors=True)
+    print(f"{'transport':<28} {'calls':>7} {'calls/s':>9} {'mean_ms':>8}  matches")
+    for label, calls, rate, mean_ms, matches in rows:
+        matched = " ".join(f"{name}={count}" for name, count in matches.items()) if matches else ""
+        print(f"{label:<28} {calls:>7} {rate:>9.1f} {mean_ms:>8.2f}  {matched}")
+    print(f"corpus: {rows[0][1]} calls in {size} bytes ({size / max(1, rows[0][1]):.0f} B/call gzipped)")
+    return rows
+
+def bench_schema(n_games, seed, slip_rate):
+    # Illegal answers, fallbacks and fallback draws per LLM call, with "format": "json" and with the
+    # action schema, against a synthetic model that slips on `slip_rate` of its unconstrained answers.
+    # Also times the answer parse: json.loads alone and the validator's parse-and-map.
+    seeds = [seed * 1000 + i for i in range(n_games)]
+    saved = (ai_player.llm_client, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM,
+             ai_player.OLLAMA_STRUCTURED_OUTPUT, ai_player.AI_HEURISTIC_FALLBACK)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM = "llm", False, False
+    rows = []
+    try:
+        with quiet():
+            for structured in (False, True):
+                for heuristic_fallback in (True, False):
+                    ai_player.OLLAMA_STRUCTURED_OUTPUT, ai_player.AI_HEURISTIC_FALLBACK = structured, heuristic_fallback
+                    illegal_before = {field: ai_player.AI_ILLEGAL_MOVES.value(field=field)
+                                      for field in ("action_type", "card_guid_to_play", "declared_color")}
+                    fallbacks_before = ai_player.AI_DECISIONS.value(source="fallback")
+                    draws_before = ai_player.AI_FALLBACK_DRAWS.value()
+                    timed = ai_player.llm_client = TimedClient(SyntheticTransport(0.0, "fixed", seed=seed, slip_rate=slip_rate))
+                    wins = sum(play_game(s, ["heuristic", "ai"], 300)[0] == "Player2" for s in seeds)
+                    illegal = {field: ai_player.AI_ILLEGAL_MOVES.value(field=field) - count for field, count in illegal_before.items()}
+                    rows.append(("schema" if structured else "json", "heuristic" if heuristic_fallback else "draw",
+                                 len(timed.latencies), illegal, ai_player.AI_DECISIONS.value(source="fallback") - fallbacks_before,
+                                 ai_player.AI_FALLBACK_DRAWS.value() - draws_before, wins))
+    finally:
+        (ai_player.llm_client, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED, ai_player.OLLAMA_STREAM,
+         ai_player.OLLAMA_STRUCTURED_OUTPUT, ai_player.AI_HEURISTIC_FALLBACK) = saved
+
+    print(f"{'format':<7} {'fallback':<10} {'calls':>6} {'illegal':>8} {'fallbacks':>10} {'fb_draws':>9} {'ai_wins':>8}  illegal by field")
+    for fmt, fallback, calls, illegal, fallbacks, draws, wins in rows:
+        n = max(1, calls)
+        by_field = " ".join(f"{field}={count}" for field, count in illegal.items() if count)
+        print(f"{fmt:<7} {fallback:<10} {calls:>6} {sum(illegal.values()) / n:>8.2%} {fallbacks / n:>10.2%} {draws / n:>9.2%} "
+              f"{wins / n_games:>8.1%}  {by_field}")
+
+    legal = [3, 27, 52, 100]
+    content = json.dumps({"action_type": "PLAY_CARD", "card_guid_to_play": "100", "declared_color": "green",
+                          "call_uno": False, "banter": "Wild card, wild times. Green it is!"})
+    n = 100000
+    loads_us = timeit.timeit(lambda: json.loads(content), number=n) / n * 1e6
+    parse_us = timeit.timeit(lambda: ai_player.action_validator.parse(content, legal), number=n) / n * 1e6
+    schema_bytes = len(json.dumps(ai_player.action_schema(tuple(legal)), separators=(",", ":")))
+    print(f"parse: json.loads {loads_us:.2f} us, validator parse-and-map {parse_us:.2f} us; schema for 4 legal moves: {schema_bytes} B")
+    return rows
+
+# --- Delta Responses ---
+def apply_delta(state, delta):
+    # Python mirror of applyActionState() in static/sketch.js
+    removed = set(delta.get("hand_removed", []))
+    state["player_hand"] = [card for card in state["player_hand"] if card["guid"] not in removed]
+    state["player_hand"] += delta.get("hand_added", [])
+    state.update(delta.get("changed", {}))
+    state["state_version"] = delta["state_version"]
+
+def hoarding_game(client, use_deltas, max_turns):
+    # The human never plays: it draws every turn and serves every penalty, so its hand keeps
+    # growing until the AI wins. Returns (action response sizes, final hand size, resyncs).
+    # With deltas, the patched client state is checked against a full fetch after every draw.
+    sizes, resyncs = [], 0
+    game_url = f"/api/games/{client.post('/api/games').get_json()['game_id']}"
+    state = wait_for_ai(client, game_url)
+    local = dict(state)
+    for _ in range(max_turns):
+        if state["game_winner"]:
+            break
+        for action in ("draw_card", "end_turn"):
+            headers = {"X-State-Base": str(local["state_version"])} if use_deltas else {}
+            response = client.post(f"{game_url}/{action}", headers=headers)
+            sizes.append(len(response.data))
+            if not use_deltas:
+                continue
+            data = response.get_json()
+            if data.get("delta"):
+                apply_delta(local, data)
+            else:
+                resyncs += 1
+                local = {key: value for key, value in data.items() if key not in ("message", "turn_status", "resync")}
+            if action == "draw_card": # Still the human's turn, so nothing moves under us
+                assert local == client.get(f"{game_url}/gamestate").get_json(), "delta client diverged"
+        state = wait_for_ai(client, game_url)
+    return sizes, len(state["player_hand"]), resyncs
+
+def bench_delta(n_games, seed, max_turns=200):
+    # draw_card / end_turn response sizes with full-state and delta responses, over the same
+    # seeded games against the heuristic AI
+    saved = ai_player.AI_PLAYER_MODE
+    ai_player.AI_PLAYER_MODE = "heuristic"
+    client = uno_app.app.test_client()
+    results = {}
+    try:
+        for use_deltas in (False, True):
+            random.seed(seed)
+            sizes, hands, resyncs = [], [], 0
+            with quiet():
+                for _ in range(n_games):
+                    game_sizes, hand, game_resyncs = hoarding_game(client, use_deltas, max_turns)
+                    sizes += game_sizes
+                    hands.append(hand)
+                    resyncs += game_resyncs
+            mode = "delta" if use_deltas else "full"
+            results[f"{mode}_bytes_per_action"] = sum(sizes) / len(sizes)
+            results[f"{mode}_bytes_max"] = max(sizes)
+            if use_deltas:
+                results["delta_resyncs"] = resyncs
+        results["final_hand_mean"] = sum(hands) / len(hands)
+        results["final_hand_max"] = max(hands)
+    finally:
+        ai_player.AI_PLAYER_MODE = saved
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.1f}")
+    return results
+
+# --- Benchmark Suite ---
+# Engine micro-benchmarks, endpoint latencies through the Flask test client and the end-to-end
+# AI turn against a fake Ollama, written to one JSON file per run. Lower is better for every
+# metric except those ending in "_per_sec".
+
+def timed_calls(setup, call, n):
+    # Per-call latencies in seconds; setup() runs before each call, outside the timing
+    latencies = []
+    for _ in range(n):
+        setup()
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return latencies
+
+def latency_summary(prefix, latencies, scale=1e6, unit="us"):
+    n = len(latencies)
+    return {f"{prefix}_mean_{unit}": sum(latencies) / n * scale,
+            f"{prefix}_p50_{unit}": latencies[n // 2] * scale,
+            f"{prefix}_p95_{unit}": latencies[int(n * 0.95)] * scale}
+
+def card_id(color, value):
+    # Lowest card id with this face
+    kind = cards.kind_of(color, value)
+    return next(card for card in cards.CARD_IDS if cards.CARD_KIND[card] == kind)
+
+def bench_engine():
+    # Reshuffle of a full discard pile, and play_card's hand lookup for small and large hands
+    discard = cards.create_deck()
+    def reshuffle():
+        cards.DrawPile([], list(discard)).reshuffle()
+
+    deck = cards.create_deck()
+    results = {}
+    with quiet():
+        results["reshuffle_us"] = best_of(reshuffle, 1000) * 1e6
+    for size in (7, 40):
+        hand = deck[:size]
+        last = cards.card_to_json(hand[-1]) # Worst case: the face is found at the end of the hand
+        results[f"hand_lookup_{size}_ns"] = best_of(
+            lambda: uno_app.find_card_in_hand(hand, last["color"], last["value"]), 10000) * 1e9
+    for name, value in results.items():
+        print(f"{name:>20} {value:>10.1f}")
+    return results
+
+def bench_endpoints(iterations):
+    # Latency of each route through the test client. Before every call the table is put back to
+    # the same snapshot (untimed), so each call does the same work.
+    saved = ai_player.AI_PLAYER_MODE
+    ai_player.AI_PLAYER_MODE = "heuristic" # end_turn measures the route, not the LLM
+    client = uno_app.app.test_client()
+    results = {}
+    try:
+        with quiet():
+            game_id = client.post('/api/games').get_json()['game_id']
+            game_url = f"/api/games/{game_id}"
+            client.get(f"{game_url}/gamestate")
+            game = uno_app.game_engine.get_game(game_id)
+            with game.lock:
+                hand, ai_hand = list(game.player_hands["Player1"]), list(game.player_hands["Player2"])
+                pile = list(game.draw_pile.cards)
+            # Make hand[0] playable: a top card of its color (any card, if hand[0] is a wild)
+            play = cards.card_to_json(hand[0])
+            top = next(card for card in pile if cards.CARD_COLOR[hand[0]] in (cards.CARD_COLOR[card], cards.BLACK)
+                       and cards.CARD_COLOR[card] != cards.BLACK)
+            play_body = {"color": play["color"], "value": play["value"], "chosen_color": "red"}
+
+            def reset():
+                with game.lock:
+                    game.player_hands["Player1"], game.player_hands["Player2"] = list(hand), list(ai_hand)
+                    game.draw_pile = cards.DrawPile(list(pile), [top])
+                    game.discard_pile_top_card, game.current_chosen_color = top, cards.CARD_COLOR[top]
+                    game.current_player_index, game.pending_draw_amount = 0, 0
+                    game.awaiting_color_choice, game.game_winner = False, None
+                    game.mark_changed()
+
+            def wait_for_ai():
+                while game.ai_turn_pending:
+                    time.sleep(0.0001)
+
+            def checked(method, path, **kwargs):
+                def call():
+                    response = method(path, **kwargs)
+                    if response.status_code not in (200, 304):
+                        raise RuntimeError(f"{path} returned {response.status_code}: {response.get_data(as_text=True)}")
+                return call
+
+            results.update(latency_summary("gamestate", timed_calls(reset, checked(client.get, f"{game_url}/gamestate"), iterations)))
+            etag = client.get(f"{game_url}/gamestate").headers["ETag"]
+            results.update(latency_summary("gamestate_304", timed_calls(
+                lambda: None, checked(client.get, f"{game_url}/gamestate", headers={"If-None-Match": etag}), iterations)))
+            results.update(latency_summary("draw_card", timed_calls(reset, checked(client.post, f"{game_url}/draw_card"), iterations)))
+            results.update(latency_summary("play_card", timed_calls(
+                reset, checked(client.post, f"{game_url}/play_card", json=play_body), iterations)))
+            end_turn = checked(client.post, f"{game_url}/end_turn")
+            latencies = []
+            for _ in range(iterations):
+                reset()
+                start = time.perf_counter()
+                end_turn()
+                latencies.append(time.perf_counter() - start)
+                wait_for_ai() # The background AI turn is not part of the route's latency
+            latencies.sort()
+            results.update(latency_summary("end_turn", latencies))
+    finally:
+        ai_player.AI_PLAYER_MODE = saved
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.1f}")
+    return results
+
+def bench_ai_turn(iterations, llm_latency):
+    # end_turn until the AI's move is applied, with a real HTTP call to a fake Ollama that waits
+    # llm_latency per call. The AI hand always has several legal moves, so every turn asks the LLM.
+    saved = (ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED)
+    ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED = "llm", False
+    client = uno_app.app.test_client()
+    top = card_id("red", "5")
+    ai_hand = [card_id("red", "1"), card_id("red", "7"), card_id("blue", "5"), card_id("yellow", "2"), card_id("black", "wild")]
+    try:
+        with FakeOllamaServer(latency=llm_latency) as stub, quiet():
+            ai_player.llm_client.endpoint = stub.url
+            game_id = client.post('/api/games').get_json()['game_id']
+            game_url = f"/api/games/{game_id}"
+            client.get(f"{game_url}/gamestate")
+            game = uno_app.game_engine.get_game(game_id)
+            with game.lock:
+                hand, pile = list(game.player_hands["Player1"]), [card for card in game.draw_pile.cards
+                                                                 if card not in ai_hand and card != top]
+
+            def reset():
+                with game.lock:
+                    game.player_hands["Player1"], game.player_hands["Player2"] = list(hand), list(ai_hand)
+                    game.draw_pile = cards.DrawPile(list(pile), [top])
+                    game.discard_pile_top_card, game.current_chosen_color = top, cards.CARD_COLOR[top]
+                    game.current_player_index, game.pending_draw_amount = 0, 0
+                    game.awaiting_color_choice, game.game_winner = False, None
+                    game.mark_changed()
+
+            def ai_turn():
+                client.post(f"{game_url}/end_turn")
+                while game.ai_turn_pending:
+                    time.sleep(0.0001)
+
+            latencies = timed_calls(reset, ai_turn, iterations)
+            while game.ai_banter_stream is not None: # Let the last banter finish before the stub goes away
+                time.sleep(0.001)
+            calls = stub.calls
+    finally:
+        ai_player.llm_client.endpoint, ai_player.AI_PLAYER_MODE, ai_player.AI_DECISION_CACHE_ENABLED = saved
+    if calls < iterations:
+        raise RuntimeError(f"Only {calls} of {iterations} AI turns reached the fake Ollama")
+    results = latency_summary("ai_turn", latencies, scale=1e3, unit="ms")
+    results["ai_turn_overhead_ms"] = results["ai_turn_mean_ms"] - llm_latency * 1e3 # Everything but the model
+    for name, value in results.items():
+        print(f"{name:>24} {value:>10.2f}")
+    return results
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(out_path, iterations, llm_latency):
+    random.seed(1)
+    results = {}
+    print("-- cards"); results.update({f"cards.{k}": v for k, v in bench_cards().items()})
+    print("-- engine"); results.update({f"engine.{k}": v for k, v in bench_engine().items()})
+    print("-- endpoints"); results.update({f"endpoint.{k}": v for k, v in bench_endpoints(iterations).items()})
+    print("-- ai turn"); results.update({f"ai.{k}": v for k, v in bench_ai_turn(max(10, iterations // 10), llm_latency).items()})
+    report = {
+        "meta": {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+                 "python": sys.version.split()[0], "platform": platform.platform(),
+                 "iterations": iterations, "llm_latency_ms": llm_latency * 1e3},
+        "results": results,
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {len(results)} results to {out_path}")
+    return report
+
+def compare_results(base_path, new_path, threshold):
+    # Prints every shared metric and flags the ones that got worse by more than `threshold`
+    with open(base_path, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'metric':<36} {base['meta'].get('commit') or 'base':>10} {new['meta'].get('commit') or 'new':>10} {'change':>8}")
+    regressions = 0
+    for name in sorted(set(base["results"]) & set(new["results"])):
+        old_value, new_value = base["results"][name], new["results"][name]
+        change = (new_value - old_value) / old_value if old_value else 0.0
+        worse = -change if name.endswith("_per_sec") else change
+        flag = " REGRESSION" if worse > threshold else ""
+        regressions += bool(flag)
+        print(f"{name:<36} {old_value:>10.2f} {new_value:>10.2f} {change:>+8.1%}{flag}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the UNO server")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_load = sub.add_parser("loadtest", help="Request throughput as concurrent games are added")
+    p_load.add_argument("--games", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    p_load.add_argument("--duration", type=float, default=3.0, help="Seconds per step")
+    p_load.add_argument("--think-ms", type=float, default=0.0, help="Client pause between rounds")
+    p_load.add_argument("--ai-mode", choices=["heuristic", "llm"], default="heuristic",
+                        help="heuristic: no LLM at all; llm: LLM pointed at a closed port (fallback path)")
+
+    p_shard = sub.add_parser("shard", help="Request throughput of serve.py by worker count")
+    p_shard.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p_shard.add_argument("--games", type=int, default=32, help="Concurrent games, spread over the client processes")
+    p_shard.add_argument("--duration", type=float, default=5.0, help="Seconds per worker count")
+    p_shard.add_argument("--think-ms", type=float, default=0.0, help="Client pause between rounds")
+    p_shard.add_argument("--clients", type=int, default=os.cpu_count() or 1, help="Client processes; default: one per CPU")
+
+    sub.add_parser("cards", help="create_deck / shuffle_deck / is_valid_play timings and deck memory")
+
+    p_prompt = sub.add_parser("prompt", help="LLM calls and prompt tokens per AI turn over simulated games")
+    p_prompt.add_argument("--games", type=int, default=200)
+    p_prompt.add_argument("--seed", type=int, default=1)
+
+    p_ttft = sub.add_parser("ttft", help="Time to first token against a prompt-caching fake Ollama")
+    p_ttft.add_argument("--games", type=int, default=50)
+    p_ttft.add_argument("--seed", type=int, default=1)
+    p_ttft.add_argument("--prefill-us-per-char", type=float, default=100.0,
+                        help="Stub prefill cost per uncached prompt character (about 400 us/token)")
+
+    p_stream = sub.add_parser("stream", help="AI move latency with and without a streamed LLM response")
+    p_stream.add_argument("--games", type=int, default=20)
+    p_stream.add_argument("--seed", type=int, default=1)
+    p_stream.add_argument("--token-ms", type=float, default=20.0, help="Stub generation time per 4-character chunk")
+
+    p_delta = sub.add_parser("delta", help="Action response sizes, full state vs delta, while hands grow")
+    p_delta.add_argument("--games", type=int, default=20)
+    p_delta.add_argument("--seed", type=int, default=1)
+
+    p_speculate = sub.add_parser("speculate", help="end_turn-to-AI-move latency with and without speculation")
+    p_speculate.add_argument("--games", type=int, default=3)
+    p_speculate.add_argument("--seed", type=int, default=1)
+    p_speculate.add_argument("--llm-latency-ms", type=float, default=200.0, help="Fake Ollama delay per call")
+    p_speculate.add_argument("--think-ms", type=float, default=100.0, help="Human pause between its action and end_turn")
+
+    p_pool = sub.add_parser("pool", help="LLM calls through one flaky backend vs a pool of stubs with mixed latency and failures")
+    p_pool.add_argument("--games", type=int, default=8, help="Games calling the LLM concurrently")
+    p_pool.add_argument("--duration", type=float, default=5.0, help="Seconds per configuration")
+    p_pool.add_argument("--think-ms", type=float, default=50.0, help="Mean pause between a game's LLM calls")
+
+    p_persist = sub.add_parser("persist", help="Game journal write throughput by sync mode, and recovery time from log and snapshot")
+    p_persist.add_argument("--games", type=int, default=2000, help="Live games, spread over the threads")
+    p_persist.add_argument("--moves", type=int, default=50000, help="Moves per sync mode")
+    p_persist.add_argument("--threads", type=int, default=16)
+    p_persist.add_argument("--seed", type=int, default=1)
+
+    p_soak = sub.add_parser("soak", help="RSS while millions of games are created, with expiry and the resident cap")
+    p_soak.add_argument("--games", type=int, default=1000000)
+    p_soak.add_argument("--max-resident", type=int, default=5000)
+    p_soak.add_argument("--idle-ttl", type=float, default=1.0, help="Seconds; finished games get half of it")
+    p_soak.add_argument("--moves", type=int, default=6, help="Moves played in each game")
+    p_soak.add_argument("--report-every", type=int, default=50000, help="Games between a sweep and a report line")
+    p_soak.add_argument("--spill", action="store_true", help="Spill games over the cap to a temporary directory")
+    p_soak.add_argument("--seed", type=int, default=1)
+
+    p_batch = sub.add_parser("batch", help="LLM call latency and batch fill, unbatched and by batch window, against a batching stub")
+    p_batch.add_argument("--games", type=int, default=8, help="Games asking the LLM concurrently")
+    p_batch.add_argument("--duration", type=float, default=5.0, help="Seconds per window")
+    p_batch.add_argument("--batch-ms", type=float, default=200.0, help="Stub latency per batch")
+    p_batch.add_argument("--parallel", type=int, default=4, help="Stub requests per batch, also the client's slots and batch size")
+    p_batch.add_argument("--think-ms", type=float, default=100.0, help="Mean pause between a game's LLM calls")
+    p_batch.add_argument("--windows", type=float, nargs="+", default=[0, 5, 20], help="Client batch windows, ms")
+
+    p_transport = sub.add_parser("transport", help="AI turns against a live stub while recording, then replayed and synthetic")
+    p_transport.add_argument("--games", type=int, default=30)
+    p_transport.add_argument("--seed", type=int, default=1)
+    p_transport.add_argument("--llm-latency-ms", type=float, default=20.0, help="Fake Ollama delay per call while recording")
+
+    p_schema = sub.add_parser("schema", help="Illegal-move and fallback rates with a plain JSON format and with the action schema")
+    p_schema.add_argument("--games", type=int, default=200)
+    p_schema.add_argument("--seed", type=int, default=1)
+    p_schema.add_argument("--slip-rate", type=float, default=0.1, help="Share of unconstrained synthetic answers that break the rules")
+
+    p_suite = sub.add_parser("suite", help="Engine, endpoint and AI turn benchmarks, saved as JSON")
+    p_suite.add_argument("--out", default="bench-results.json")
+    p_suite.add_argument("--iterations", type=int, default=500, help="Calls per endpoint (AI turns: a tenth)")
+    p_suite.add_argument("--llm-latency-ms", type=float, default=50.0, help="Fake Ollama delay per call")
+
+    p_compare = sub.add_parser("compare", help="Compare two suite result files")
+    p_compare.add_argument("base")
+    p_compare.add_argument("new")
+    p_compare.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown flagged as a regression")
+
+    args = parser.parse_args()
+    if args.command == "loadtest":
+        ai_player.AI_PLAYER_MODE = args.ai_mode
+        # In llm mode, point the AI at a closed port so turns fall back immediately instead of waiting on Ollama
+        ai_player.llm_client.endpoint = "http://127.0.0.1:9/api/chat"
+        ai_player.llm_client.max_retries = 0
+        loadtest(args.games, args.duration, args.think_ms)
+    elif args.command == "shard":
+        bench_shard(args.workers, args.games, args.duration, args.think_ms, args.clients)
+    elif args.command == "cards":
+        bench_cards()
+    elif args.command == "prompt":
+        bench_prompt(args.games, args.seed)
+    elif args.command == "ttft":
+        bench_ttft(args.games, args.seed, args.prefill_us_per_char / 1e6)
+    elif args.command == "stream":
+        bench_stream(args.games, args.seed, args.token_ms / 1000.0)
+    elif args.command == "delta":
+        bench_delta(args.games, args.seed)
+    elif args.command == "speculate":
+        bench_speculate(args.games, args.seed, args.llm_latency_ms / 1000.0, args.think_ms / 1000.0)
+    elif args.command == "pool":
+        bench_pool(args.games, args.duration, args.think_ms / 1000.0)
+    elif args.command == "persist":
+        bench_persist(args.games, args.moves, args.threads, args.seed)
+    elif args.command == "soak":
+        bench_soak(args.games, args.max_resident, args.idle_ttl, args.moves, args.report_every, args.spill, args.seed)
+    elif args.command == "batch":
+        bench_batch(args.games, args.duration, args.batch_ms / 1000.0, args.parallel, args.think_ms / 1000.0,
+                    [window / 1000.0 for window in args.windows])
+    elif args.command == "transport":
+        bench_transport(args.games, args.seed, args.llm_latency_ms / 1000.0)
+    elif args.command == "schema":
+        bench_schema(args.games, args.seed, args.slip_rate)
+    elif args.command == "suite":
+        run_suite(args.out, args.iterations, args.llm_latency_ms / 1000.0)
+    elif args.command == "compare":
+        if compare_results(args.base, args.new, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
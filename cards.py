@@ -0,0 +1,193 @@
+# Compact UNO card encoding.
+# A card is a small int (0-107): its position in the canonical deck built by create_deck().
+# That id doubles as the deck-local guid. Color, value and match masks come from precomputed
+# tables, so the game logic never touches strings; names are only produced at the API boundary.
+
+import logging
+import random
+
+logger = logging.getLogger(__name__)
+
+# --- Colors and Values ---
+COLORS = ["red", "yellow", "green", "blue"] # Playable colors, in color-code order
+COLOR_NAMES = COLORS + ["black"]
+BLACK = 4
+COLOR_CODES = {name: code for code, name in enumerate(COLOR_NAMES)}
+
+NUMBERS = [str(i) for i in range(10)] + [str(i) for i in range(1, 10)]
+ACTION_CARDS = ["skip", "reverse", "drawTwo"]
+WILD_CARDS_BASE_VALUE = ["wild", "wildDrawFour"]
+VALUE_NAMES = [str(i) for i in range(10)] + ACTION_CARDS + WILD_CARDS_BASE_VALUE
+VALUE_CODES = {name: code for code, name in enumerate(VALUE_NAMES)}
+SKIP, REVERSE, DRAW_TWO, WILD, WILD_DRAW_FOUR = (VALUE_CODES[v] for v in ACTION_CARDS + WILD_CARDS_BASE_VALUE)
+
+# --- Card Tables ---
+def _canonical_deck():
+    deck = []
+    for color in COLORS:
+        for number in NUMBERS:
+            deck.append((color, number))
+        for _ in range(2): # Two of each action card per color
+            for action in ACTION_CARDS:
+                deck.append((color, action))
+    for _ in range(4): # Four of each wild type
+        deck.append(("black", "wild"))
+        deck.append(("black", "wildDrawFour"))
+    return deck
+
+_DECK = _canonical_deck()
+DECK_SIZE = len(_DECK)
+CARD_IDS = tuple(range(DECK_SIZE))
+
+CARD_COLOR = tuple(COLOR_CODES[color] for color, _ in _DECK)
+CARD_VALUE = tuple(VALUE_CODES[value] for _, value in _DECK)
+# Identifies the face of a card regardless of which copy it is
+CARD_KIND = tuple(color * len(VALUE_NAMES) + value for color, value in zip(CARD_COLOR, CARD_VALUE))
+# Color bit in the low 5 bits, value bit above them: two colored cards match iff their masks intersect
+CARD_MATCH_MASK = tuple((1 << color) | (1 << (len(COLOR_NAMES) + value)) for color, value in zip(CARD_COLOR, CARD_VALUE))
+# Penalty for the next player when the card is played
+CARD_DRAW_PENALTY = tuple(2 if value == DRAW_TWO else 4 if value == WILD_DRAW_FOUR else 0 for value in CARD_VALUE)
+CARD_LABEL = tuple(f"{color} {value}" for color, value in _DECK)
+# Shared, read-only JSON views of every card; never mutate these
+CARD_JSON = tuple({"color": color, "value": value, "guid": card} for card, (color, value) in enumerate(_DECK))
+
+def kind_of(color_name, value_name):
+    # Face code for a client-supplied color/value pair, or None if it is not a real card
+    color = COLOR_CODES.get(color_name)
+    value = VALUE_CODES.get(value_name)
+    if color is None or value is None:
+        return None
+    return color * len(VALUE_NAMES) + value
+
+# --- Deck Utilities ---
+def create_deck():
+    return list(CARD_IDS)
+
+def shuffle_deck(deck):
+    random.shuffle(deck)
+    return deck
+
+def is_valid_play(played_card, top_discard_card, current_chosen_color):
+    # Cards are ids; current_chosen_color is a color code or None
+    if top_discard_card is None:
+        return True
+
+    if CARD_COLOR[played_card] == BLACK:
+        return True
+
+    if CARD_COLOR[top_discard_card] == BLACK:
+        if current_chosen_color is None:
+            logger.error("Wild card on discard but no chosen color set.")
+            return False
+        return CARD_COLOR[played_card] == current_chosen_color
+
+    return (CARD_MATCH_MASK[played_card] & CARD_MATCH_MASK[top_discard_card]) != 0
+
+# --- Legal Move Index ---
+class HandIndex:
+    """Buckets a hand by color and by value so legal moves are a few dict lookups, not a scan.
+
+    Mirrors is_valid_play: on a colored top card the legal cards are those sharing its color or
+    its value, plus wilds; on a wild top card, those of the chosen color plus wilds.
+    """
+
+    __slots__ = ("by_color", "by_value")
+
+    def __init__(self, hand=()):
+        self.by_color = {} # color code -> [card ids]; BLACK holds the wilds
+        self.by_value = {} # value code -> [card ids] (colored cards only)
+        for card in hand:
+            self.add(card)
+
+    def add(self, card):
+        self.by_color.setdefault(CARD_COLOR[card], []).append(card)
+        if CARD_COLOR[card] != BLACK:
+            self.by_value.setdefault(CARD_VALUE[card], []).append(card)
+
+    def remove(self, card):
+        self.by_color[CARD_COLOR[card]].remove(card)
+        if CARD_COLOR[card] != BLACK:
+            self.by_value[CARD_VALUE[card]].remove(card)
+
+    def color_count(self, color):
+        return len(self.by_color.get(color, ()))
+
+    def legal_moves(self, top_discard_card, current_chosen_color):
+        wilds = self.by_color.get(BLACK, [])
+        if top_discard_card is None:
+            return [card for cards in self.by_color.values() for card in cards]
+        top_color = CARD_COLOR[top_discard_card]
+        if top_color == BLACK:
+            if current_chosen_color is None:
+                return list(wilds)
+            return self.by_color.get(current_chosen_color, []) + wilds
+        same_color = self.by_color.get(top_color, [])
+        # A card matching both color and value would be listed twice; same-value cards of the top color are skipped
+        same_value = [card for card in self.by_value.get(CARD_VALUE[top_discard_card], []) if CARD_COLOR[card] != top_color]
+        return same_color + same_value + wilds
+
+# --- Draw and Discard Piles ---
+class DrawPile:
+    """The face-down draw pile and the discard pile of one game.
+
+    Cards are drawn from the tail of `cards`, so every draw is O(1). When the draw pile runs
+    out, the discard pile (minus its top card) becomes the new draw pile by swapping the two
+    lists, so no card list is ever copied.
+    """
+
+    __slots__ = ("cards", "discard")
+
+    def __init__(self, cards=None, discard=None):
+        self.cards = cards if cards is not None else []
+        self.discard = discard if discard is not None else []
+
+    def __len__(self):
+        return len(self.cards)
+
+    def reshuffle(self):
+        # Only called once the draw pile is empty; returns False if there is nothing to recycle
+        if self.cards or len(self.discard) <= 1:
+            return False
+        top_card = self.discard.pop()
+        self.cards, self.discard = self.discard, self.cards
+        self.discard.append(top_card)
+        shuffle_deck(self.cards)
+        logger.debug("Reshuffled %d cards from discard pile into deck.", len(self.cards))
+        return True
+
+    def draw(self, count=1):
+        # Draws up to `count` cards, reshuffling as needed; returns fewer if both piles run dry
+        drawn = []
+        while count > 0:
+            if not self.cards and not self.reshuffle():
+                break
+            take = min(count, len(self.cards))
+            drawn.extend(self.cards[-take:])
+            del self.cards[-take:]
+            count -= take
+        return drawn
+
+    def draw_one(self):
+        drawn = self.draw(1)
+        return drawn[0] if drawn else None
+
+    def put_on_discard(self, card):
+        self.discard.append(card)
+
+# --- API Boundary ---
+def card_to_json(card):
+    return CARD_JSON[card]
+
+def cards_to_json(cards):
+    return [CARD_JSON[card] for card in cards]
+
+def color_name(color):
+    return COLOR_NAMES[color] if color is not None else None
+
+def parse_card_id(raw):
+    # Card ids arrive from JSON (client or LLM) as ints or numeric strings
+    try:
+        card = int(raw)
+    except (TypeError, ValueError):
+        return None
+    return card if 0 <= card < DECK_SIZE else None
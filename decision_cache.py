@@ -0,0 +1,95 @@
+# LRU/TTL cache of AI decisions keyed by a canonical encoding of the game state the LLM sees.
+# Keys ignore card guids and hand order: two states with the same hand multiset, discard top
+# card, game color and (bucketed) opponent card count share a decision. Cached plays store the
+# card face, and are remapped to a concrete guid from the current hand on a hit.
+
+import threading
+import time
+from collections import OrderedDict
+
+from cards import CARD_KIND
+
+def opponent_count_bucket(count):
+    # Exact near the end of the game, coarse otherwise
+    if count <= 3:
+        return count
+    return 4 if count <= 6 else 7
+
+def canonical_key(hand, top_card, current_chosen_color, opponent_card_count):
+    return (tuple(sorted(CARD_KIND[card] for card in hand)),
+            CARD_KIND[top_card] if top_card is not None else None,
+            current_chosen_color,
+            opponent_count_bucket(opponent_card_count))
+
+class CachedDecision:
+    __slots__ = ("action_type", "card_kind", "declared_color", "call_uno", "banter")
+
+    def __init__(self, action_type, card_kind, declared_color, call_uno, banter):
+        self.action_type = action_type
+        self.card_kind = card_kind
+        self.declared_color = declared_color
+        self.call_uno = call_uno
+        self.banter = banter
+
+    def to_action(self, hand, stock_banter=None):
+        # Rebuilds an LLM-style action for `hand`, or None if no card of the cached face is held
+        card_guid = None
+        if self.action_type == "PLAY_CARD":
+            card_guid = next((card for card in hand if CARD_KIND[card] == self.card_kind), None)
+            if card_guid is None:
+                return None
+        return {"action_type": self.action_type, "card_guid_to_play": card_guid,
+                "declared_color": self.declared_color, "call_uno": self.call_uno,
+                "banter": self.banter if self.banter is not None else stock_banter}
+
+class DecisionCache:
+    """Thread-safe, size-bounded LRU with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries=4096, ttl=600.0, cache_banter=True):
+        self.max_entries = max_entries
+        self.ttl = ttl # Seconds; None keeps entries until evicted by size
+        self.cache_banter = cache_banter # False: reuse the move but never replay a cached banter line
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict() # key -> (expires_at, CachedDecision)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key] # Expired
+                self.evictions += 1
+            self.misses += 1
+            return None
+
+    def put(self, key, action_type, card, declared_color, call_uno, banter):
+        decision = CachedDecision(action_type, CARD_KIND[card] if card is not None else None,
+                                  declared_color, call_uno, banter if self.cache_banter else None)
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._entries[key] = (expires_at, decision)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": self.hits / lookups if lookups else 0.0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,259 @@
+# Local stand-in for Ollama's /api/chat, for offline benchmarks and manual testing.
+# Usage:
+#   python fake_ollama.py [--port 11434] [--latency-ms 200] [--failure-rate 0.1] [--prefill-us-per-char 100] [--token-ms 20]
+#                         [--batch-ms 300 --parallel 4]
+#
+# With a prefill cost set, the stub also models Ollama's prompt (KV) cache and model keep-alive:
+# only the part of the prompt after the longest common prefix with the previous request is
+# charged, and a model that has been idle past its keep_alive pays load_time again.
+# Generation costs token_latency per 4-character chunk; "stream": true requests get those chunks
+# as NDJSON over chunked transfer encoding, like Ollama.
+# With a batch latency set, the stub models a backend with `parallel` slots that runs requests in
+# batches: each batch takes batch_latency however full it is. A batch admits the requests that
+# arrive within batch_admit of its first (the scheduler's tick); later ones wait for the next batch.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from stub_moves import CHUNK_CHARS, first_legal_move
+
+def parse_duration(value, default):
+    # Ollama keep_alive: seconds as a number, or a string like "30s", "5m", "1h"
+    if value is None:
+        return default
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    for suffix in ("ms", "s", "m", "h"):
+        if value.endswith(suffix):
+            return float(value[:-len(suffix)]) * units[suffix]
+    return float(value)
+
+class FakeOllamaServer:
+    """Threaded HTTP server that answers /api/chat with a JSON action after an injected delay."""
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, failure_rate=0.0, responder=None, seed=None,
+                 prefill_per_char=0.0, load_time=0.0, default_keep_alive=300.0, token_latency=0.0,
+                 batch_latency=0.0, parallel=4, batch_admit=0.005):
+        self.latency = latency # Seconds; a callable returning seconds is also accepted
+        self.failure_rate = failure_rate # Fraction of calls answered with HTTP 503
+        self.prefill_per_char = prefill_per_char # Seconds per uncached prompt character (0 disables the model)
+        self.load_time = load_time # Seconds to (re)load an unloaded model
+        self.default_keep_alive = default_keep_alive # Seconds, used when the request has no keep_alive
+        self.token_latency = token_latency # Seconds per generated chunk
+        self.batch_latency = batch_latency # Seconds per batch (0 disables the batch model)
+        self.parallel = parallel # Requests per batch at most, like OLLAMA_NUM_PARALLEL
+        self.batch_admit = batch_admit # Seconds a batch stays open to requests after its first
+        self.batches = 0
+        self.batched_requests = 0
+        self._batch_queue = [] # Events of requests waiting for a batch
+        self._batch_cond = threading.Condition()
+        self._batch_thread = None
+        self._stopping = False
+        self._last_prompt = "" # Prompt held in the (single-slot) KV cache
+        self._loaded_until = 0.0
+        self.responder = responder or first_legal_move
+        self.calls = 0
+        self.failures = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._thread = None
+
+        server = self
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive and chunked streaming, like Ollama
+            disable_nagle_algorithm = True # Headers and body go out in separate writes
+            def handle(self):
+                try:
+                    super().handle()
+                except ConnectionResetError:
+                    pass # A pooled keep-alive connection was dropped between requests
+            def do_POST(self):
+                try:
+                    server._handle(self)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass # The client gave up (e.g. its timeout fired) before we answered
+            def do_GET(self):
+                server._handle_get(self)
+            def log_message(self, *args):
+                pass
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/api/chat"
+
+    def _handle(self, handler):
+        body = handler.rfile.read(int(handler.headers.get("Content-Length", 0)))
+        with self._lock:
+            self.calls += 1
+            fail = self._rng.random() < self.failure_rate
+            if fail:
+                self.failures += 1
+        payload = json.loads(body or b"{}")
+        delay = self.latency() if callable(self.latency) else self.latency
+        load_duration, prompt_eval_duration, prompt_eval_count = self._model_prefill(payload)
+        delay += load_duration + prompt_eval_duration
+        if delay:
+            time.sleep(delay)
+        if self.batch_latency:
+            self._run_in_batch()
+        if handler.path != "/api/chat":
+            self._send(handler, 404, {"error": "not found"})
+        elif fail:
+            self._send(handler, 503, {"error": "injected failure"})
+        else:
+            content = json.dumps(self.responder(payload))
+            chunks = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)]
+            base = {"model": payload.get("model"), "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ")}
+            final = dict(base, done=True, load_duration=int(load_duration * 1e9),
+                         prompt_eval_count=prompt_eval_count, prompt_eval_duration=int(prompt_eval_duration * 1e9),
+                         eval_count=len(chunks), eval_duration=int(len(chunks) * self.token_latency * 1e9))
+            if payload.get("stream"):
+                self._stream(handler, base, chunks, final)
+            else:
+                if self.token_latency:
+                    time.sleep(len(chunks) * self.token_latency)
+                self._send(handler, 200, dict(final, message={"role": "assistant", "content": content}))
+
+    def _stream(self, handler, base, chunks, final):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/x-ndjson")
+        handler.send_header("Transfer-Encoding", "chunked")
+        handler.end_headers()
+        def write(data):
+            line = json.dumps(data).encode() + b"\n"
+            handler.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            handler.wfile.flush()
+        for chunk in chunks:
+            if self.token_latency:
+                time.sleep(self.token_latency)
+            write(dict(base, message={"role": "assistant", "content": chunk}, done=False))
+        write(dict(final, message={"role": "assistant", "content": ""}))
+        handler.wfile.write(b"0\r\n\r\n")
+
+    def _model_prefill(self, payload):
+        # Returns (load seconds, prompt eval seconds, uncached prompt chars) for this request
+        if not self.prefill_per_char:
+            return 0.0, 0.0, 0
+        prompt = "".join(message.get("content", "") for message in payload.get("messages", []))
+        keep_alive = parse_duration(payload.get("keep_alive"), self.default_keep_alive)
+        with self._lock:
+            now = time.monotonic()
+            load = 0.0
+            if now > self._loaded_until:
+                load = self.load_time
+                self._last_prompt = "" # Unloading drops the KV cache too
+            cached = 0
+            for a, b in zip(prompt, self._last_prompt):
+                if a != b:
+                    break
+                cached += 1
+            self._last_prompt = prompt
+            self._loaded_until = now + load + keep_alive
+        uncached = len(prompt) - cached
+        return load, uncached * self.prefill_per_char, uncached
+
+    def _handle_get(self, handler):
+        # /api/tags, which health checks poll; fails at the same rate as chat calls
+        with self._lock:
+            fail = self._rng.random() < self.failure_rate
+        if handler.path != "/api/tags":
+            self._send(handler, 404, {"error": "not found"})
+        elif fail:
+            self._send(handler, 503, {"error": "injected failure"})
+        else:
+            self._send(handler, 200, {"models": [{"name": "stub", "model": "stub"}]})
+
+    def _run_in_batch(self):
+        done = threading.Event()
+        with self._batch_cond:
+            self._batch_queue.append(done)
+            self._batch_cond.notify()
+        done.wait()
+
+    def _batch_loop(self):
+        # The backend: takes up to `parallel` waiting requests, runs them together, repeats
+        while True:
+            with self._batch_cond:
+                while not self._batch_queue and not self._stopping:
+                    self._batch_cond.wait()
+                admit_until = time.monotonic() + self.batch_admit
+                while len(self._batch_queue) < self.parallel and not self._stopping:
+                    remaining = admit_until - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._batch_cond.wait(remaining)
+                if self._stopping:
+                    return
+                batch = self._batch_queue[:self.parallel]
+                del self._batch_queue[:len(batch)]
+            time.sleep(self.batch_latency)
+            with self._lock:
+                self.batches += 1
+                self.batched_requests += len(batch)
+            for done in batch:
+                done.set()
+
+    def _send(self, handler, status, data):
+        encoded = json.dumps(data).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(encoded)))
+        handler.end_headers()
+        handler.wfile.write(encoded)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        if self.batch_latency:
+            self._batch_thread = threading.Thread(target=self._batch_loop, daemon=True)
+            self._batch_thread.start()
+        return self
+
+    def stop(self):
+        with self._batch_cond:
+            self._stopping = True
+            for done in self._batch_queue:
+                done.set() # Let handlers still waiting on a batch finish
+            self._batch_cond.notify_all()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake Ollama /api/chat server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--prefill-us-per-char", type=float, default=0.0)
+    parser.add_argument("--load-ms", type=float, default=0.0)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--batch-ms", type=float, default=0.0, help="Latency of one batch of up to --parallel requests")
+    parser.add_argument("--parallel", type=int, default=4)
+    args = parser.parse_args()
+    server = FakeOllamaServer(args.host, args.port, latency=args.latency_ms / 1000.0, failure_rate=args.failure_rate,
+                              prefill_per_char=args.prefill_us_per_char / 1e6, load_time=args.load_ms / 1000.0,
+                              token_latency=args.token_ms / 1000.0, batch_latency=args.batch_ms / 1000.0,
+                              parallel=args.parallel)
+    print(f"Fake Ollama listening on {server.url}")
+    if server.batch_latency:
+        threading.Thread(target=server._batch_loop, daemon=True).start()
+    server.httpd.serve_forever()
+
+if __name__ == '__main__':
+    main()
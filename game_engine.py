@@ -0,0 +1,478 @@
+# Game engine for the UNO server.
+# All per-game state lives on a GameState object and games are looked up by id
+# through a GameEngine, so a single process can host many independent games.
+# With a journal attached (see persistence.py), the moves below record compact events that
+# journal_commit() hands to the event log at every state change. The engine bounds memory: idle
+# and finished games expire, and past a cap the least recently used ones leave memory.
+
+import json
+import logging
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from cards import (BLACK, CARD_COLOR, CARD_DRAW_PENALTY, CARD_VALUE, COLORS, WILD_DRAW_FOUR, DrawPile, card_to_json,
+                   cards_to_json, color_name, create_deck, shuffle_deck)
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SENT_VIEW_HISTORY = 32 # Versions per game a delta can be based on; older bases get a full resync
+
+GAME_EVICTIONS = metrics.counter("uno_game_evictions_total", "Games dropped from memory, by reason (idle, finished, lru).",
+                                 ("reason",))
+GAME_RELOADS = metrics.counter("uno_game_reloads_total", "Spilled games loaded back into memory on their next request.")
+
+# --- Per-Game State ---
+class GameState:
+    """State of a single UNO game. Callers must hold `lock` while reading or mutating it."""
+
+    def __init__(self, game_id, players=None):
+        self.game_id = game_id
+        self.lock = threading.RLock()
+
+        self.draw_pile = DrawPile() # Owns both the draw pile and the discard pile
+        self.player_hands = {}
+        self.discard_pile_top_card = None # Card id
+        self.current_chosen_color = None # Color code
+        self.awaiting_color_choice = False # True if a Wild card was played and server is waiting for color choice
+        self.pending_draw_amount = 0
+        self.ai_last_banter = ""
+        self.game_winner = None
+        self.ai_turn_pending = False # True while an AI turn runs in the background; human actions are rejected
+        self.ai_banter_stream = None # The AI turn whose banter is still streaming in after its move, if any
+        self.ai_speculation = None # AI decision started ahead of end_turn (see AITurnRunner.speculate), if any
+        self.version = 0 # Bumped (under lock) on every change a client can see; used for ETags and push
+        self.last_used = time.monotonic() # Last lookup through the GameEngine; drives idle expiry and LRU order
+        self.evicted = False # Dropped from the engine (expired or spilled); whoever still holds it must look it up again
+        self.state_changed = threading.Condition(self.lock) # Notified by mark_changed()
+        self._state_json = {} # player_name -> (version, encoded full_state)
+        self._sent_views = OrderedDict() # (player_name, version) -> (hand tuple, fields); delta bases
+
+        self.players = list(players) if players else ["Player1", "Player2"]
+        self.current_player_index = 0
+        self.game_started = False
+        self.play_direction = 1 # 1 for forward, -1 for reverse
+
+        self.journal = None # GameStore that persists this game's changes, if any
+        self.journal_seq = 0 # Records committed to the journal for this game
+        self._journal_events = [] # Recorded since the last commit
+        self._journal_fields = None # journal_fields() as of the last commit
+        self._journal_banter = ""
+
+    def start(self):
+        self.game_winner = None
+        self.draw_pile = DrawPile(shuffle_deck(create_deck()))
+        self.record_event(("create", tuple(self.players)))
+        deck = self.draw_pile.cards
+
+        self.player_hands = {player: [] for player in self.players}
+        for player in self.players:
+            self.player_hands[player] = self.draw_pile.draw(7)
+            if len(self.player_hands[player]) < 7:
+                logger.error("Deck ran out during initial deal.")
+
+        if deck:
+            card_to_discard = deck.pop()
+            while CARD_VALUE[card_to_discard] == WILD_DRAW_FOUR:
+                logger.debug("Wild Draw Four drawn as first card, re-shuffling and re-drawing.")
+                deck.insert(len(deck) // 2, card_to_discard)
+                shuffle_deck(deck)
+                card_to_discard = deck.pop()
+
+            self.draw_pile.put_on_discard(card_to_discard)
+            self.discard_pile_top_card = card_to_discard
+
+            if CARD_COLOR[self.discard_pile_top_card] == BLACK:
+                self.current_chosen_color = 0 # COLORS[0]
+                logger.debug("A Wild card is the first on discard. Chosen color defaults to %s.", COLORS[0])
+            else:
+                self.current_chosen_color = CARD_COLOR[self.discard_pile_top_card]
+        else:
+            logger.error("Deck empty before drawing first discard card.")
+            self.discard_pile_top_card = 0 # red 0
+            self.current_chosen_color = CARD_COLOR[self.discard_pile_top_card]
+
+        self.current_player_index = 0
+        self.play_direction = 1
+        self.awaiting_color_choice = False # Reset at game start
+        self.pending_draw_amount = 0
+        self.ai_last_banter = ""
+        self.game_started = True
+        self.record_layout()
+        logger.info("Game %s started. Deck shuffled. Cards dealt. First discard placed.", self.game_id)
+
+    # --- Moves (shared by the HTTP routes, the AI player and the simulator) ---
+    def draw_cards(self, player_name, count):
+        # Draws up to `count` cards into the player's hand, reshuffling the discard pile if needed
+        reshuffles = count > len(self.draw_pile.cards)
+        drawn_cards = self.draw_pile.draw(count)
+        self.player_hands[player_name].extend(drawn_cards)
+        if self.journal is not None:
+            if reshuffles: # The new pile order is random, so the journal gets the resulting layout
+                self.record_layout()
+            else:
+                self._journal_events.append(("draw", player_name, count))
+        return drawn_cards
+
+    def play_card(self, player_name, card, chosen_color=None):
+        # Moves `card` from the player's hand onto the discard pile and applies its effects.
+        # Checking the play with is_valid_play is the caller's job. A black card played without
+        # a chosen color code leaves the game awaiting a color choice.
+        self.player_hands[player_name].remove(card)
+        self.record_event(("play", player_name, card, chosen_color))
+        self.draw_pile.put_on_discard(card)
+        self.discard_pile_top_card = card
+        self.pending_draw_amount += CARD_DRAW_PENALTY[card]
+        if CARD_COLOR[card] == BLACK:
+            self.current_chosen_color = chosen_color
+            self.awaiting_color_choice = chosen_color is None
+        else:
+            self.current_chosen_color = CARD_COLOR[card]
+            self.awaiting_color_choice = False
+
+    def mark_changed(self):
+        # Caller holds self.lock
+        self.version += 1
+        self.journal_commit()
+        self.state_changed.notify_all()
+
+    # --- Journal ---
+    def record_event(self, event):
+        # Caller holds self.lock; a no-op without a journal
+        if self.journal is not None:
+            self._journal_events.append(event)
+
+    def record_layout(self):
+        # Where every card is; recorded at the deal and after a reshuffle
+        if self.journal is not None:
+            self._journal_events.append(("layout", tuple(self.draw_pile.cards), tuple(self.draw_pile.discard),
+                                         tuple(tuple(self.player_hands.get(player, ())) for player in self.players)))
+
+    def attach_journal(self, journal):
+        # Starts recording to `journal` from the current state on, e.g. after the game was rebuilt from it
+        self.journal = journal
+        self._journal_events = []
+        self._journal_fields = self.journal_fields()
+        self._journal_banter = self.ai_last_banter
+
+    def journal_fields(self):
+        return (self.current_player_index, self.play_direction, self.pending_draw_amount, self.awaiting_color_choice,
+                self.game_started, self.current_chosen_color, self.discard_pile_top_card, self.game_winner)
+
+    def journal_commit(self):
+        # Caller holds self.lock. Hands the events recorded since the last commit, plus any change
+        # to the other fields and the banter, to the journal as one record. Returns a ticket for
+        # journal.wait(), or None if there was nothing to write.
+        if self.journal is None:
+            return None
+        fields = self.journal_fields()
+        if fields != self._journal_fields or self._journal_events: # Replayed moves change fields the record must settle
+            self._journal_events.append(("fields", fields))
+            self._journal_fields = fields
+        if self.ai_last_banter != self._journal_banter:
+            self._journal_events.append(("banter", self.ai_last_banter))
+            self._journal_banter = self.ai_last_banter
+        if not self._journal_events:
+            return None
+        events, self._journal_events = self._journal_events, []
+        self.journal_seq += 1
+        return self.journal.append(self.game_id, self.journal_seq, self.version, self.players, events)
+
+    def state_json(self, player_name):
+        # full_state() encoded as JSON, built at most once per version and seat
+        cached = self._state_json.get(player_name)
+        if cached is None or cached[0] != self.version:
+            cached = (self.version, json.dumps(self.full_state(player_name), separators=(",", ":")))
+            self._state_json[player_name] = cached
+        return cached[1]
+
+    @property
+    def current_player_name(self):
+        return self.players[self.current_player_index]
+
+    def advance_turn(self):
+        num_players = len(self.players)
+        self.current_player_index = (self.current_player_index + self.play_direction + num_players) % num_players
+        return self.current_player_name
+
+    def opponent_card_count(self, player_name):
+        # Card count of the player seated after `player_name`
+        idx = self.players.index(player_name)
+        opponent_name = self.players[(idx + 1) % len(self.players)]
+        return len(self.player_hands.get(opponent_name, []))
+
+    def public_state(self):
+        # Fields shared by every API response; cards and colors are converted to names only here
+        return {
+            "game_id": self.game_id,
+            "discard_pile_top_card": card_to_json(self.discard_pile_top_card) if self.discard_pile_top_card is not None else {"color": "grey", "value": "Empty"},
+            "deck_card_count": len(self.draw_pile),
+            "current_player": self.current_player_name,
+            "current_chosen_color": color_name(self.current_chosen_color),
+            "awaiting_color_choice": self.awaiting_color_choice,
+            "players_list": self.players,
+            "play_direction": "forward" if self.play_direction == 1 else "backward",
+            "ai_turn_pending": self.ai_turn_pending,
+            "state_version": self.version,
+        }
+
+    def seat_fields(self, player_name):
+        # full_state() without the hand
+        state = self.public_state()
+        state["pending_draw_amount"] = self.pending_draw_amount
+        state["ai_last_banter"] = self.ai_last_banter
+        state["ai_banter_streaming"] = self.ai_banter_stream is not None
+        state["game_winner"] = self.game_winner
+        state["opponent_card_count"] = self.opponent_card_count(player_name)
+        return state
+
+    def full_state(self, player_name):
+        # Everything the client needs to render the table from `player_name`'s seat
+        hand = self.player_hands.get(player_name, [])
+        state = self.seat_fields(player_name)
+        self._remember_view(player_name, hand, state)
+        state["player_hand"] = cards_to_json(hand)
+        return state
+
+    def state_delta(self, player_name, base_version):
+        # What changed for `player_name` since the state sent at base_version: hand cards added
+        # (as JSON) and removed (by id), plus every other field whose value differs.
+        # Returns None when that version was never sent or has aged out; the client must resync.
+        base = self._sent_views.get((player_name, base_version))
+        if base is None:
+            return None
+        base_hand, base_fields = base
+        hand = self.player_hands.get(player_name, [])
+        fields = self.seat_fields(player_name)
+        self._remember_view(player_name, hand, fields)
+
+        delta = {"delta": True, "base_version": base_version, "state_version": self.version}
+        base_cards, cards = set(base_hand), set(hand)
+        added = [card for card in hand if card not in base_cards]
+        removed = [card for card in base_hand if card not in cards]
+        if added:
+            delta["hand_added"] = cards_to_json(added)
+        if removed:
+            delta["hand_removed"] = removed
+        changed = {key: value for key, value in fields.items()
+                   if key != "state_version" and base_fields.get(key) != value}
+        if changed:
+            delta["changed"] = changed
+        return delta
+
+    def memory_footprint(self):
+        # Approximate bytes held by this game: the object, piles, hands, banter and cached views.
+        # Card ids are small ints that CPython shares, so only the lists holding them count.
+        size = sys.getsizeof(self) + sys.getsizeof(self.__dict__) + sys.getsizeof(self.draw_pile)
+        size += sys.getsizeof(self.draw_pile.cards) + sys.getsizeof(self.draw_pile.discard)
+        size += sys.getsizeof(self.player_hands) + sum(sys.getsizeof(hand) for hand in self.player_hands.values())
+        size += sys.getsizeof(self.ai_last_banter) + sys.getsizeof(self.players)
+        size += sys.getsizeof(self._state_json) + sum(sys.getsizeof(encoded) for _, encoded in self._state_json.values())
+        size += sys.getsizeof(self._sent_views)
+        for hand, fields in self._sent_views.values():
+            size += sys.getsizeof(hand) + sys.getsizeof(fields) + sum(sys.getsizeof(value) for value in fields.values())
+        return size
+
+    def _remember_view(self, player_name, hand, fields):
+        # Keeps what was sent for this version so a later delta can be computed against it
+        key = (player_name, self.version)
+        if key not in self._sent_views:
+            self._sent_views[key] = (tuple(hand), dict(fields))
+            while len(self._sent_views) > SENT_VIEW_HISTORY:
+                self._sent_views.popitem(last=False)
+
+# --- Game Registry ---
+class GameEngine:
+    """Registry of live games keyed by game id, least recently used first.
+
+    sweep() removes games nobody has looked up for idle_ttl seconds, or finished_ttl once they
+    have a winner. Beyond max_resident games, the least recently used one is spilled to `spill`
+    (a persistence.GameSpill) and reloaded on its next lookup, or removed if there is no spill.
+    Games in the middle of an AI turn are never evicted.
+    """
+
+    def __init__(self, idle_ttl=None, finished_ttl=None, max_resident=None, spill=None):
+        self._games = OrderedDict()
+        self._lock = threading.Lock() # Guards the registry dict only; each game has its own lock
+        self.journal = None # GameStore every game created from now on records to, if any
+        self.owns = None # Predicate for the game ids this process may hand out (sharded serving, see serve.py); None: any
+        self.idle_ttl = idle_ttl # None: never expire
+        self.finished_ttl = finished_ttl
+        self.max_resident = max_resident # None: no cap
+        self.spill = spill
+        self._stop = threading.Event()
+
+    def create_game(self, players=None):
+        game_id = uuid.uuid4().hex
+        while self.owns is not None and not self.owns(game_id): # About one try per shard
+            game_id = uuid.uuid4().hex
+        game = GameState(game_id, players)
+        game.journal = self.journal
+        with game.lock:
+            game.start()
+            ticket = game.journal_commit()
+        self.add_game(game)
+        if ticket is not None:
+            self.journal.wait(ticket)
+        return game
+
+    def add_game(self, game):
+        # Registers an existing game, e.g. one rebuilt from the journal
+        with self._lock:
+            self._games[game.game_id] = game
+            self._evict_over_cap()
+
+    def get_game(self, game_id):
+        with self._lock:
+            game = self._games.get(game_id)
+            if game is not None:
+                self._games.move_to_end(game_id)
+            elif self.spill is not None:
+                game = self.spill.load(game_id)
+                if game is None:
+                    return None
+                if self.journal is not None:
+                    game.attach_journal(self.journal)
+                self._games[game_id] = game
+                GAME_RELOADS.inc()
+                self._evict_over_cap()
+            else:
+                return None
+            game.last_used = time.monotonic()
+            return game
+
+    def games(self):
+        with self._lock:
+            return list(self._games.values())
+
+    def remove_game(self, game_id):
+        with self._lock:
+            game = self._games.pop(game_id, None)
+        if game is not None:
+            with game.lock:
+                self._drop(game)
+        return game
+
+    def _drop(self, game):
+        # Caller holds game.lock and has taken it out of the registry; journals the removal
+        game.evicted = True
+        game.state_changed.notify_all() # Ends its event streams
+        if game.journal is not None:
+            game.record_event(("remove",))
+            game.journal_commit()
+        if self.spill is not None:
+            self.spill.discard(game.game_id)
+
+    @staticmethod
+    def _busy(game):
+        return game.ai_turn_pending or game.ai_banter_stream is not None or game.ai_speculation is not None
+
+    def _evict_over_cap(self):
+        # Caller holds self._lock. Spilling here (a few hundred bytes, no fsync) keeps the game
+        # findable at every moment: in the registry or on disk. Games that are locked or busy
+        # are skipped rather than waited for, so this never blocks on a game.
+        if self.max_resident is None:
+            return
+        for _ in range(len(self._games)):
+            if len(self._games) <= self.max_resident:
+                return
+            game_id, game = next(iter(self._games.items()))
+            if not game.lock.acquire(blocking=False):
+                self._games.move_to_end(game_id)
+                continue
+            try:
+                if self._busy(game):
+                    self._games.move_to_end(game_id)
+                    continue
+                del self._games[game_id]
+                if self.spill is not None:
+                    self.spill.save(game)
+                    game.evicted = True
+                    game.state_changed.notify_all()
+                else:
+                    self._drop(game)
+                GAME_EVICTIONS.inc(reason="lru")
+            finally:
+                game.lock.release()
+
+    def sweep(self, now=None):
+        # Removes expired games, resident and spilled; returns how many
+        now = time.monotonic() if now is None else now
+        ttls = [ttl for ttl in (self.idle_ttl, self.finished_ttl) if ttl is not None]
+        if not ttls:
+            return 0
+        candidates = []
+        with self._lock:
+            for game in self._games.values(): # Oldest first, so the walk ends at the first recent game
+                if now - game.last_used < min(ttls):
+                    break
+                candidates.append(game)
+        removed = 0
+        for game in candidates:
+            with game.lock:
+                idle = now - game.last_used
+                if self._busy(game) or game.evicted:
+                    continue
+                if game.game_winner is not None and self.finished_ttl is not None and idle >= self.finished_ttl:
+                    reason = "finished"
+                elif self.idle_ttl is not None and idle >= self.idle_ttl:
+                    reason = "idle"
+                else:
+                    continue
+                with self._lock:
+                    if self._games.get(game.game_id) is not game: # Looked up again (and spilled) meanwhile
+                        continue
+                    del self._games[game.game_id]
+                self._drop(game)
+            GAME_EVICTIONS.inc(reason=reason)
+            removed += 1
+        if self.spill is not None:
+            for game_id, age, stamp in self.spill.expired(min(ttls)):
+                game = self.spill.load(game_id) # Read outside self._lock, which every lookup takes
+                if game is None:
+                    reason = None # Corrupt or already gone: only its file is left to remove
+                elif game.game_winner is not None and self.finished_ttl is not None and age >= self.finished_ttl:
+                    reason = "finished"
+                elif self.idle_ttl is not None and age >= self.idle_ttl:
+                    reason = "idle"
+                else:
+                    continue
+                with self._lock: # Held to the end so a lookup cannot reload the game meanwhile
+                    if game_id in self._games or self.spill.stamp(game_id) != stamp:
+                        continue # Reloaded (and maybe spilled again) since it was read: the copy is stale
+                    if game is None:
+                        self.spill.discard(game_id)
+                        continue
+                    with game.lock: # Not registered, but the journal still needs its removal
+                        if self.journal is not None:
+                            game.attach_journal(self.journal)
+                        self._drop(game)
+                GAME_EVICTIONS.inc(reason=reason)
+                removed += 1
+        if removed:
+            logger.info("Evicted %d expired game(s); %d resident.", removed, len(self))
+        return removed
+
+    def start_sweeper(self, interval):
+        def sweep_loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception:
+                    logger.exception("Game sweep failed")
+        threading.Thread(target=sweep_loop, name="game-sweeper", daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+
+    def memory_footprint(self):
+        # (total, largest) approximate bytes of the resident games; read without their locks
+        sizes = [game.memory_footprint() for game in self.games()]
+        return sum(sizes), max(sizes, default=0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._games)
@@ -0,0 +1,49 @@
+# Deterministic rule-based UNO strategy.
+# Picks a legal move from the hand, the discard top card and the chosen color in microseconds,
+# and returns it in the same shape as an LLM action so callers can use either interchangeably.
+
+from cards import (BLACK, CARD_COLOR, CARD_VALUE, COLORS, DRAW_TWO, REVERSE, SKIP, WILD, WILD_DRAW_FOUR,
+                   HandIndex)
+
+# Lower ranks are played first: hurt the opponent, keep wilds for when nothing else fits
+_VALUE_RANK = {DRAW_TWO: 0, SKIP: 1, REVERSE: 2, WILD: 14, WILD_DRAW_FOUR: 15}
+
+def value_rank(value):
+    # Action cards first, then numbers high to low, wilds last
+    return _VALUE_RANK.get(value, 3 + (9 - value))
+
+def color_counts(hand):
+    counts = [0] * len(COLORS)
+    for card in hand:
+        color = CARD_COLOR[card]
+        if color != BLACK:
+            counts[color] += 1
+    return counts
+
+def most_held_color(hand):
+    # Ties go to the earlier color in COLORS so the choice is deterministic
+    counts = color_counts(hand)
+    return max(range(len(COLORS)), key=lambda color: (counts[color], -color))
+
+def choose_move(hand, top_card, current_chosen_color, legal=None):
+    # `legal` may be passed in when the caller already computed the legal moves for this hand
+    if legal is None:
+        legal = HandIndex(hand).legal_moves(top_card, current_chosen_color)
+    if not legal:
+        return {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None,
+                "call_uno": False, "banter": "Nothing fits, drawing ..."}
+
+    counts = color_counts(hand)
+    def rank(card):
+        value = CARD_VALUE[card]
+        color = CARD_COLOR[card]
+        # Prefer the color we hold most of among cards of the same rank
+        return (value_rank(value), -(counts[color] if color != BLACK else 0), card)
+
+    card = min(legal, key=rank)
+    remaining = [c for c in hand if c != card]
+    declared_color = None
+    if CARD_COLOR[card] == BLACK:
+        declared_color = COLORS[most_held_color(remaining)]
+    return {"action_type": "PLAY_CARD", "card_guid_to_play": card, "declared_color": declared_color,
+            "call_uno": len(hand) == 2, "banter": "Playing it by the book ..."}
@@ -0,0 +1,266 @@
+# HTTP client for the Ollama /api/chat backend.
+# One pooled, keep-alive requests.Session is shared by every AI turn in the process. A semaphore
+# caps in-flight calls, and transient failures are retried with backoff inside a per-call
+# latency budget. chat_stream() reads Ollama's NDJSON stream and hands each chunk to a callback.
+# With a batch window set, calls from every game are first gathered into small batches (see
+# BatchDispatcher) and then sent together, so the backend's parallel slots fill at the same time.
+
+import collections
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+LLM_REQUESTS = metrics.counter("uno_llm_requests_total", "LLM chat calls by outcome (success or failure).", ("outcome",))
+LLM_RETRIES = metrics.counter("uno_llm_retries_total", "LLM HTTP attempts that failed and were retried.")
+LLM_REQUEST_SECONDS = metrics.histogram("uno_llm_request_seconds", "Successful LLM chat calls, queueing and retries included.")
+LLM_QUEUE_WAIT_SECONDS = metrics.histogram("uno_llm_queue_wait_seconds",
+                                           "Time from an LLM call until it was sent: batch window plus waiting for a free slot.")
+LLM_INFERENCE_SECONDS = metrics.histogram("uno_llm_inference_seconds", "Successful LLM chat calls from send to reply, retries included.")
+LLM_BATCH_WAIT_SECONDS = metrics.histogram("uno_llm_batch_wait_seconds", "Time an LLM call waited for its batch to close.")
+LLM_BATCH_SIZE = metrics.histogram("uno_llm_batch_size", "LLM calls released together per batch.", buckets=(1, 2, 3, 4, 6, 8, 12, 16, 32))
+
+class LLMClientError(requests.exceptions.RequestException):
+    """The backend could not produce a response within the retry/latency budget."""
+
+class LLMCallResult:
+    """Decoded response body plus timing for one chat() call."""
+
+    __slots__ = ("data", "elapsed", "queue_wait", "attempts")
+
+    def __init__(self, data, elapsed, queue_wait, attempts):
+        self.data = data
+        self.elapsed = elapsed # Seconds from chat() entry to return, including queueing and retries
+        self.queue_wait = queue_wait # Seconds before the request was sent: batch window and concurrency slot
+        self.attempts = attempts
+
+class _Batch:
+    __slots__ = ("deadline", "size", "outstanding", "sent")
+
+    def __init__(self, deadline):
+        self.deadline = deadline # When the batch is sent even if not full
+        self.size = 0 # Calls that joined
+        self.outstanding = 0 # Calls of a sent batch still waiting on their reply
+        self.sent = False
+
+class BatchDispatcher:
+    """Sends LLM calls from every game to the backend in batches of up to `size`.
+
+    A batch is sent once it is full or `window` seconds after its first call, and only while fewer
+    than `max_batches` batches are in flight; until then it keeps filling. So when the backend is
+    busy the next batch gathers everything that arrives meanwhile and goes out whole as soon as a
+    batch finishes, instead of calls trickling in one by one and running in half-empty batches.
+    There is no dispatcher thread: each call waits on its own thread, then sends its own request
+    and gets its own reply, and whichever call notices a batch is due sends it.
+    """
+
+    def __init__(self, window, size, max_batches=1):
+        self.window = window # Seconds
+        self.size = size
+        self.max_batches = max_batches
+        self._pending = collections.deque() # Unsent batches, oldest first; new calls join the last
+        self._in_flight = 0
+        self._cond = threading.Condition()
+
+    def join(self, deadline):
+        # Blocks until this call's batch is sent; returns the batch, or None past the call's deadline
+        with self._cond:
+            now = time.perf_counter()
+            if not self._pending or self._pending[-1].size >= self.size:
+                self._pending.append(_Batch(now + self.window))
+            batch = self._pending[-1]
+            batch.size += 1
+            while True:
+                self._send_due(now)
+                if batch.sent:
+                    return batch
+                timeout = deadline - now
+                if timeout <= 0:
+                    batch.size -= 1
+                    if batch.size == 0:
+                        self._pending.remove(batch)
+                    return None
+                head = self._pending[0]
+                if head.size < self.size and now < head.deadline:
+                    timeout = min(timeout, head.deadline - now) # Otherwise a finishing batch wakes us
+                self._cond.wait(timeout)
+                now = time.perf_counter()
+
+    def done(self, batch):
+        # One call of a sent batch has its reply (or gave up); the last one frees the batch's place
+        with self._cond:
+            batch.outstanding -= 1
+            if batch.outstanding == 0:
+                self._in_flight -= 1
+                self._send_due(time.perf_counter())
+
+    def _send_due(self, now):
+        # Caller holds self._cond
+        while self._pending and self._in_flight < self.max_batches:
+            head = self._pending[0]
+            if head.size < self.size and now < head.deadline:
+                break
+            self._pending.popleft()
+            head.sent = True
+            head.outstanding = head.size
+            self._in_flight += 1
+            LLM_BATCH_SIZE.observe(head.size)
+            self._cond.notify_all()
+
+class OllamaClient:
+    def __init__(self, endpoint, max_concurrent=4, request_timeout=60, max_retries=2,
+                 retry_backoff=0.25, latency_budget=60, batch_window=0.0, batch_size=None):
+        self.endpoint = endpoint
+        self.request_timeout = request_timeout # Cap on a single HTTP attempt, seconds
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff # Base delay, doubled per retry, seconds
+        self.latency_budget = latency_budget # Cap on one chat() call including retries, seconds
+        self._slots = threading.BoundedSemaphore(max_concurrent)
+        # With a batch_size, calls go out in batches (see BatchDispatcher), as many in flight as the slots allow
+        self.batches = None
+        if batch_size:
+            self.batches = BatchDispatcher(batch_window, batch_size, max(1, max_concurrent // batch_size))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrent)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def chat(self, payload, latency_budget=None, affinity=None):
+        # affinity (the game id) only matters to a pool of backends, see llm_pool.LLMPool
+        return self._counted(self._chat, payload, latency_budget)
+
+    def chat_stream(self, payload, on_chunk, latency_budget=None, affinity=None):
+        # Like chat(), but calls on_chunk(chunk) for every NDJSON chunk as it arrives. Retries only
+        # happen before the first chunk; once content has been handed out a failure is final.
+        # The returned data is the final chunk with the whole message content joined back together.
+        return self._counted(self._chat_stream, payload, latency_budget, on_chunk)
+
+    def _counted(self, call, payload, latency_budget, *args):
+        try:
+            result = call(payload, latency_budget, *args)
+        except Exception:
+            LLM_REQUESTS.inc(outcome="failure")
+            raise
+        LLM_REQUESTS.inc(outcome="success")
+        LLM_REQUEST_SECONDS.observe(result.elapsed)
+        LLM_INFERENCE_SECONDS.observe(result.elapsed - result.queue_wait)
+        return result
+
+    def _acquire_slot(self, start, deadline):
+        # Returns (queue wait, batch or None); pass the batch to _release_slot when the call is over
+        batch = None
+        if self.batches is not None:
+            batch = self.batches.join(deadline)
+            LLM_BATCH_WAIT_SECONDS.observe(time.perf_counter() - start)
+            if batch is None:
+                LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start)
+                raise LLMClientError("Timed out waiting for an LLM batch to be sent.")
+        acquired = self._slots.acquire(timeout=max(0.0, deadline - time.perf_counter()))
+        queue_wait = time.perf_counter() - start
+        LLM_QUEUE_WAIT_SECONDS.observe(queue_wait)
+        if not acquired:
+            if batch is not None:
+                self.batches.done(batch)
+            raise LLMClientError("Timed out waiting for a free LLM request slot.")
+        return queue_wait, batch
+
+    def _release_slot(self, batch):
+        self._slots.release()
+        if batch is not None:
+            self.batches.done(batch)
+
+    def _chat(self, payload, latency_budget):
+        start = time.perf_counter()
+        deadline = start + (latency_budget if latency_budget is not None else self.latency_budget)
+
+        queue_wait, batch = self._acquire_slot(start, deadline)
+        try:
+            attempts = 0
+            while True:
+                attempts += 1
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise LLMClientError(f"LLM latency budget exhausted after {attempts - 1} attempt(s).")
+                try:
+                    response = self.session.post(self.endpoint, json=payload,
+                                                 timeout=min(self.request_timeout, remaining))
+                    response.raise_for_status()
+                    data = response.json()
+                    return LLMCallResult(data, time.perf_counter() - start, queue_wait, attempts)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    error = e
+                except requests.exceptions.HTTPError as e:
+                    if e.response is None or e.response.status_code not in RETRYABLE_STATUS_CODES:
+                        raise # Other 4xx are not worth retrying
+                    error = e
+                self._backoff(attempts, deadline, error)
+        finally:
+            self._release_slot(batch)
+
+    def _chat_stream(self, payload, latency_budget, on_chunk):
+        start = time.perf_counter()
+        deadline = start + (latency_budget if latency_budget is not None else self.latency_budget)
+
+        queue_wait, batch = self._acquire_slot(start, deadline)
+        try:
+            attempts = 0
+            while True:
+                attempts += 1
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    raise LLMClientError(f"LLM latency budget exhausted after {attempts - 1} attempt(s).")
+                delivered = False
+                try:
+                    with self.session.post(self.endpoint, json=payload, stream=True,
+                                           timeout=min(self.request_timeout, remaining)) as response:
+                        response.raise_for_status()
+                        content, data = [], {}
+                        for line in response.iter_lines(chunk_size=None):
+                            if not line:
+                                continue
+                            data = json.loads(line)
+                            if "error" in data:
+                                raise LLMClientError(f"LLM stream error: {data['error']}")
+                            content.append(data.get("message", {}).get("content", ""))
+                            delivered = True
+                            on_chunk(data)
+                            if data.get("done"):
+                                break
+                            if time.perf_counter() >= deadline:
+                                raise LLMClientError("LLM latency budget exhausted mid-stream.")
+                    data = dict(data, message={"role": "assistant", "content": "".join(content)})
+                    return LLMCallResult(data, time.perf_counter() - start, queue_wait, attempts)
+                except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                    if delivered:
+                        raise LLMClientError(f"LLM stream broke off: {e}") from e
+                    error = e
+                except requests.exceptions.HTTPError as e:
+                    if e.response is None or e.response.status_code not in RETRYABLE_STATUS_CODES:
+                        raise
+                    error = e
+                self._backoff(attempts, deadline, error)
+        finally:
+            self._release_slot(batch)
+
+    def _backoff(self, attempts, deadline, error):
+        # Full jitter keeps many games from retrying in lockstep
+        delay = random.uniform(0, self.retry_backoff * (2 ** (attempts - 1)))
+        if attempts > self.max_retries or time.perf_counter() + delay >= deadline:
+            raise LLMClientError(f"LLM call failed after {attempts} attempt(s): {error}") from error
+        LLM_RETRIES.inc()
+        logger.warning("LLM call attempt %d failed (%s); retrying in %.0f ms.", attempts, error, delay * 1000)
+        time.sleep(delay)
+
+    def close(self):
+        self.session.close()
@@ -0,0 +1,240 @@
+# Routes LLM calls over a pool of Ollama backends, each with its own model, weight and OllamaClient.
+# A call goes to the backend with the fewest outstanding requests per unit of weight, unless the
+# game's own backend (a weighted rendezvous hash of the game id) is within AFFINITY_SLACK of that:
+# then it stays there, so the game keeps reusing that backend's prompt cache. Every failure feeds
+# the backend's circuit breaker (passive health check) and a background thread polls each
+# backend's /api/tags (active health check); a call whose backend fails moves on to the next best
+# one while its latency budget lasts.
+#
+# Configuration, read by load_config():
+#   UNO_LLM_BACKENDS       JSON (see below), or "url|model|weight" entries separated by commas
+#   UNO_LLM_BACKENDS_FILE  path to a JSON file
+# The JSON is a list of backends, {"url": ..., "model": ..., "weight": ..., "max_concurrent": ...}
+# with only "url" required, or an object {"backends": [...]} that may also set the LLMPool options
+# failure_threshold, cooldown, health_interval and affinity_slack.
+
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+import zlib
+
+import requests
+
+import metrics
+from llm_client import LLMClientError, OllamaClient
+
+logger = logging.getLogger(__name__)
+
+BACKENDS_ENV = "UNO_LLM_BACKENDS"
+BACKENDS_FILE_ENV = "UNO_LLM_BACKENDS_FILE"
+POOL_OPTIONS = ("failure_threshold", "cooldown", "health_interval", "affinity_slack")
+
+LLM_BACKEND_REQUESTS = metrics.counter("uno_llm_backend_requests_total", "LLM calls per pool backend by outcome.",
+                                       ("backend", "outcome"))
+LLM_BACKEND_CIRCUIT_OPENS = metrics.counter("uno_llm_backend_circuit_opens_total",
+                                            "Times a pool backend's circuit breaker opened.", ("backend",))
+LLM_FAILOVERS = metrics.counter("uno_llm_failovers_total", "LLM calls retried on another pool backend after a failure.")
+
+def load_config(environ=None):
+    # Returns the backend pool config as {"backends": [...], ...options}, or None when none is set
+    environ = os.environ if environ is None else environ
+    path = environ.get(BACKENDS_FILE_ENV)
+    if path:
+        with open(path, encoding="utf-8") as f:
+            return parse_config(f.read())
+    value = environ.get(BACKENDS_ENV)
+    return parse_config(value) if value else None
+
+def parse_config(text):
+    text = text.strip()
+    if text.startswith(("[", "{")):
+        config = json.loads(text)
+    else: # url|model|weight,url|model|weight
+        config = []
+        for entry in text.split(","):
+            url, model, weight = (entry.strip().split("|") + ["", ""])[:3]
+            config.append({"url": url, "model": model or None, "weight": float(weight) if weight else 1.0})
+    if isinstance(config, list):
+        config = {"backends": config}
+    if not config.get("backends"):
+        raise ValueError("LLM backend config lists no backends.")
+    for backend in config["backends"]:
+        if not backend.get("url"):
+            raise ValueError(f"LLM backend without a url: {backend}")
+    return config
+
+def health_url(chat_url):
+    # Ollama lists its models on /api/tags, next to /api/chat
+    base = chat_url[:-len("/api/chat")] if chat_url.endswith("/api/chat") else chat_url.rstrip("/")
+    return f"{base}/api/tags"
+
+class Backend:
+    """One pool member: its client plus the load and health state the router reads."""
+
+    __slots__ = ("url", "model", "weight", "client", "outstanding", "healthy", "failures", "open_until", "probing")
+
+    def __init__(self, url, model, weight, client):
+        self.url = url
+        self.model = model # Overrides the payload's model; None keeps it
+        self.weight = weight
+        self.client = client
+        self.outstanding = 0 # Calls in flight
+        self.healthy = True # Last active health check passed
+        self.failures = 0 # Consecutive failed calls
+        self.open_until = 0.0 # Circuit open (no calls) until then; afterwards one probe call is let through
+        self.probing = False # A half-open probe call is in flight
+
+    def load(self):
+        return (self.outstanding + 1) / self.weight
+
+class LLMPool:
+    """Drop-in for OllamaClient's chat() and chat_stream() that spreads calls over several backends."""
+
+    def __init__(self, backends, default_model=None, failure_threshold=3, cooldown=10.0, health_interval=5.0,
+                 affinity_slack=1.0, health_timeout=2.0, **client_options):
+        # backends: dicts as in load_config(); client_options go to each backend's OllamaClient
+        self.failure_threshold = failure_threshold # Consecutive failures that open a circuit
+        self.cooldown = cooldown # Seconds a circuit stays open before a probe call is let through
+        self.affinity_slack = affinity_slack # Extra load (outstanding calls per weight) accepted to stay on a game's backend
+        self.health_timeout = health_timeout
+        self.backends = []
+        for config in backends:
+            options = dict(client_options)
+            if config.get("max_concurrent"):
+                options["max_concurrent"] = config["max_concurrent"]
+            self.backends.append(Backend(config["url"], config.get("model") or default_model,
+                                         float(config.get("weight", 1.0)), OllamaClient(config["url"], **options)))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._health_thread = None
+        if health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, args=(health_interval,),
+                                                   name="llm-health", daemon=True)
+            self._health_thread.start()
+
+    @classmethod
+    def from_config(cls, config, default_model=None, **client_options):
+        options = {name: config[name] for name in POOL_OPTIONS if name in config}
+        return cls(config["backends"], default_model, **options, **client_options)
+
+    def chat(self, payload, latency_budget=None, affinity=None):
+        return self._call(lambda client, payload, budget: client.chat(payload, budget), payload, latency_budget, affinity)
+
+    def chat_stream(self, payload, on_chunk, latency_budget=None, affinity=None):
+        # Fails over only until the first chunk has been handed out, like OllamaClient's retries
+        delivered = []
+        def forward(chunk):
+            delivered.append(True)
+            on_chunk(chunk)
+        return self._call(lambda client, payload, budget: client.chat_stream(payload, forward, budget),
+                          payload, latency_budget, affinity, lambda: bool(delivered))
+
+    def _call(self, send, payload, latency_budget, affinity, delivered=lambda: False):
+        start = time.perf_counter()
+        budget = latency_budget if latency_budget is not None else self.backends[0].client.latency_budget
+        deadline = start + budget
+        tried = set()
+        error = None
+        while True:
+            # Checked before a backend is picked: a call that is never sent must not count against one
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise LLMClientError("LLM latency budget exhausted before a backend answered.") from error
+            backend = self._acquire(affinity, tried)
+            if backend is None:
+                raise LLMClientError(f"No LLM backend available{f' (last error: {error})' if error else ''}.") from error
+            if error is not None:
+                LLM_FAILOVERS.inc()
+            try:
+                result = send(backend.client, dict(payload, model=backend.model) if backend.model else payload, remaining)
+            except requests.exceptions.RequestException as e:
+                self._release(backend, ok=False)
+                LLM_BACKEND_REQUESTS.inc(backend=backend.url, outcome="failure")
+                if delivered() or time.perf_counter() >= deadline:
+                    raise
+                logger.warning("LLM backend %s failed (%s); trying another.", backend.url, e)
+                tried.add(backend)
+                error = e
+                continue
+            except BaseException:
+                self._release(backend, ok=True) # Not the backend's fault (e.g. the chunk callback raised)
+                raise
+            self._release(backend, ok=True)
+            LLM_BACKEND_REQUESTS.inc(backend=backend.url, outcome="success")
+            result.elapsed = time.perf_counter() - start # Failed attempts on other backends included
+            return result
+
+    def _acquire(self, affinity, tried):
+        # Picks a backend for one call and counts it as outstanding; None when none is usable
+        with self._lock:
+            now = time.monotonic()
+            candidates = [b for b in self.backends if b not in tried and b.healthy and not b.probing and now >= b.open_until]
+            if not candidates:
+                return None
+            best = min(candidates, key=lambda b: (b.load(), random.random()))
+            if affinity is not None:
+                home = max(candidates, key=lambda b: rendezvous_score(affinity, b))
+                if home.load() <= best.load() + self.affinity_slack:
+                    best = home
+            best.outstanding += 1
+            if best.open_until: # Half-open: this call is the probe
+                best.probing = True
+            return best
+
+    def _release(self, backend, ok):
+        with self._lock:
+            backend.outstanding -= 1
+            probe, backend.probing = backend.probing, False
+            if ok:
+                backend.failures = 0
+                backend.open_until = 0.0
+                return
+            backend.failures += 1
+            if probe or backend.failures >= self.failure_threshold:
+                backend.open_until = time.monotonic() + self.cooldown
+                LLM_BACKEND_CIRCUIT_OPENS.inc(backend=backend.url)
+                logger.warning("LLM backend %s circuit open for %.0f s after %d failure(s).",
+                               backend.url, self.cooldown, backend.failures)
+
+    def _health_loop(self, interval):
+        while True:
+            for backend in self.backends:
+                self.check_health(backend)
+            if self._stop.wait(interval):
+                return
+
+    def check_health(self, backend):
+        try:
+            response = backend.client.session.get(health_url(backend.url), timeout=self.health_timeout)
+            healthy = response.ok
+        except requests.exceptions.RequestException:
+            healthy = False
+        with self._lock:
+            if healthy != backend.healthy:
+                logger.warning("LLM backend %s is %s.", backend.url, "healthy again" if healthy else "failing health checks")
+            backend.healthy = healthy
+        return healthy
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            return [{"url": b.url, "model": b.model, "weight": b.weight, "outstanding": b.outstanding,
+                     "healthy": b.healthy, "circuit": "closed" if not b.open_until else ("open" if now < b.open_until else "half-open")}
+                    for b in self.backends]
+
+    def close(self):
+        self._stop.set()
+        if self._health_thread is not None:
+            self._health_thread.join()
+        for backend in self.backends:
+            backend.client.close()
+
+def rendezvous_score(key, backend):
+    # Weighted rendezvous (highest random weight) hashing: a key keeps its backend as long as
+    # that backend is usable, and only the keys of a removed backend move
+    h = (zlib.crc32(f"{key}|{backend.url}".encode()) + 1) / 4294967297.0 # In (0, 1)
+    return -backend.weight / math.log(h)
@@ -0,0 +1,315 @@
+# Stand-ins for the AI's LLM client, for offline, repeatable load tests (UNO_LLM_TRANSPORT):
+#   record     passes every call through to the live client and appends its prompt, response and
+#              timing to a corpus
+#   replay     answers from a corpus: the recording of the exact prompt if there is one, else one of
+#              the same canonical game state with its card guid remapped to the current hand, else
+#              a stub move; after the recorded latency, or at once
+#   synthetic  answers with a random legal move after a latency drawn from a distribution, serving
+#              at most `rate` calls per second and failing `error_rate` of them; `slip_rate` of
+#              its answers break the rules unless the request's "format" is a schema
+# Each offers OllamaClient's chat() and chat_stream() and counts into the same LLM metrics.
+#
+# A corpus is JSON lines, gzipped when the path ends in .gz, one call per line:
+#   {"prompt": <last user message>, "content": <assistant message>, "ms": <inference ms>, "ttft_ms": <streamed only>}
+# Only "content" is required, so the simulator's older replay files still load.
+
+import gzip
+import json
+import logging
+import math
+import random
+import threading
+import time
+import zlib
+
+import metrics
+from decision_cache import opponent_count_bucket
+from stub_moves import CHUNK_CHARS, extract_game_state, first_legal_move
+from llm_client import LLM_REQUEST_SECONDS, LLM_REQUESTS, LLMCallResult, LLMClientError
+
+logger = logging.getLogger(__name__)
+
+TRANSPORT_MODES = ("live", "record", "replay", "synthetic")
+LATENCY_DISTRIBUTIONS = ("fixed", "exponential", "lognormal")
+SYNTHETIC_BANTER = ("Synthetic move, real sting!", "Calculated. Probably.", "Your turn to suffer.",
+                    "I had a feeling about this one.", "Nothing personal, just cards.")
+SYNTHETIC_SLIPS = ("card", "color", "action_type") # How a synthetic answer breaks the rules, picked evenly
+
+LLM_REPLAY_LOOKUPS = metrics.counter("uno_llm_replay_lookups_total", "Replayed LLM calls by how the prompt matched the corpus.",
+                                     ("match",))
+
+def open_corpus(path, mode):
+    # mode "r" or "a"; text, gzipped by suffix
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def read_corpus(path):
+    with open_corpus(path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def last_prompt(payload):
+    return payload["messages"][-1]["content"]
+
+def canonical_prompt(state):
+    # What a recorded answer depends on, without card guids: the legal cards, the card and color
+    # to match, the opponent's (bucketed) card count and whether a play leaves one card. The same
+    # situation in another game or seed maps to the same key, and its answer stays legal there.
+    if not state:
+        return None
+    legal = state.get("legal_moves") or {}
+    return json.dumps([sorted(legal.values()), state.get("discard_top_card"), state.get("current_game_color"),
+                       opponent_count_bucket(state.get("opponent_card_count") or 0), state.get("hand_size") == 2],
+                      separators=(",", ":"))
+
+def remap_guid(content, recorded_legal, legal):
+    # Points a recorded response's card at the current hand's card with the same label
+    try:
+        action = json.loads(content)
+        label = recorded_legal.get(str(action.get("card_guid_to_play")))
+    except (json.JSONDecodeError, AttributeError):
+        return content
+    if label is None:
+        return content
+    guid = next((guid for guid, current in legal.items() if current == label), None)
+    if guid is None:
+        return content
+    action["card_guid_to_play"] = int(guid) if isinstance(action["card_guid_to_play"], int) else guid
+    return json.dumps(action)
+
+def response_data(content):
+    return {"message": {"role": "assistant", "content": content}, "done": True}
+
+def stream_content(content, on_chunk, first_chunk_delay, total_delay):
+    # Hands out `content` in token-sized chunks, the first after first_chunk_delay and the last at total_delay
+    pieces = [content[i:i + CHUNK_CHARS] for i in range(0, len(content), CHUNK_CHARS)] or [""]
+    start = time.perf_counter()
+    step = max(0.0, total_delay - first_chunk_delay) / max(1, len(pieces) - 1)
+    for i, piece in enumerate(pieces):
+        delay = first_chunk_delay + i * step - (time.perf_counter() - start)
+        if delay > 0:
+            time.sleep(delay)
+        on_chunk({"message": {"role": "assistant", "content": piece}, "done": False})
+    on_chunk({"message": {"role": "assistant", "content": ""}, "done": True})
+
+class _StandIn:
+    """Shared chat()/chat_stream() plumbing: subclasses return (content, queue wait, first chunk delay, total delay)."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def _answer(self, payload):
+        raise NotImplementedError
+
+    def chat(self, payload, latency_budget=None, affinity=None):
+        return self._call(payload, latency_budget, None)
+
+    def chat_stream(self, payload, on_chunk, latency_budget=None, affinity=None):
+        return self._call(payload, latency_budget, on_chunk)
+
+    def _call(self, payload, latency_budget, on_chunk):
+        start = time.perf_counter()
+        self.calls += 1
+        try:
+            content, queue_wait, first_chunk_delay, total_delay = self._answer(payload)
+            if queue_wait:
+                time.sleep(queue_wait)
+            if latency_budget is not None and queue_wait + total_delay > latency_budget:
+                time.sleep(max(0.0, latency_budget - queue_wait))
+                raise LLMClientError("LLM latency budget exhausted before the stand-in answered.")
+            if on_chunk is None:
+                if total_delay:
+                    time.sleep(total_delay)
+            else:
+                stream_content(content, on_chunk, first_chunk_delay, total_delay)
+        except Exception:
+            LLM_REQUESTS.inc(outcome="failure")
+            raise
+        elapsed = time.perf_counter() - start
+        LLM_REQUESTS.inc(outcome="success")
+        LLM_REQUEST_SECONDS.observe(elapsed)
+        return LLMCallResult(response_data(content), elapsed, queue_wait, 1)
+
+    def close(self):
+        pass
+
+# --- Record ---
+class RecordingTransport:
+    """Wraps a live client and appends every successful call to a corpus."""
+
+    def __init__(self, client, path):
+        self.client = client
+        self.path = path
+        self.records = 0
+        self._file = open_corpus(path, "a")
+        self._lock = threading.Lock()
+
+    def chat(self, payload, latency_budget=None, affinity=None):
+        result = self.client.chat(payload, latency_budget, affinity)
+        self._record(payload, result, None)
+        return result
+
+    def chat_stream(self, payload, on_chunk, latency_budget=None, affinity=None):
+        start = time.perf_counter()
+        first_chunk = []
+        def timed(chunk):
+            if not first_chunk:
+                first_chunk.append(time.perf_counter() - start)
+            on_chunk(chunk)
+        result = self.client.chat_stream(payload, timed, latency_budget, affinity)
+        self._record(payload, result, first_chunk[0] - result.queue_wait if first_chunk else None)
+        return result
+
+    def _record(self, payload, result, ttft):
+        record = {"prompt": last_prompt(payload), "content": result.data.get("message", {}).get("content", ""),
+                  "ms": round((result.elapsed - result.queue_wait) * 1000, 1)} # Backend time; queueing depended on the load while recording
+        if ttft is not None:
+            record["ttft_ms"] = round(ttft * 1000, 1)
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush() # A crash loses at most the call in flight
+            self.records += 1
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+        self.client.close()
+
+# --- Replay ---
+class ReplayTransport(_StandIn):
+    """Answers from a recorded corpus.
+
+    latency: "original" waits as long as the recorded call took (streamed calls: the recorded
+    time to first chunk, then the rest spread over the chunks); "zero" answers at once.
+    on_miss: "stub" answers a prompt matching nothing like the fake Ollama server (first legal
+    move); "hash" picks a recorded response by a hash of the prompt, as the simulator always did.
+    """
+
+    def __init__(self, path=None, latency="original", on_miss="stub"):
+        super().__init__()
+        if latency not in ("original", "zero"):
+            raise ValueError(f"latency must be 'original' or 'zero', got {latency!r}")
+        self.latency = latency
+        self.on_miss = on_miss
+        self.records = read_corpus(path) if path else []
+        self.by_prompt = {}
+        self.by_state = {} # canonical_prompt -> [(record, its legal_moves)]
+        for record in self.records:
+            prompt = record.get("prompt")
+            if prompt is None:
+                continue
+            self.by_prompt.setdefault(prompt, record)
+            state = extract_game_state({"messages": [{"content": prompt}]})
+            key = canonical_prompt(state)
+            if key is not None:
+                self.by_state.setdefault(key, []).append((record, state.get("legal_moves") or {}))
+        self.matches = {"exact": 0, "canonical": 0, "miss": 0}
+        if path:
+            logger.info("Replaying %d recorded LLM call(s) from %s (%d distinct states).", len(self.records), path, len(self.by_state))
+
+    def _answer(self, payload):
+        prompt = last_prompt(payload)
+        record = self.by_prompt.get(prompt)
+        if record is not None:
+            match, content = "exact", record["content"]
+        else:
+            state = extract_game_state(payload)
+            candidates = self.by_state.get(canonical_prompt(state))
+            if candidates:
+                record, recorded_legal = candidates[zlib.crc32(prompt.encode()) % len(candidates)]
+                match, content = "canonical", remap_guid(record["content"], recorded_legal, state.get("legal_moves") or {})
+            else:
+                match, record = "miss", None
+                if self.on_miss == "hash" and self.records:
+                    content = self.records[zlib.crc32(prompt.encode()) % len(self.records)]["content"]
+                else:
+                    content = json.dumps(first_legal_move(payload))
+        self.matches[match] += 1
+        LLM_REPLAY_LOOKUPS.inc(match=match)
+        if self.latency == "zero" or record is None:
+            return content, 0.0, 0.0, 0.0
+        total = record.get("ms", 0.0) / 1000.0
+        return content, 0.0, min(total, record.get("ttft_ms", record.get("ms", 0.0)) / 1000.0), total
+
+# --- Synthetic ---
+class SyntheticTransport(_StandIn):
+    """Plays a random legal move, like a model that always answers in format.
+
+    latency: mean seconds per call, drawn per `distribution` ("fixed", "exponential" or
+    "lognormal" with shape `sigma`); the first chunk of a streamed answer comes after a tenth of it.
+    rate: calls per second the simulated backend starts, 0 for no limit; calls beyond it queue.
+    slip_rate: share of answers that go wrong the way small models do under a plain "format": "json"
+    (a guid that is not a legal move, an unknown color, a misspelt action); a JSON schema in
+    "format" constrains decoding, as Ollama does, so those answers then stay legal.
+    """
+
+    def __init__(self, latency=0.3, distribution="lognormal", rate=0.0, error_rate=0.0, sigma=0.5, seed=None,
+                 slip_rate=0.0):
+        super().__init__()
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"distribution must be one of {LATENCY_DISTRIBUTIONS}, got {distribution!r}")
+        self.latency = latency
+        self.distribution = distribution
+        self.rate = rate
+        self.error_rate = error_rate
+        self.sigma = sigma
+        self.slip_rate = slip_rate
+        self.rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._next_start = 0.0 # perf_counter time the rate limit lets the next call start
+
+    def _delay(self):
+        if self.latency <= 0 or self.distribution == "fixed":
+            return max(0.0, self.latency)
+        if self.distribution == "exponential":
+            return self.rng.expovariate(1.0 / self.latency)
+        return self.rng.lognormvariate(math.log(self.latency) - self.sigma ** 2 / 2, self.sigma) # Mean = latency
+
+    def _answer(self, payload):
+        with self._lock:
+            queue_wait = 0.0
+            if self.rate > 0:
+                now = time.perf_counter()
+                start = max(now, self._next_start)
+                self._next_start = start + 1.0 / self.rate
+                queue_wait = start - now
+            delay = self._delay()
+            failed = self.rng.random() < self.error_rate
+            state = extract_game_state(payload) or {}
+            legal = state.get("legal_moves") or {}
+            guid = self.rng.choice(sorted(legal)) if legal else None
+            color = self.rng.choice(("red", "yellow", "green", "blue"))
+            banter = self.rng.choice(SYNTHETIC_BANTER)
+            slip = self.rng.choice(SYNTHETIC_SLIPS) if self.rng.random() < self.slip_rate else None
+            stray_guid = str(self.rng.randrange(108))
+        if failed:
+            time.sleep(queue_wait + delay)
+            raise LLMClientError("Synthetic LLM backend error.")
+        if guid is None:
+            action = {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None, "call_uno": False}
+        else:
+            action = {"action_type": "PLAY_CARD", "card_guid_to_play": guid,
+                      "declared_color": color if legal[guid].startswith("black") else None,
+                      "call_uno": state.get("hand_size") == 2}
+        if slip is not None and not isinstance(payload.get("format"), dict):
+            if slip == "card" and stray_guid not in legal:
+                action.update(action_type="PLAY_CARD", card_guid_to_play=stray_guid)
+            elif slip == "color" and guid is not None:
+                action["declared_color"] = "wild" if legal[guid].startswith("black") else "purple"
+            elif slip == "action_type":
+                action["action_type"] = "PLAY" if guid is not None else "DRAW"
+        action["banter"] = banter
+        return json.dumps(action), queue_wait, delay / 10, delay
+
+def make_transport(mode, live_client, corpus=None, replay_latency="original", **synthetic_options):
+    # The client the AI should call for `mode`; live_client is used as is for "live" and wrapped for "record"
+    if mode == "live":
+        return live_client
+    if mode == "record":
+        return RecordingTransport(live_client, corpus)
+    if mode == "replay":
+        return ReplayTransport(corpus, replay_latency)
+    if mode == "synthetic":
+        return SyntheticTransport(**synthetic_options)
+    raise ValueError(f"LLM transport must be one of {TRANSPORT_MODES}, got {mode!r}")
@@ -0,0 +1,203 @@
+# Monte Carlo move evaluator for the AI player (optional; needs NumPy).
+# Scores each legal move by sampling the hidden information - the opponent's hand and the order
+# of the draw pile - from the cards the AI has not seen: the full deck minus its own hand and the
+# discard pile. Every sample is played out a fixed number of turns with the heuristic policy for
+# both players, vectorized over all samples and candidate moves at once. Each hand is a bitboard
+# of two uint64 words, bits ordered by heuristic rank, so a player's move is the lowest bit of
+# hand & playable-cards mask and hand sizes and color counts come from popcounts.
+# Sampling runs in rounds until a per-turn CPU time budget is spent.
+
+import json
+import time
+
+try:
+    import numpy as np
+except ImportError: # Optional dependency: without NumPy the evaluator is unavailable
+    np = None
+
+from cards import BLACK, CARD_COLOR, CARD_DRAW_PENALTY, CARD_MATCH_MASK, CARD_VALUE, COLORS, DECK_SIZE
+from heuristic import most_held_color, value_rank
+
+AVAILABLE = np is not None
+NO_COLOR = BLACK # Color index used for "no chosen color" in the tables below
+_COLOR_STATES = len(COLORS) + 1
+
+def _pack(card_sets):
+    # Bitboards: each boolean row indexed by card id becomes two little-endian uint64 words,
+    # with bits in slot order (see _SLOT_CARD)
+    packed = np.packbits(card_sets[..., _SLOT_CARD], axis=-1, bitorder="little")
+    padded = np.zeros(packed.shape[:-1] + (16,), dtype=np.uint8)
+    padded[..., :packed.shape[-1]] = packed
+    return padded.view("<u8")
+
+if AVAILABLE:
+    _CARD_COLOR = np.array(CARD_COLOR, dtype=np.int8)
+    _CARD_PENALTY = np.array(CARD_DRAW_PENALTY, dtype=np.int8)
+    _CARD_IS_BLACK = _CARD_COLOR == BLACK
+    # Bits are ordered by heuristic rank, then card id: the lowest legal bit is the card
+    # heuristic.choose_move would play (less its same-rank color preference)
+    _SLOT_CARD = np.array(sorted(range(DECK_SIZE), key=lambda card: (value_rank(CARD_VALUE[card]), card)))
+    _CARD_SLOT = np.argsort(_SLOT_CARD)
+    _SLOT_WORD = np.arange(DECK_SIZE) >> 6
+    _SLOT_BIT = np.left_shift(np.uint64(1), (np.arange(DECK_SIZE) & 63).astype(np.uint64))
+    _color_sets = np.array([[CARD_COLOR[card] == color for card in range(DECK_SIZE)] for color in range(len(COLORS))])
+    _COLOR_BITS = _pack(_color_sets) # [color] -> bitboard
+    # _VALID_BITS[top * 5 + chosen color] -> bitboard of the playable cards; mirrors cards.is_valid_play
+    _valid = np.array([[CARD_MATCH_MASK[top] & CARD_MATCH_MASK[card] != 0 for card in range(DECK_SIZE)]
+                       for top in range(DECK_SIZE)])
+    _valid = np.repeat(_valid[:, None, :], _COLOR_STATES, axis=1)
+    for _top in np.nonzero(_CARD_IS_BLACK)[0]:
+        _valid[_top, :len(COLORS)] = _color_sets
+        _valid[_top, NO_COLOR] = False
+    _valid[:, :, _CARD_IS_BLACK] = True
+    _VALID_BITS = _pack(_valid).reshape(DECK_SIZE * _COLOR_STATES, 2)
+    _POPCOUNT = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int16)
+
+class MoveEvaluation:
+    """Ranking of the legal moves, best first; a card id of None stands for drawing a card."""
+
+    __slots__ = ("ranking", "samples", "cpu_time")
+
+    def __init__(self, ranking, samples, cpu_time):
+        self.ranking = ranking # [(card or None, score, win_rate)], best first
+        self.samples = samples # Rollouts per candidate
+        self.cpu_time = cpu_time # Seconds of this thread's CPU time
+
+    def to_action(self, hand):
+        # The best move as an LLM-style action
+        card = self.ranking[0][0]
+        if card is None:
+            return {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None,
+                    "call_uno": False, "banter": "Ran the numbers, drawing ..."}
+        declared_color = COLORS[declared_color_for(hand, card)] if CARD_COLOR[card] == BLACK else None
+        return {"action_type": "PLAY_CARD", "card_guid_to_play": card, "declared_color": declared_color,
+                "call_uno": len(hand) == 2, "banter": "Ran the numbers ..."}
+
+    def prompt_hint(self):
+        # One sentence for the LLM prompt: estimated win chances, best first
+        chances = {("draw" if card is None else str(card)): round(score, 2) for card, score, _ in self.ranking}
+        return f" Simulated win chances of your moves, best first: {json.dumps(chances, separators=(',', ':'))}."
+
+def declared_color_for(hand, card):
+    # The color the AI declares with a wild: the one it holds most of afterwards
+    return most_held_color([c for c in hand if c != card])
+
+def unseen_cards(hand, seen_cards):
+    # Cards that are either in the opponent's hand or in the draw pile
+    known = set(hand)
+    known.update(seen_cards)
+    return [card for card in range(DECK_SIZE) if card not in known]
+
+def _draw(hands, sizes, deck, pointer, rows):
+    # Moves the next draw-pile card (a slot) of each row in `rows` into that row's hand, if any are left
+    rows = rows[pointer[rows] < deck.shape[1]]
+    slots = deck[rows, pointer[rows]]
+    hands[rows, _SLOT_WORD[slots]] |= _SLOT_BIT[slots]
+    sizes[rows] += 1
+    pointer[rows] += 1
+
+def _rollouts(hand, candidates, top_card, chosen_color, unseen, opponent_card_count, samples, horizon, rng):
+    # Returns (score, win) arrays of shape (len(candidates), samples). Every candidate is played
+    # against the same sampled worlds, so their differences are not sampling noise.
+    n_candidates = len(candidates)
+    worlds = rng.permuted(np.tile(np.asarray(unseen, dtype=np.int16), (samples, 1)), axis=1)
+    worlds = np.tile(worlds, (n_candidates, 1))
+    rows = worlds.shape[0]
+    all_rows = np.arange(rows)
+
+    opponent = np.zeros((rows, DECK_SIZE), dtype=bool)
+    opponent[all_rows[:, None], worlds[:, :opponent_card_count]] = True
+    mine = np.zeros(DECK_SIZE, dtype=bool)
+    mine[list(hand)] = True
+    hands = np.stack([np.broadcast_to(_pack(mine), (rows, 2)), _pack(opponent)]) # 0: the AI, 1: its opponent
+    sizes = np.array([np.full(rows, len(hand)), np.full(rows, opponent_card_count)], dtype=np.int16)
+    deck = _CARD_SLOT[worlds[:, opponent_card_count:]]
+    pointer = np.zeros(rows, dtype=np.int32)
+    tops = np.full(rows, top_card, dtype=np.intp)
+    colors = np.full(rows, NO_COLOR if chosen_color is None else chosen_color, dtype=np.intp)
+    pending = np.zeros(rows, dtype=np.int8)
+    winner = np.full(rows, -1, dtype=np.int8)
+
+    # The AI's candidate move
+    for index, card in enumerate(candidates):
+        block = all_rows[index * samples:(index + 1) * samples]
+        if card is None:
+            _draw(hands[0], sizes[0], deck, pointer, block)
+            continue
+        slot = _CARD_SLOT[card]
+        hands[0][block, _SLOT_WORD[slot]] ^= _SLOT_BIT[slot]
+        sizes[0][block] -= 1
+        tops[block] = card
+        colors[block] = declared_color_for(hand, card) if CARD_COLOR[card] == BLACK else CARD_COLOR[card]
+        pending[block] = CARD_DRAW_PENALTY[card]
+        if len(hand) == 1:
+            winner[block] = 0
+
+    # Both players then follow the heuristic policy: serve the penalty, play the best legal card or draw one
+    player = 1
+    for _ in range(horizon):
+        alive = np.nonzero(winner < 0)[0]
+        if len(alive) == 0:
+            break
+        player_hands, player_sizes = hands[player], sizes[player]
+        for drawn in range(int(pending[alive].max(initial=0))):
+            _draw(player_hands, player_sizes, deck, pointer, alive[pending[alive] > drawn])
+        pending[alive] = 0
+
+        legal = player_hands[alive] & _VALID_BITS[tops[alive] * _COLOR_STATES + colors[alive]]
+        word = (legal[:, 0] == 0).astype(np.intp)
+        bits = legal[np.arange(len(alive)), word]
+        has_move = bits != 0
+        playing, word, bits = alive[has_move], word[has_move], bits[has_move]
+        lowest = bits & (~bits + np.uint64(1))
+        slots = word * 64 + np.log2(lowest.astype(np.float64)).astype(np.intp) # Exact: lowest is a power of two
+        cards = _SLOT_CARD[slots]
+
+        player_hands[playing, word] ^= lowest
+        player_sizes[playing] -= 1
+        tops[playing] = cards
+        colors[playing] = _CARD_COLOR[cards]
+        wild = _CARD_IS_BLACK[cards]
+        if wild.any():
+            held = player_hands[playing[wild]][:, None, :] & _COLOR_BITS # (rows, colors, words)
+            counts = _POPCOUNT[held.view(np.uint8)].sum(axis=2)
+            colors[playing[wild]] = np.argmax(counts, axis=1) # Ties go to the earlier color, like most_held_color
+        pending[playing] = _CARD_PENALTY[cards]
+        winner[playing[player_sizes[playing] == 0]] = player
+        _draw(player_hands, player_sizes, deck, pointer, alive[~has_move])
+        player ^= 1
+
+    # A win scores 1 and a loss 0; an unfinished game scores by its share of the cards still held
+    mine, theirs = sizes[0].astype(np.float64), sizes[1].astype(np.float64)
+    score = np.where(winner == 0, 1.0, np.where(winner == 1, 0.0, 0.5 + (theirs - mine) / (2 * np.maximum(mine + theirs, 1))))
+    return score.reshape(n_candidates, samples), (winner == 0).reshape(n_candidates, samples)
+
+def evaluate_moves(hand, legal_moves, top_card, chosen_color, seen_cards, opponent_card_count,
+                   budget=0.05, horizon=12, batch=256, max_samples=8192, seed=None):
+    # Ranks drawing and every legal card. `seen_cards` is the discard pile; `budget` is seconds of
+    # this thread's CPU time. The first batch always runs; another only if it should fit the budget.
+    if not AVAILABLE:
+        raise RuntimeError("The Monte Carlo evaluator needs NumPy (pip install numpy).")
+    start = time.thread_time()
+    rng = np.random.default_rng(seed)
+    candidates = list(legal_moves) + [None]
+    unseen = unseen_cards(hand, seen_cards)
+    opponent_card_count = min(opponent_card_count, len(unseen))
+
+    score_sums = np.zeros(len(candidates))
+    wins = np.zeros(len(candidates))
+    samples = batches = 0
+    while samples < max_samples:
+        score, won = _rollouts(hand, candidates, top_card, chosen_color, unseen, opponent_card_count, batch, horizon, rng)
+        score_sums += score.sum(axis=1)
+        wins += won.sum(axis=1)
+        samples += batch
+        batches += 1
+        elapsed = time.thread_time() - start
+        if elapsed + elapsed / batches > budget:
+            break
+
+    ranking = sorted(((card, score_sums[i] / samples, wins[i] / samples) for i, card in enumerate(candidates)),
+                     key=lambda entry: -entry[1])
+    return MoveEvaluation([(card, float(score), float(win)) for card, score, win in ranking], samples,
+                          time.thread_time() - start)
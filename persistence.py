@@ -0,0 +1,533 @@
+# Crash-safe persistence for games: an append-only event log plus periodic snapshots.
+# GameState records compact events under its lock (the deal, plays, draws, reshuffles as card
+# layouts, AI decisions) and journal_commit() turns each state change into one binary record,
+# together with the turn, direction, penalty, color and banter fields whenever they change.
+# A writer thread appends records in groups and fsyncs once per group (group commit), so the
+# changes of many games share one fsync. A snapshot switches the log to a new segment and writes
+# every game as a single record; on startup the newest snapshot is loaded and the segments from
+# it on are replayed, skipping records a game's snapshot already covers.
+#
+# Files in the store directory:
+#   events-<n>.log    log segments, n counting up
+#   snapshot-<n>.bin  every game as of the start of segment n; older segments and snapshots are then deleted
+# Both are an 8-byte magic followed by records: <u32 body length><u32 crc32 of the body><body>.
+# A torn record at the end of a segment (a crash mid-write) ends its replay and is truncated.
+#
+# GameSpill keeps games that GameEngine evicted for its resident cap, one snapshot-format record
+# per file, until they are requested again; snapshots include them.
+
+import contextlib
+import logging
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+
+import metrics
+from cards import DrawPile
+from game_engine import GameState
+
+logger = logging.getLogger(__name__)
+
+LOG_MAGIC = b"UNOLOG01"
+SNAPSHOT_MAGIC = b"UNOSNP01"
+SYNC_MODES = ("commit", "batch", "none")
+WAIT_TIMEOUT = 10.0 # seconds a "commit" wait() gives the writer before the request fails
+_fdatasync = getattr(os, "fdatasync", os.fsync) # No fdatasync on macOS or Windows
+
+_RECORD_HEADER = struct.Struct("<II") # body length, crc32
+_BODY_HEADER = struct.Struct("<IIH") # after the game id: journal seq, state version, event count
+_FIELDS = struct.Struct("<BbHBBBB") # player index, direction, pending draw, flags, color, top card, winner index
+NONE = 255 # Stands for None in one-byte fields
+
+EVENT_CREATE, EVENT_LAYOUT, EVENT_DRAW, EVENT_PLAY, EVENT_FIELDS, EVENT_BANTER, EVENT_DECISION, EVENT_REMOVE = range(1, 9)
+_EVENT_CODES = {"create": EVENT_CREATE, "layout": EVENT_LAYOUT, "draw": EVENT_DRAW, "play": EVENT_PLAY,
+                "fields": EVENT_FIELDS, "banter": EVENT_BANTER, "decision": EVENT_DECISION, "remove": EVENT_REMOVE}
+
+PERSIST_RECORDS = metrics.counter("uno_persist_records_total", "Game state changes written to the event log.")
+PERSIST_BYTES = metrics.counter("uno_persist_bytes_total", "Bytes written to the event log.")
+PERSIST_FLUSH_SECONDS = metrics.histogram("uno_persist_flush_seconds", "Event log group commits: write plus fsync.")
+PERSIST_SNAPSHOT_SECONDS = metrics.histogram("uno_persist_snapshot_seconds", "Time to write a snapshot of every game.")
+PERSIST_FAILURES = metrics.counter("uno_persist_failures_total", "Event log write errors; the first one stops journaling.")
+
+class PersistError(RuntimeError):
+    """A change could not be made durable: the event log writer failed, or did not keep up."""
+
+# --- Encoding ---
+def _optional(value):
+    return NONE if value is None else value
+
+def _short_string(text):
+    data = text.encode("utf-8")[:255]
+    return bytes((len(data),)) + data
+
+def _card_list(cards):
+    return bytes((len(cards),)) + bytes(cards)
+
+def encode_record(game_id, seq, version, players, events):
+    # One journal commit as a framed record; players resolves player names to seat indexes
+    parts = [_short_string(game_id), _BODY_HEADER.pack(seq, version, len(events))]
+    for event in events:
+        kind = event[0]
+        code = bytes((_EVENT_CODES[kind],))
+        if kind == "draw":
+            parts.append(code + struct.pack("<BH", players.index(event[1]), event[2]))
+        elif kind == "play":
+            parts.append(code + bytes((players.index(event[1]), event[2], _optional(event[3]))))
+        elif kind == "fields":
+            index, direction, pending, awaiting, started, color, top, winner = event[1]
+            parts.append(code + _FIELDS.pack(index, direction, pending, awaiting | started << 1, _optional(color),
+                                             _optional(top), NONE if winner is None else players.index(winner)))
+        elif kind == "banter":
+            data = event[1].encode("utf-8")[:65535]
+            parts.append(code + struct.pack("<H", len(data)) + data)
+        elif kind == "layout":
+            parts.append(code + _card_list(event[1]) + _card_list(event[2]) + bytes((len(event[3]),))
+                         + b"".join(_card_list(hand) for hand in event[3]))
+        elif kind == "create":
+            parts.append(code + bytes((len(event[1]),)) + b"".join(_short_string(player) for player in event[1]))
+        elif kind == "decision":
+            parts.append(code + bytes((players.index(event[1]),)) + _short_string(event[2]))
+        else: # remove
+            parts.append(code)
+    body = b"".join(parts)
+    return _RECORD_HEADER.pack(len(body), zlib.crc32(body)) + body
+
+def encode_game(game):
+    # The whole game as one record, for snapshots. Caller holds game.lock.
+    events = [("create", tuple(game.players)),
+              ("layout", tuple(game.draw_pile.cards), tuple(game.draw_pile.discard),
+               tuple(tuple(game.player_hands.get(player, ())) for player in game.players)),
+              ("fields", game.journal_fields()),
+              ("banter", game.ai_last_banter)]
+    return encode_record(game.game_id, game.journal_seq, game.version, game.players, events)
+
+def read_records(data, pos):
+    # Returns (record bodies, end offset); stops at the first short or corrupt record
+    bodies = []
+    size = len(data)
+    while pos + _RECORD_HEADER.size <= size:
+        length, crc = _RECORD_HEADER.unpack_from(data, pos)
+        start = pos + _RECORD_HEADER.size
+        body = data[start:start + length]
+        if len(body) < length or zlib.crc32(body) != crc:
+            break
+        bodies.append(body)
+        pos = start + length
+    return bodies, pos
+
+def _read_string(body, pos):
+    length = body[pos]
+    return body[pos + 1:pos + 1 + length].decode("utf-8"), pos + 1 + length
+
+def _read_cards(body, pos):
+    length = body[pos]
+    return list(body[pos + 1:pos + 1 + length]), pos + 1 + length
+
+# --- Replay ---
+def apply_record(games, body):
+    # Applies one record to `games` (game id -> GameState); records a game has already seen are skipped
+    game_id, pos = _read_string(body, 0)
+    seq, version, count = _BODY_HEADER.unpack_from(body, pos)
+    pos += _BODY_HEADER.size
+    game = games.get(game_id)
+    if game is not None and seq <= game.journal_seq:
+        return
+    for _ in range(count):
+        code = body[pos]
+        pos += 1
+        if code == EVENT_CREATE:
+            players = []
+            n_players = body[pos]
+            pos += 1
+            for _ in range(n_players):
+                player, pos = _read_string(body, pos)
+                players.append(player)
+            game = games[game_id] = GameState(game_id, players)
+        elif code == EVENT_REMOVE:
+            games.pop(game_id, None)
+            return
+        elif game is None: # Its create record is gone with an older segment; nothing to apply to
+            return
+        elif code == EVENT_DRAW:
+            player, amount = struct.unpack_from("<BH", body, pos)
+            pos += 3
+            game.draw_cards(game.players[player], amount)
+        elif code == EVENT_PLAY:
+            player, card, color = body[pos], body[pos + 1], body[pos + 2]
+            pos += 3
+            game.play_card(game.players[player], card, None if color == NONE else color)
+        elif code == EVENT_FIELDS:
+            index, direction, pending, flags, color, top, winner = _FIELDS.unpack_from(body, pos)
+            pos += _FIELDS.size
+            game.current_player_index, game.play_direction, game.pending_draw_amount = index, direction, pending
+            game.awaiting_color_choice, game.game_started = bool(flags & 1), bool(flags & 2)
+            game.current_chosen_color = None if color == NONE else color
+            game.discard_pile_top_card = None if top == NONE else top
+            game.game_winner = None if winner == NONE else game.players[winner]
+        elif code == EVENT_BANTER:
+            (length,) = struct.unpack_from("<H", body, pos)
+            game.ai_last_banter = body[pos + 2:pos + 2 + length].decode("utf-8")
+            pos += 2 + length
+        elif code == EVENT_LAYOUT:
+            cards, pos = _read_cards(body, pos)
+            discard, pos = _read_cards(body, pos)
+            hands = []
+            n_hands = body[pos]
+            pos += 1
+            for _ in range(n_hands):
+                hand, pos = _read_cards(body, pos)
+                hands.append(hand)
+            game.draw_pile = DrawPile(cards, discard)
+            game.player_hands = dict(zip(game.players, hands))
+        elif code == EVENT_DECISION: # Audit only
+            _, pos = _read_string(body, pos + 1)
+        else:
+            raise ValueError(f"Unknown event code {code} in the record for game {game_id}")
+    game.journal_seq = seq
+    game.version = version
+
+# --- Spill ---
+_SPILL_NAME = re.compile(r"[\w-]{1,64}") # Game ids come from URLs; nothing else becomes a file name
+
+class GameSpill:
+    """Games evicted from memory by GameEngine's resident cap, one file each, loaded back on demand.
+
+    Writes skip fsync: durability is the event log's job. A file stays after its game is loaded
+    back (it is overwritten at the next spill and deleted with the game), so a snapshot listing
+    the registry and then this directory cannot miss a game moving between the two.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, game_id):
+        return os.path.join(self.directory, f"{game_id}.bin")
+
+    def save(self, game):
+        # Caller holds game.lock
+        game.journal_commit() # Pending events would otherwise be lost with the evicted GameState
+        path = self._path(game.game_id)
+        with open(path + ".tmp", "wb") as f:
+            f.write(encode_game(game))
+        os.replace(path + ".tmp", path)
+
+    def load(self, game_id):
+        # The spilled game as a new GameState, or None
+        if not _SPILL_NAME.fullmatch(game_id):
+            return None
+        try:
+            with open(self._path(game_id), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        bodies, end = read_records(data, 0)
+        if len(bodies) != 1 or end != len(data):
+            logger.warning("Ignoring corrupt spill file %s.", self._path(game_id))
+            return None
+        games = {}
+        apply_record(games, bodies[0])
+        return games.get(game_id)
+
+    def discard(self, game_id):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._path(game_id))
+
+    def expired(self, max_age):
+        # (game id, age in seconds, stamp) of the games spilled more than max_age seconds ago
+        now = time.time()
+        found = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".bin"):
+                    with contextlib.suppress(FileNotFoundError):
+                        stat = entry.stat()
+                        if now - stat.st_mtime > max_age:
+                            found.append((entry.name[:-4], now - stat.st_mtime, stat.st_mtime_ns))
+        return found
+
+    def stamp(self, game_id):
+        # Changes whenever the game is spilled again; None once its file is gone
+        try:
+            return os.stat(self._path(game_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def records(self):
+        # Every spilled game's record, for snapshots
+        records = []
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".bin"):
+                    with contextlib.suppress(FileNotFoundError), open(entry.path, "rb") as f:
+                        records.append(f.read())
+        return records
+
+    def __len__(self):
+        with os.scandir(self.directory) as entries:
+            return sum(1 for entry in entries if entry.name.endswith(".bin"))
+
+# --- Store ---
+class _Rotate:
+    __slots__ = ("segment",)
+
+    def __init__(self, segment):
+        self.segment = segment
+
+class GameStore:
+    """Event log and snapshots for the games of one GameEngine (see the module comment).
+
+    sync: "commit" makes journal.wait() block until the record is fsynced, so a response is only
+    sent for a durable change; "batch" fsyncs every group in the background without waiting;
+    "none" leaves flushing to the OS. A write error stops the log for good: it is logged and every
+    wait() from then on raises PersistError, so requests fail instead of hanging.
+    """
+
+    def __init__(self, directory, sync="commit", snapshot_interval=60.0, snapshot_records=200000):
+        if sync not in SYNC_MODES:
+            raise ValueError(f"sync must be one of {SYNC_MODES}, got {sync!r}")
+        self.directory = directory
+        self.sync = sync
+        self.snapshot_interval = snapshot_interval # Seconds between snapshots while games change
+        self.snapshot_records = snapshot_records # Records after which a snapshot is taken early
+        os.makedirs(directory, exist_ok=True)
+        self.engine = None
+        self.flushes = 0 # Group commits so far
+        self.records = 0
+        self._cond = threading.Condition()
+        self._buffer = [] # Encoded records and _Rotate markers, in append order
+        self._appended = 0 # Tickets handed out
+        self._durable = 0 # Tickets written (and fsynced unless sync is "none")
+        self._failure = None # The OSError that stopped the writer; every wait() raises from then on
+        self._segment = None # Segment being written
+        self._next_segment = 0
+        self._file = None
+        self._records_since_snapshot = 0
+        self._snapshot_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _path(self, kind, n):
+        return os.path.join(self.directory, f"{kind}-{n:08d}.{'log' if kind == 'events' else 'bin'}")
+
+    def _files(self, kind):
+        pattern = re.compile(rf"{kind}-(\d{{8}})\.(log|bin)$")
+        return sorted(int(m.group(1)) for m in map(pattern.match, os.listdir(self.directory)) if m)
+
+    # --- Startup ---
+    def open(self, engine):
+        # Rebuilds the engine's games from disk, then starts journaling every game to a new segment.
+        # Returns the recovered games.
+        games, replayed = self.recover()
+        self.engine = engine
+        for game in games.values():
+            game.attach_journal(self)
+            engine.add_game(game)
+        engine.journal = self
+        self._start_segment(self._next_segment)
+        self._next_segment += 1
+        for target, name in ((self._writer_loop, "persist-writer"), (self._snapshot_loop, "persist-snapshot")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if replayed:
+            self.snapshot() # Next startup starts from here instead of replaying the same tail again
+        return list(games.values())
+
+    def recover(self):
+        # Returns ({game id: GameState}, log records replayed) from the newest snapshot and the log after it
+        start = time.perf_counter()
+        games = {}
+        snapshots, segments = self._files("snapshot"), self._files("events")
+        first_segment = segments[0] if segments else 0
+        if snapshots:
+            first_segment = snapshots[-1]
+            with open(self._path("snapshot", first_segment), "rb") as f:
+                data = f.read()
+            if data[:len(SNAPSHOT_MAGIC)] != SNAPSHOT_MAGIC:
+                raise ValueError(f"{self._path('snapshot', first_segment)} is not a snapshot")
+            bodies, end = read_records(data, len(SNAPSHOT_MAGIC))
+            if end != len(data):
+                raise ValueError(f"{self._path('snapshot', first_segment)} is corrupt at byte {end}")
+            for body in bodies:
+                apply_record(games, body)
+        replayed = 0
+        for segment in segments:
+            if segment < first_segment:
+                continue
+            path = self._path("events", segment)
+            with open(path, "rb") as f:
+                data = f.read()
+            if data[:len(LOG_MAGIC)] != LOG_MAGIC:
+                logger.warning("Skipping %s: no log header.", path)
+                continue
+            bodies, end = read_records(data, len(LOG_MAGIC))
+            for body in bodies:
+                apply_record(games, body)
+            replayed += len(bodies)
+            if end != len(data):
+                logger.warning("Truncating %s: %d bytes after the last whole record.", path, len(data) - end)
+                with open(path, "r+b") as f:
+                    f.truncate(end)
+        self._next_segment = max(snapshots + segments, default=-1) + 1
+        logger.info("Recovered %d game(s) from %s in %.0f ms (%d log record(s) replayed).",
+                    len(games), self.directory, (time.perf_counter() - start) * 1000, replayed)
+        return games, replayed
+
+    # --- Writing ---
+    def append(self, game_id, seq, version, players, events):
+        # Called under the game's lock, so a game's records reach the log in order. Returns a ticket for wait().
+        record = encode_record(game_id, seq, version, players, events)
+        with self._cond:
+            if self._failure is None: # Nothing drains the buffer once the writer has failed
+                self._buffer.append(record)
+            self._appended += 1
+            self._records_since_snapshot += 1
+            self._cond.notify_all()
+            return self._appended
+
+    def wait(self, ticket, timeout=WAIT_TIMEOUT):
+        # In "commit" mode, blocks until the record behind `ticket` is on disk. Raises PersistError
+        # once the writer has failed (in any mode), or if the record is not durable within `timeout`.
+        with self._cond:
+            if self.sync == "commit":
+                self._cond.wait_for(lambda: self._durable >= ticket or self._failure is not None, timeout)
+            if self._failure is not None:
+                raise PersistError(f"Event log in {self.directory} failed: {self._failure}")
+            if self.sync == "commit" and self._durable < ticket:
+                raise PersistError(f"Event log in {self.directory} did not write the change within {timeout:g} s")
+
+    def _start_segment(self, segment):
+        if self._file is not None:
+            self._file.close()
+        self._file = open(self._path("events", segment), "ab", buffering=0)
+        if self._file.tell() == 0:
+            self._file.write(LOG_MAGIC)
+        self._segment = segment
+
+    def _writer_loop(self):
+        # Group commit: everything appended while the previous group was being written goes out
+        # in one write and one fsync
+        while True:
+            with self._cond:
+                while not self._buffer and not self._stop.is_set():
+                    self._cond.wait()
+                if not self._buffer:
+                    return
+                batch, self._buffer = self._buffer, []
+                last = self._appended
+            start = time.perf_counter()
+            pending = []
+            try:
+                for item in batch:
+                    if isinstance(item, _Rotate):
+                        self._write(pending)
+                        pending = []
+                        self._start_segment(item.segment)
+                    else:
+                        pending.append(item)
+                self._write(pending)
+            except OSError as e:
+                # The log may now end in a torn record, so nothing more is appended after it;
+                # recovery truncates it. Requests fail fast until the process is restarted.
+                logger.exception("Writing the event log in %s failed; journaled changes will be refused", self.directory)
+                PERSIST_FAILURES.inc()
+                with self._cond:
+                    self._failure = e
+                    self._buffer = []
+                    self._cond.notify_all()
+                return
+            PERSIST_FLUSH_SECONDS.observe(time.perf_counter() - start)
+            with self._cond:
+                self._durable = last
+                self.flushes += 1
+                self._cond.notify_all()
+
+    def _write(self, records):
+        if records:
+            data = b"".join(records)
+            self._file.write(data)
+            self.records += len(records)
+            PERSIST_RECORDS.inc(len(records))
+            PERSIST_BYTES.inc(len(data))
+        if self.sync != "none":
+            _fdatasync(self._file.fileno())
+
+    # --- Snapshots ---
+    def _snapshot_loop(self):
+        last = time.monotonic()
+        while not self._stop.wait(min(1.0, self.snapshot_interval)):
+            with self._cond:
+                pending = self._records_since_snapshot
+            due = time.monotonic() - last >= self.snapshot_interval
+            if pending >= self.snapshot_records or (due and pending):
+                try:
+                    self.snapshot()
+                except (OSError, PersistError):
+                    logger.exception("Snapshot of %s failed", self.directory)
+                last = time.monotonic()
+
+    def snapshot(self):
+        # Switches the log to a new segment, writes every game to snapshot-<segment>, then drops
+        # the files it supersedes. Records of the new segment that a game's snapshot already
+        # includes are skipped on replay by their journal seq.
+        with self._snapshot_lock:
+            start = time.perf_counter()
+            with self._cond:
+                segment = self._next_segment
+                self._next_segment += 1
+                self._buffer.append(_Rotate(segment))
+                self._records_since_snapshot = 0
+                self._cond.notify_all()
+            # Spilled games first: a file can be a stale copy of a game that was reloaded since,
+            # and the resident game's newer record then replaces it on replay
+            records = self.engine.spill.records() if self.engine.spill is not None else []
+            for game in self.engine.games():
+                with game.lock:
+                    # Pending events go to the new segment first, so the snapshot's journal seq
+                    # covers every change it contains and replay skips them
+                    game.journal_commit()
+                    records.append(encode_game(game))
+            path = self._path("snapshot", segment)
+            with open(path + ".tmp", "wb") as f:
+                f.write(SNAPSHOT_MAGIC)
+                f.write(b"".join(records))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(path + ".tmp", path)
+            self._fsync_directory()
+            with self._cond: # The writer must be done with the old segments before they go
+                self._cond.wait_for(lambda: (self._segment is not None and self._segment >= segment)
+                                    or self._failure is not None)
+                if self._failure is not None: # The old segments may still hold what the new one lacks
+                    raise PersistError(f"Event log in {self.directory} failed: {self._failure}")
+            for kind in ("events", "snapshot"):
+                for n in self._files(kind):
+                    if n < segment:
+                        os.remove(self._path(kind, n))
+            PERSIST_SNAPSHOT_SECONDS.observe(time.perf_counter() - start)
+            logger.info("Snapshot of %d game(s) written to %s in %.0f ms.", len(records), path,
+                        (time.perf_counter() - start) * 1000)
+            return path
+
+    def _fsync_directory(self):
+        if hasattr(os, "O_DIRECTORY"):
+            fd = os.open(self.directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        # Writes out everything appended so far and stops the threads
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        for thread in self._threads:
+            thread.join()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
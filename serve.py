@@ -0,0 +1,193 @@
+# Production serving: several worker processes, each owning a shard of the games, instead of
+# app.run()'s single debug process. A consistent hash ring over the game id names the worker
+# that owns a game, so its state, lock and AI turns stay in that one process.
+#
+# All workers accept on the shared public socket, and a request for a game owned by another
+# worker is forwarded to that worker's private port on 127.0.0.1. New games never need a hop:
+# a worker only hands out game ids that hash to itself. Each worker keeps its own /metrics and,
+# with UNO_PERSIST_DIR or UNO_SPILL_DIR set, its own files in <dir>/shard-<n> (so keep --workers
+# fixed for a persisted directory: a different count reshuffles ownership). A worker that dies
+# is restarted on the same shard. POSIX only (fork).
+# Usage:
+#   python serve.py [--host 127.0.0.1] [--port 5000] [--workers N] [--ai-mode llm]
+
+import argparse
+import bisect
+import hashlib
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import threading
+from urllib.parse import quote
+
+import requests
+from werkzeug.serving import make_server
+
+logger = logging.getLogger(__name__)
+
+# --- Sharding Configuration ---
+SHARD_VNODES = 64 # Ring points per worker; more even shards, slower lookups
+GAME_PATH_PREFIX = "/api/games/" # Requests under /api/games/<game_id>/ go to the game's owner
+FORWARD_CONNECT_TIMEOUT = 2 # seconds; no read timeout, /events streams stay open
+HOP_BY_HOP_HEADERS = frozenset(("connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                                "te", "trailers", "transfer-encoding", "upgrade"))
+
+class HashRing:
+    """Consistent hash ring: maps a key to one of `nodes`, moving only ~1/n of the keys when a node is added or removed."""
+
+    def __init__(self, nodes, vnodes=SHARD_VNODES):
+        points = sorted((ring_hash(f"{node}#{i}"), node) for node in nodes for i in range(vnodes))
+        self._hashes = [h for h, _ in points]
+        self._nodes = [node for _, node in points]
+
+    def owner(self, key):
+        i = bisect.bisect(self._hashes, ring_hash(key))
+        return self._nodes[i % len(self._nodes)]
+
+def ring_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+def game_id_of(path):
+    # The <game_id> of an /api/games/<game_id>/... path, else None
+    if not path.startswith(GAME_PATH_PREFIX):
+        return None
+    game_id = path[len(GAME_PATH_PREFIX):].split("/", 1)[0]
+    return game_id or None
+
+# --- Forwarding ---
+class ShardRouter:
+    """WSGI middleware in front of a worker's app: serves its own games, forwards the rest to their owner."""
+
+    def __init__(self, wsgi_app, ring, index, peer_urls):
+        self.wsgi_app = wsgi_app
+        self.ring = ring
+        self.index = index
+        self.peer_urls = peer_urls # Private base URL of each worker, by index
+        self._local = threading.local() # One keep-alive session per server thread
+
+    def __call__(self, environ, start_response):
+        game_id = game_id_of(environ.get("PATH_INFO", ""))
+        if game_id is None:
+            return self.wsgi_app(environ, start_response)
+        owner = self.ring.owner(game_id)
+        if owner == self.index:
+            return self.wsgi_app(environ, start_response)
+        return self.forward(environ, start_response, self.peer_urls[owner])
+
+    def forward(self, environ, start_response, base_url):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        headers = {key[5:].replace("_", "-").title(): value for key, value in environ.items()
+                   if key.startswith("HTTP_") and key[5:].replace("_", "-").lower() not in HOP_BY_HOP_HEADERS}
+        if environ.get("CONTENT_TYPE"):
+            headers["Content-Type"] = environ["CONTENT_TYPE"]
+        length = int(environ.get("CONTENT_LENGTH") or 0)
+        body = environ["wsgi.input"].read(length) if length else None
+        url = base_url + quote(environ.get("PATH_INFO", ""))
+        if environ.get("QUERY_STRING"):
+            url += "?" + environ["QUERY_STRING"]
+        try:
+            response = session.request(environ["REQUEST_METHOD"], url, headers=headers, data=body, stream=True,
+                                       allow_redirects=False, timeout=(FORWARD_CONNECT_TIMEOUT, None))
+        except requests.exceptions.RequestException as e:
+            logger.warning("Forwarding %s to %s failed: %s", environ.get("PATH_INFO"), base_url, e)
+            start_response("502 Bad Gateway", [("Content-Type", "application/json")])
+            return [b'{"success": false, "error": "The worker that owns this game is unavailable."}']
+        start_response(f"{response.status_code} {response.reason}",
+                       [(name, value) for name, value in response.headers.items() if name.lower() not in HOP_BY_HOP_HEADERS])
+        return relay(response)
+
+def relay(response):
+    # Streams the body through chunk by chunk as it arrives (so /events keeps pushing), undecoded
+    try:
+        yield from response.raw.stream(None, decode_content=False)
+    finally:
+        response.close()
+
+# --- Workers ---
+def listen(host, port):
+    sock = socket.create_server((host, port), backlog=1024)
+    sock.set_inheritable(True)
+    return sock
+
+def worker_main(index, host, public_fd, private_fds, private_ports, ai_mode):
+    # Runs in the forked child: app is imported here so every worker builds its own engine, AI
+    # runner, LLM client and game store
+    for name in ("UNO_PERSIST_DIR", "UNO_SPILL_DIR"):
+        if os.environ.get(name):
+            os.environ[name] = os.path.join(os.environ[name], f"shard-{index}")
+    import ai_player
+    import app as uno_app
+    logging.basicConfig(level=uno_app.LOG_LEVEL, format=f"%(asctime)s %(levelname)s [worker {index}] %(name)s: %(message)s",
+                        force=True) # Replaces the handler inherited from the parent
+    if ai_mode:
+        ai_player.AI_PLAYER_MODE = ai_mode
+
+    ring = HashRing(range(len(private_fds)))
+    uno_app.game_engine.owns = lambda game_id: ring.owner(game_id) == index
+    peer_urls = [f"http://127.0.0.1:{port}" for port in private_ports]
+    for n, fd in enumerate(private_fds):
+        if n != index:
+            os.close(fd)
+
+    private = make_server("127.0.0.1", 0, uno_app.app, threaded=True, fd=private_fds[index])
+    public = make_server(host, 0, ShardRouter(uno_app.app, ring, index, peer_urls), threaded=True, fd=public_fd)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    threading.Thread(target=private.serve_forever, name="shard-private", daemon=True).start()
+    logger.info("Worker %d serving shard %d/%d.", index, index, len(private_fds))
+    try:
+        public.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if uno_app.game_store is not None:
+            uno_app.game_store.close()
+
+def serve(host, port, workers, ai_mode=None):
+    # Binds the sockets, forks the workers and restarts any that exit until SIGTERM or Ctrl-C
+    public = listen(host, port)
+    private = [listen("127.0.0.1", 0) for _ in range(workers)]
+    private_fds = [sock.fileno() for sock in private]
+    private_ports = [sock.getsockname()[1] for sock in private]
+    context = multiprocessing.get_context("fork")
+    stop = threading.Event()
+
+    def start(index):
+        process = context.Process(target=worker_main, args=(index, host, public.fileno(), private_fds, private_ports, ai_mode),
+                                  name=f"uno-worker-{index}")
+        process.start()
+        return process
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+    processes = [start(i) for i in range(workers)]
+    logger.info("Serving on http://%s:%d with %d worker(s).", host, public.getsockname()[1], workers)
+    try:
+        while not stop.wait(1.0):
+            for i, process in enumerate(processes):
+                if not process.is_alive():
+                    logger.warning("Worker %d exited with code %s; restarting it.", i, process.exitcode)
+                    processes[i] = start(i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the UNO app from one worker process per shard of games")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Default: one per CPU")
+    parser.add_argument("--ai-mode", choices=["llm", "heuristic"], default=None, help="Override AI_PLAYER_MODE")
+    args = parser.parse_args()
+    logging.basicConfig(level=os.environ.get("UNO_LOG_LEVEL", "INFO"), format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    serve(args.host, args.port, args.workers, args.ai_mode)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+# Headless self-play for capacity planning and for regression-testing rule changes.
+# Games run on GameState with the same deck, is_valid_play and moves as the HTTP routes, without
+# Flask or a browser, spread over a multiprocessing pool. Game i always uses the same seed, so a
+# run is reproducible whatever the worker count.
+# Usage:
+#   python simulate.py [--games 10000] [--workers N] [--seed 1] [--players heuristic heuristic]
+#                      [--replay responses.jsonl] [--max-turns 1000] [--monte-carlo drive] [--monte-carlo-budget-ms 50]
+#
+# Players are seated in order (Player1, Player2) and use one of the DECIDERS below, or "ai" for
+# the real AI turn pipeline (prompt, decision cache off, fallbacks) with its LLM replaced by a
+# zero-latency replay of a recorded corpus (llm_transport.ReplayTransport; without --replay, the
+# fake Ollama server's first legal move). "ai" can only sit in the Player2 seat, like on the
+# server. --monte-carlo sets its AI_MONTE_CARLO_MODE, e.g. "drive" to pit the Monte Carlo
+# evaluator against another player.
+
+import argparse
+import logging
+import multiprocessing
+import os
+import random
+import time
+
+import ai_player
+from cards import BLACK, CARD_COLOR, COLOR_CODES, HandIndex, is_valid_play, parse_card_id
+from game_engine import GameState
+from heuristic import choose_move, most_held_color
+from llm_transport import ReplayTransport
+
+# --- Decision Functions ---
+# decide(hand, top_card, chosen_color, legal) -> LLM-style action dict, like heuristic.choose_move
+
+def random_move(hand, top_card, chosen_color, legal):
+    # Any legal card, uniformly; draws when nothing fits
+    if not legal:
+        return {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None}
+    return {"action_type": "PLAY_CARD", "card_guid_to_play": random.choice(legal), "declared_color": None}
+
+def first_move(hand, top_card, chosen_color, legal):
+    # The first legal card in hand order
+    if not legal:
+        return {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None}
+    first = min(legal, key=hand.index)
+    return {"action_type": "PLAY_CARD", "card_guid_to_play": first, "declared_color": None}
+
+DECIDERS = {
+    "heuristic": choose_move,
+    "random": random_move,
+    "first": first_move,
+}
+
+# --- Game Loop ---
+def take_turn(game, player_name, decide):
+    # One non-AI turn: serve any pending draw, then play the chosen card if it is legal, else draw
+    if game.pending_draw_amount > 0:
+        game.draw_cards(player_name, game.pending_draw_amount)
+        game.pending_draw_amount = 0
+
+    hand = game.player_hands[player_name]
+    top_card, chosen_color = game.discard_pile_top_card, game.current_chosen_color
+    legal = HandIndex(hand).legal_moves(top_card, chosen_color)
+    action = decide(hand, top_card, chosen_color, legal) or {}
+
+    card = parse_card_id(action.get("card_guid_to_play")) if action.get("action_type") == "PLAY_CARD" else None
+    if card is not None and card in hand and is_valid_play(card, top_card, chosen_color):
+        declared = None
+        if CARD_COLOR[card] == BLACK:
+            declared = COLOR_CODES.get(action.get("declared_color"))
+            if declared is None:
+                declared = most_held_color([c for c in hand if c != card])
+        game.play_card(player_name, card, declared)
+        if not hand:
+            game.game_winner = player_name
+    else:
+        game.draw_cards(player_name, 1)
+
+def play_game(seed, seats, max_turns=1000):
+    # Plays one game to the end (or max_turns); returns (winner or None, turns)
+    random.seed(seed)
+    game = GameState(f"sim-{seed}")
+    game.start()
+    turns = 0
+    while game.game_winner is None and turns < max_turns:
+        seat = seats[game.current_player_index]
+        if seat == "ai":
+            ai_player.execute_ai_turn(game)
+        else:
+            take_turn(game, game.current_player_name, DECIDERS[seat])
+        turns += 1
+        game.advance_turn()
+    return game.game_winner, turns
+
+def game_seed(base_seed, index):
+    # Independent of worker count and scheduling
+    return (base_seed << 32) + index
+
+# --- Process Pool ---
+_worker_seats = None
+_worker_max_turns = None
+
+def _init_worker(seats, replay_path, max_turns, monte_carlo, monte_carlo_budget_ms):
+    global _worker_seats, _worker_max_turns
+    _worker_seats, _worker_max_turns = seats, max_turns
+    logging.disable(logging.CRITICAL) # The engine and AI log every move
+    if "ai" in seats:
+        ai_player.AI_PLAYER_MODE = "llm"
+        ai_player.AI_MONTE_CARLO_MODE = monte_carlo
+        ai_player.AI_MONTE_CARLO_BUDGET_MS = monte_carlo_budget_ms
+        ai_player.OLLAMA_STREAM = False
+        ai_player.AI_DECISION_CACHE_ENABLED = False # A per-process cache would make results depend on scheduling
+        # Unmatched prompts get a recorded response picked by a hash of the prompt, so replays stay deterministic
+        ai_player.llm_client = ReplayTransport(replay_path, latency="zero", on_miss="hash")
+
+def _run_game(seed):
+    winner, turns = play_game(seed, _worker_seats, _worker_max_turns)
+    return seed, winner, turns
+
+def simulate(n_games, seats, base_seed=1, workers=None, replay_path=None, max_turns=1000,
+             monte_carlo="off", monte_carlo_budget_ms=50):
+    if "ai" in seats and seats.index("ai") != 1:
+        raise ValueError('The "ai" player can only sit in the Player2 seat.')
+    workers = workers or os.cpu_count() or 1
+    seeds = [game_seed(base_seed, i) for i in range(n_games)]
+    chunksize = max(1, n_games // (workers * 16))
+    start = time.perf_counter()
+    with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(seats, replay_path, max_turns, monte_carlo, monte_carlo_budget_ms)) as pool:
+        results = list(pool.imap_unordered(_run_game, seeds, chunksize=chunksize))
+    elapsed = time.perf_counter() - start
+
+    players = ["Player1", "Player2"]
+    wins = {player: 0 for player in players}
+    total_turns = unfinished = 0
+    for _, winner, turns in results:
+        total_turns += turns
+        if winner is None:
+            unfinished += 1
+        else:
+            wins[winner] += 1
+    report = {
+        "games": n_games,
+        "workers": workers,
+        "seconds": elapsed,
+        "games_per_sec": n_games / elapsed if elapsed else 0.0,
+        "turns_per_game": total_turns / n_games if n_games else 0.0,
+        "unfinished": unfinished,
+    }
+    for player, seat in zip(players, seats):
+        report[f"win_rate_{player}_{seat}"] = wins[player] / n_games if n_games else 0.0
+    return report
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless UNO self-play")
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--workers", type=int, default=None, help="Default: one per CPU")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--players", nargs=2, default=["heuristic", "heuristic"],
+                        choices=sorted(DECIDERS) + ["ai"], help="Player1 and Player2")
+    parser.add_argument("--replay", default=None, help="LLM corpus (see llm_transport) for the ai player")
+    parser.add_argument("--max-turns", type=int, default=1000)
+    parser.add_argument("--monte-carlo", default="off", choices=["off", "hint", "drive"], help="AI_MONTE_CARLO_MODE for the ai player")
+    parser.add_argument("--monte-carlo-budget-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    report = simulate(args.games, args.players, args.seed, args.workers, args.replay, args.max_turns,
+                      args.monte_carlo, args.monte_carlo_budget_ms)
+    for name, value in report.items():
+        print(f"{name:>32} {value:>12.3f}" if isinstance(value, float) else f"{name:>32} {value:>12}")
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 // Global game state variables
+let gameId = null; // Assigned by the server when the game is created
 let playerHand = [];
 let discardTopCard = null;
 let deckCardCount = 0;
@@ -13,11 +14,22 @@ let pendingDrawAmountFE = 0;
 let showAiThinkingMessage = false;
 let opponentCardCountFE = 0;
 let gameWinnerFE = null;
+let aiTurnPendingFE = false; // True while the server runs the AI turn in the background
+let aiBanterStreamingFE = false; // True while the AI's banter is still arriving after its move
+const AI_POLL_INTERVAL_MS = 500;
+const AI_BANTER_POLL_INTERVAL_MS = 250;
+let stateEvents = null; // EventSource pushing the game state on every change; polling is the fallback
+let stateVersionFE = -1;
+let stateChangeWaiters = []; // Resolved whenever a pushed state arrives
+const USE_STATE_DELTAS = true; // Action responses carry only what changed since stateVersionFE
+const PAGE_PARAMS = new URLSearchParams(window.location.search);
+let redrawQueued = false; // The canvas only redraws after a state change or an interaction (noLoop)
 
 class UnoCard {
-  constructor(color, value) {
+  constructor(color, value, guid = null) {
     this.color = color;
     this.value = value;
+    this.guid = guid; // Server card id; delta responses add and remove hand cards by it
   }
 }
 
@@ -34,34 +46,62 @@ let DISCARD_Y;       // Y position for the discard pile
 
 let gameButtons = [];   // To hold button objects
 
+async function createGame() {
+  try {
+    const response = await fetch('/api/games', { method: 'POST', headers: { 'Content-Type': 'application/json' } });
+    if (!response.ok) {
+      throw new Error(`Network response was not ok: ${response.status} ${response.statusText}`);
+    }
+    const gameState = await response.json();
+    gameId = gameState.game_id;
+    console.log("Created game:", gameId);
+  } catch (error) {
+    console.error('Failed to create game:', error);
+  }
+}
+
+// Subscribes to server-pushed state; the server only sends when the state version changes
+function connectStateEvents() {
+  if (typeof EventSource === 'undefined') return;
+  stateEvents = new EventSource(`/api/games/${gameId}/events`);
+  stateEvents.addEventListener('state', event => {
+    applyGameState(JSON.parse(event.data));
+    const waiters = stateChangeWaiters;
+    stateChangeWaiters = [];
+    waiters.forEach(resolve => resolve());
+  });
+  stateEvents.onerror = () => {
+    // EventSource reconnects by itself; meanwhile let anyone waiting fall back to polling
+    const waiters = stateChangeWaiters;
+    stateChangeWaiters = [];
+    waiters.forEach(resolve => resolve());
+  };
+}
+
+function stateEventsConnected() {
+  return stateEvents !== null && stateEvents.readyState === EventSource.OPEN;
+}
+
+// Resolves on the next pushed state, or after intervalMs with a fresh fetch when push is unavailable
+async function waitForStateChange(intervalMs) {
+  if (stateEventsConnected()) {
+    await new Promise(resolve => stateChangeWaiters.push(resolve));
+  } else {
+    await new Promise(resolve => setTimeout(resolve, intervalMs));
+    await fetchAndUpdateGameState();
+  }
+}
+
 async function fetchAndUpdateGameState() {
   try {
-    const response = await fetch('/api/gamestate');
+    // The browser revalidates with If-None-Match; an unchanged game comes back as a cached 304
+    const response = await fetch(`/api/games/${gameId}/gamestate`, { cache: 'no-cache' });
     if (!response.ok) {
       throw new Error(`Network response was not ok: ${response.status} ${response.statusText}`);
     }
     const gameState = await response.json();
     console.log("Fetched game state:", gameState); // For debugging
-
-    if (gameState.player_hand) playerHand = gameState.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value));
-    else { playerHand = [new UnoCard('grey', 'ErrorP')]; console.error("Player hand data missing in fetched state."); }
-
-    if (gameState.discard_pile_top_card && gameState.discard_pile_top_card.color && gameState.discard_pile_top_card.value) {
-      discardTopCard = new UnoCard(gameState.discard_pile_top_card.color, gameState.discard_pile_top_card.value);
-    } else { discardTopCard = null; console.warn("Discard pile top card data missing or incomplete in fetched state. Setting to null.");}
-
-    deckCardCount = gameState.deck_card_count !== undefined ? gameState.deck_card_count : 0;
-    currentPlayerName = gameState.current_player || 'N/A';
-    currentChosenColorDisplay = gameState.current_chosen_color || ''; 
-    awaiting_color_choice_frontend = gameState.awaiting_color_choice !== undefined ? gameState.awaiting_color_choice : false;
-    playersList = gameState.players_list || [];
-    playDirectionDisplay = gameState.play_direction || 'N/A';
-    // if(gameState.message) messageFromServer = gameState.message;
-    aiLastBanter = gameState.ai_last_banter || '';
-    pendingDrawAmountFE = gameState.pending_draw_amount !== undefined ? gameState.pending_draw_amount : 0;
-    opponentCardCountFE = gameState.opponent_card_count !== undefined ? gameState.opponent_card_count : 0;
-    gameWinnerFE = gameState.game_winner || null;
-    
+    applyGameState(gameState);
   } catch (error) {
     console.error('Failed to fetch and update game state:', error);
     playerHand = [new UnoCard('grey', 'ConnErrP')]; discardTopCard = new UnoCard('grey', 'ConnErrD');
@@ -72,9 +112,142 @@ async function fetchAndUpdateGameState() {
     pendingDrawAmountFE = 0;
     opponentCardCountFE = 0;
     gameWinnerFE = null;
+    aiTurnPendingFE = false;
+    aiBanterStreamingFE = false;
+    requestRedraw();
   }
 }
 
+// Pushed, fetched and action-response states can arrive out of order; never step back to an older version
+function acceptStateVersion(version) {
+  if (version === undefined) return true;
+  if (version < stateVersionFE) return false;
+  stateVersionFE = version;
+  return true;
+}
+
+function applyGameState(gameState) {
+  if (!acceptStateVersion(gameState.state_version)) return;
+
+  if (gameState.player_hand) playerHand = gameState.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value, cardData.guid));
+  else { playerHand = [new UnoCard('grey', 'ErrorP')]; console.error("Player hand data missing in fetched state."); }
+
+  if (gameState.discard_pile_top_card && gameState.discard_pile_top_card.color && gameState.discard_pile_top_card.value) {
+    discardTopCard = new UnoCard(gameState.discard_pile_top_card.color, gameState.discard_pile_top_card.value);
+  } else { discardTopCard = null; console.warn("Discard pile top card data missing or incomplete in fetched state. Setting to null.");}
+
+  deckCardCount = gameState.deck_card_count !== undefined ? gameState.deck_card_count : 0;
+  currentPlayerName = gameState.current_player || 'N/A';
+  currentChosenColorDisplay = gameState.current_chosen_color || ''; 
+  awaiting_color_choice_frontend = gameState.awaiting_color_choice !== undefined ? gameState.awaiting_color_choice : false;
+  playersList = gameState.players_list || [];
+  playDirectionDisplay = gameState.play_direction || 'N/A';
+  // if(gameState.message) messageFromServer = gameState.message;
+  aiLastBanter = gameState.ai_last_banter || '';
+  pendingDrawAmountFE = gameState.pending_draw_amount !== undefined ? gameState.pending_draw_amount : 0;
+  opponentCardCountFE = gameState.opponent_card_count !== undefined ? gameState.opponent_card_count : 0;
+  gameWinnerFE = gameState.game_winner || null;
+  aiTurnPendingFE = gameState.ai_turn_pending === true;
+  aiBanterStreamingFE = gameState.ai_banter_streaming === true;
+  requestRedraw();
+}
+
+// Headers for action requests; opts into delta responses once a base state has been applied
+function actionHeaders() {
+  const headers = { 'Content-Type': 'application/json' };
+  if (USE_STATE_DELTAS && stateVersionFE >= 0) headers['X-State-Base'] = String(stateVersionFE);
+  return headers;
+}
+
+// Setters for every non-hand field a delta's "changed" map can carry
+const STATE_FIELD_SETTERS = {
+  discard_pile_top_card: v => { discardTopCard = v && v.color && v.value ? new UnoCard(v.color, v.value, v.guid) : null; },
+  deck_card_count: v => { deckCardCount = v; },
+  current_player: v => { currentPlayerName = v || 'N/A'; },
+  current_chosen_color: v => { currentChosenColorDisplay = v || ''; },
+  awaiting_color_choice: v => { awaiting_color_choice_frontend = v === true; },
+  players_list: v => { playersList = v || []; },
+  play_direction: v => { playDirectionDisplay = v || 'N/A'; },
+  ai_last_banter: v => { aiLastBanter = v || ''; },
+  pending_draw_amount: v => { pendingDrawAmountFE = v; },
+  opponent_card_count: v => { opponentCardCountFE = v; },
+  game_winner: v => { gameWinnerFE = v || null; },
+  ai_turn_pending: v => { aiTurnPendingFE = v === true; },
+  ai_banter_streaming: v => { aiBanterStreamingFE = v === true; },
+};
+
+// Applies an action response: a delta patch, a full resync, or (without deltas) a full state
+function applyActionState(data) {
+  if (!data.delta) {
+    applyGameState(data);
+    return;
+  }
+  if (data.state_version <= stateVersionFE) return; // A pushed state already covered it
+  if (data.base_version !== stateVersionFE) {
+    // Our state moved on from the base the server diffed against; fetch the full state instead
+    console.warn(`Delta base ${data.base_version} does not match local version ${stateVersionFE}; resyncing.`);
+    fetchAndUpdateGameState();
+    return;
+  }
+  stateVersionFE = data.state_version;
+  if (data.hand_removed) {
+    const removed = new Set(data.hand_removed);
+    playerHand = playerHand.filter(card => !removed.has(card.guid));
+  }
+  if (data.hand_added) {
+    playerHand = playerHand.concat(data.hand_added.map(cardData => new UnoCard(cardData.color, cardData.value, cardData.guid)));
+  }
+  for (const [field, value] of Object.entries(data.changed || {})) {
+    if (STATE_FIELD_SETTERS[field]) STATE_FIELD_SETTERS[field](value);
+  }
+  requestRedraw();
+}
+
+// Schedules one redraw for the next animation frame, however many changes land before it
+function requestRedraw() {
+  if (redrawQueued) return;
+  redrawQueued = true;
+  window.requestAnimationFrame(() => {
+    redrawQueued = false;
+    redraw();
+  });
+}
+
+// Waits (on pushed state, or by polling) until the background AI turn has finished
+async function waitForAiTurn() {
+  showAiThinkingMessage = true;
+  requestRedraw();
+  while (aiTurnPendingFE) {
+    await waitForStateChange(AI_POLL_INTERVAL_MS);
+  }
+  showAiThinkingMessage = false;
+  requestRedraw();
+  if (gameWinnerFE) {
+    noLoop();
+    return;
+  }
+  // The move is in and the player can act; keep picking up the AI's banter as it streams in
+  while (aiBanterStreamingFE && !aiTurnPendingFE) {
+    await waitForStateChange(AI_BANTER_POLL_INTERVAL_MS);
+  }
+}
+
+
+// Card faces are drawn once per color, value and size into an offscreen sprite; drawing a card is then one image() call
+const USE_CARD_SPRITES = PAGE_PARAMS.get('sprites') !== '0'; // ?sprites=0 draws the shapes every time, to compare
+const cardSprites = new Map();
+
+function cardSprite(card, cardWidth, cardHeight) {
+  const key = `${card.color}:${card.value}:${cardWidth}x${cardHeight}`;
+  let sprite = cardSprites.get(key);
+  if (!sprite) {
+    sprite = createGraphics(cardWidth, cardHeight);
+    sprite.angleMode(DEGREES); sprite.textFont('Arial'); // Graphics keep their own settings
+    renderUnoCard(sprite, card, 0, 0, cardWidth, cardHeight);
+    cardSprites.set(key, sprite);
+  }
+  return sprite;
+}
 
 function drawUnoCard(card, x, y, cardWidth, cardHeight) {
   if (!card || !card.color || !card.value) {
@@ -83,6 +256,12 @@ function drawUnoCard(card, x, y, cardWidth, cardHeight) {
     fill(255); textAlign(CENTER,CENTER); text("BAD", x + cardWidth/2, y + cardHeight/2);
     return;
   }
+  if (USE_CARD_SPRITES) image(cardSprite(card, cardWidth, cardHeight), x, y);
+  else renderUnoCard(window, card, x, y, cardWidth, cardHeight);
+}
+
+// Draws a card face with the drawing functions of `g`: a p5.Graphics sprite, or window for the main canvas
+function renderUnoCard(g, card, x, y, cardWidth, cardHeight) {
   const cornerRadius = cardWidth / 12; 
   const tiltAngle = 15;
 
@@ -95,7 +274,7 @@ function drawUnoCard(card, x, y, cardWidth, cardHeight) {
   else if (card.color === 'grey') cardColorValue = color(128);
   else cardColorValue = color(200); 
   
-  fill(cardColorValue); noStroke(); rect(x, y, cardWidth, cardHeight, cornerRadius);
+  g.fill(cardColorValue); g.noStroke(); g.rect(x, y, cardWidth, cardHeight, cornerRadius);
 
   const isWild = card.value === 'wild';
   const isWildDrawFour = card.value === 'wildDrawFour';
@@ -103,40 +282,40 @@ function drawUnoCard(card, x, y, cardWidth, cardHeight) {
   if (isWild || isWildDrawFour) {
     const segmentWidth = cardWidth * 0.35; const segmentHeight = cardHeight * 0.3;
     const centerX = x + cardWidth / 2; const centerY = y + cardHeight / 2;
-    fill(255, 0, 0); rect(centerX - segmentWidth, centerY - segmentHeight, segmentWidth, segmentHeight);
-    fill(255, 255, 0); rect(centerX, centerY - segmentHeight, segmentWidth, segmentHeight);
-    fill(0, 255, 0); rect(centerX - segmentWidth, centerY, segmentWidth, segmentHeight);
-    fill(0, 0, 255); rect(centerX, centerY, segmentWidth, segmentHeight);
-
-    push(); translate(centerX, centerY);
-    fill(255); stroke(0); strokeWeight(cardWidth / 60);
-    textAlign(CENTER, CENTER); textStyle(BOLD);
-    if (isWildDrawFour) { textSize(cardWidth / 3); text('+4', 0, 0); }
-    else { textSize(cardWidth / 5); text('WILD', 0, 0); }
-    pop();
+    g.fill(255, 0, 0); g.rect(centerX - segmentWidth, centerY - segmentHeight, segmentWidth, segmentHeight);
+    g.fill(255, 255, 0); g.rect(centerX, centerY - segmentHeight, segmentWidth, segmentHeight);
+    g.fill(0, 255, 0); g.rect(centerX - segmentWidth, centerY, segmentWidth, segmentHeight);
+    g.fill(0, 0, 255); g.rect(centerX, centerY, segmentWidth, segmentHeight);
+
+    g.push(); g.translate(centerX, centerY);
+    g.fill(255); g.stroke(0); g.strokeWeight(cardWidth / 60);
+    g.textAlign(CENTER, CENTER); g.textStyle(BOLD);
+    if (isWildDrawFour) { g.textSize(cardWidth / 3); g.text('+4', 0, 0); }
+    else { g.textSize(cardWidth / 5); g.text('WILD', 0, 0); }
+    g.pop();
   } else {
     const isErrorCard = ["ErrorP", "ErrorD", "ConnErrP", "ConnErrD", "X", "Y", "BAD", "Empty"].includes(card.value);
     if (!isErrorCard) {
       const ellipseWidth = cardWidth * 0.75; const ellipseHeight = cardHeight * 0.78; 
-      push(); translate(x + cardWidth / 2, y + cardHeight / 2); rotate(tiltAngle);
-      fill(255, 255, 255); noStroke(); ellipse(0, 0, ellipseWidth, ellipseHeight);
-      pop();
+      g.push(); g.translate(x + cardWidth / 2, y + cardHeight / 2); g.rotate(tiltAngle);
+      g.fill(255, 255, 255); g.noStroke(); g.ellipse(0, 0, ellipseWidth, ellipseHeight);
+      g.pop();
     }
 
-    push(); translate(x + cardWidth / 2, y + cardHeight / 2); rotate(tiltAngle);
+    g.push(); g.translate(x + cardWidth / 2, y + cardHeight / 2); g.rotate(tiltAngle);
     let centralTextColor, centralStrokeColor;
     if (card.color === 'yellow') { centralTextColor = color(0); centralStrokeColor = color(255); }
     else if (card.color === 'grey') { centralTextColor = color(255); centralStrokeColor = color(0); }
     else { centralTextColor = cardColorValue; centralStrokeColor = color(255); }
 
-    fill(centralTextColor); stroke(centralStrokeColor); strokeWeight(cardWidth / 75); 
-    textAlign(CENTER, CENTER); textStyle(BOLD);
+    g.fill(centralTextColor); g.stroke(centralStrokeColor); g.strokeWeight(cardWidth / 75); 
+    g.textAlign(CENTER, CENTER); g.textStyle(BOLD);
     let centralValue = card.value; let centralTextSize = cardWidth / 2.5; 
     if (card.value === 'skip') { centralValue = 'S'; centralTextSize = cardWidth / 2; }
     else if (card.value === 'reverse') { centralValue = 'R'; centralTextSize = cardWidth / 2; }
     else if (card.value === 'drawTwo') { centralValue = '+2'; centralTextSize = cardWidth / 2; }
-    textSize(centralTextSize); text(centralValue, 0, 0);
-    pop();
+    g.textSize(centralTextSize); g.text(centralValue, 0, 0);
+    g.pop();
   }
 
   let cornerValue = card.value;
@@ -145,11 +324,11 @@ function drawUnoCard(card, x, y, cardWidth, cardHeight) {
   else if (card.value === 'drawTwo') cornerValue = '+2';
   
   const cornerTextSize = cardWidth / 7; const cornerXOffset = cardWidth * 0.12; const cornerYOffset = cardHeight * 0.08; 
-  fill(255); noStroke(); textStyle(BOLD); textSize(cornerTextSize); textAlign(CENTER, CENTER);
-  text(cornerValue, x + cornerXOffset, y + cornerYOffset + (cornerTextSize / 3)); 
-  push(); translate(x + cardWidth - cornerXOffset, y + cardHeight - cornerYOffset - (cornerTextSize / 3)); rotate(180);
-  text(cornerValue, 0, 0);
-  pop();
+  g.fill(255); g.noStroke(); g.textStyle(BOLD); g.textSize(cornerTextSize); g.textAlign(CENTER, CENTER);
+  g.text(cornerValue, x + cornerXOffset, y + cornerYOffset + (cornerTextSize / 3)); 
+  g.push(); g.translate(x + cardWidth - cornerXOffset, y + cardHeight - cornerYOffset - (cornerTextSize / 3)); g.rotate(180);
+  g.text(cornerValue, 0, 0);
+  g.pop();
 }
 
 function drawPlayerHand(handArray, startX, startY, cardWidth, cardHeight, spacing) {
@@ -202,6 +381,7 @@ function drawButtonPlaceholders(buttonDataArray) {
 
 async function setup() { 
   createCanvas(1200, 800); angleMode(DEGREES); textFont('Arial');
+  if (FRAME_STATS_MODE !== 'loop') noLoop(); // Redrawn on demand; ?fps=loop keeps drawing every frame
   HAND_Y_POSITION = height - HAND_CARD_HEIGHT - 40; DECK_Y = height / 2 - HAND_CARD_HEIGHT / 2;
   DISCARD_X = DECK_X + HAND_CARD_WIDTH + 50; DISCARD_Y = DECK_Y;
   let buttonWidth = 180; let buttonHeight = 50; 
@@ -211,10 +391,13 @@ async function setup() {
     { label: 'UNO!', x: firstButtonX + buttonWidth + 10, y: HAND_Y_POSITION - buttonHeight - 30, width: buttonWidth, height: buttonHeight, color: color(255,223,0), textColor: color(0) }, 
     { label: 'End Turn', x: firstButtonX + 2*(buttonWidth + 10), y: HAND_Y_POSITION - buttonHeight - 30, width: buttonWidth, height: buttonHeight, color: color(200,0,0), textColor: color(255) }
   ];
+  await createGame();
   await fetchAndUpdateGameState(); 
+  connectStateEvents();
 }
 
 function draw() {
+  const frameStart = performance.now();
   background(0, 100, 0); 
   
   const currentHandLength = playerHand ? playerHand.length : 0;
@@ -304,9 +487,55 @@ function draw() {
     pop();
     noLoop(); // Optional: stop drawing if game is over
   }
+
+  recordFrameTime(performance.now() - frameStart);
+  if (showFrameStats) drawFrameStats();
+}
+
+// Frame stats overlay, toggled with F or shown from the start with ?fps. Frame time is the CPU time
+// of draw() before the overlay; with noLoop, frames per second counts the redraws actually made.
+const FRAME_STATS_MODE = PAGE_PARAMS.get('fps');
+let showFrameStats = FRAME_STATS_MODE !== null;
+const frameStats = { frames: 0, lastMs: 0, averageMs: 0, maxMs: 0, windowStart: 0, windowFrames: 0, perSecond: 0 };
+
+function recordFrameTime(ms) {
+  const now = performance.now();
+  frameStats.frames++;
+  frameStats.lastMs = ms;
+  frameStats.averageMs += (ms - frameStats.averageMs) / Math.min(frameStats.frames, 60); // Mean of about the last 60 frames
+  frameStats.maxMs = Math.max(frameStats.maxMs, ms);
+  frameStats.windowFrames++;
+  if (now - frameStats.windowStart >= 1000) {
+    frameStats.perSecond = frameStats.windowFrames * 1000 / (now - frameStats.windowStart);
+    frameStats.windowStart = now;
+    frameStats.windowFrames = 0;
+    frameStats.maxMs = ms;
+  }
+}
+
+function drawFrameStats() {
+  const lines = [
+    `frames/s: ${frameStats.perSecond.toFixed(1)}${isLooping() ? ' (looping)' : ' (on change)'}`,
+    `frame ms: ${frameStats.lastMs.toFixed(2)} last, ${frameStats.averageMs.toFixed(2)} avg, ${frameStats.maxMs.toFixed(2)} max`,
+    `frames: ${frameStats.frames}, hand: ${playerHand ? playerHand.length : 0} cards`,
+    `card sprites: ${USE_CARD_SPRITES ? cardSprites.size + ' cached' : 'off'}`,
+  ];
+  push();
+  fill(0, 0, 0, 180); noStroke(); rect(width - 330, 10, 320, 20 + lines.length * 18, 5);
+  fill(0, 255, 0); textFont('monospace'); textStyle(NORMAL); textSize(13); textAlign(LEFT, TOP);
+  lines.forEach((line, i) => text(line, width - 320, 20 + i * 18));
+  pop();
+}
+
+function keyPressed() {
+  if (key === 'f' || key === 'F') {
+    showFrameStats = !showFrameStats;
+    requestRedraw();
+  }
 }
 
 function mousePressed() {
+  requestRedraw(); // Interaction
   // Card click detection
   if (playerHand && playerHand.length > 0) {
     const currentHandLength = playerHand.length;
@@ -326,11 +555,9 @@ function mousePressed() {
         };
         console.log("Attempting to play card:", cardToPlay);
 
-        fetch('/api/play_card', {
+        fetch(`/api/games/${gameId}/play_card`, {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
+            headers: actionHeaders(),
             body: JSON.stringify(cardToPlay)
         })
         .then(response => {
@@ -350,8 +577,10 @@ function mousePressed() {
         .then(data => {
             if (data.success) {
                 console.log('Play card successful:', data.message, data); 
+                if (data.delta || data.resync) { applyActionState(data); return; }
+                if (!acceptStateVersion(data.state_version)) return;
                 
-                if (data.player_hand) playerHand = data.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value));
+                if (data.player_hand) playerHand = data.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value, cardData.guid));
                 if (data.discard_pile_top_card && data.discard_pile_top_card.color && data.discard_pile_top_card.value) {
                     discardTopCard = new UnoCard(data.discard_pile_top_card.color, data.discard_pile_top_card.value);
                 } else { discardTopCard = null; }
@@ -362,6 +591,7 @@ function mousePressed() {
                 playersList = data.players_list || playersList;
                 playDirectionDisplay = data.play_direction || playDirectionDisplay;
                 // if(data.message) messageFromServer = data.message;
+                requestRedraw();
 
             } else {
                 console.error('Play card reported as not successful by server:', data.message);
@@ -386,9 +616,9 @@ function mousePressed() {
         
         if (button.label === 'Draw Card') {
           console.log("Draw Card button clicked! - Attempting to draw from backend...");
-          fetch('/api/draw_card', {
+          fetch(`/api/games/${gameId}/draw_card`, {
               method: 'POST',
-              headers: { 'Content-Type': 'application/json' }
+              headers: actionHeaders()
           })
           .then(response => {
               if (!response.ok) {
@@ -405,7 +635,9 @@ function mousePressed() {
           .then(data => {
               console.log('Draw card action successful, new game state:', data);
               if(data.message) console.log("Message from server: " + data.message);
-              if (data.player_hand) playerHand = data.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value));
+              if (data.delta || data.resync) { applyActionState(data); return; }
+              if (!acceptStateVersion(data.state_version)) return;
+              if (data.player_hand) playerHand = data.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value, cardData.guid));
               if (data.discard_pile_top_card && data.discard_pile_top_card.color && data.discard_pile_top_card.value) {
                   discardTopCard = new UnoCard(data.discard_pile_top_card.color, data.discard_pile_top_card.value);
               } else { discardTopCard = null; }
@@ -415,6 +647,7 @@ function mousePressed() {
               awaiting_color_choice_frontend = data.awaiting_color_choice !== undefined ? data.awaiting_color_choice : awaiting_color_choice_frontend;
               playersList = data.players_list || [];
               playDirectionDisplay = data.play_direction || '';
+              requestRedraw();
           })
           .catch(error => {
               console.error('Error during draw card action:', error);
@@ -422,11 +655,11 @@ function mousePressed() {
         } else if (button.label === 'End Turn') {
             console.log("End Turn button clicked! - Attempting to end turn via backend...");
             showAiThinkingMessage = true;
-            redraw(); // Show "AI is thinking..." message
+            requestRedraw(); // Show "AI is thinking..." message
 
-            fetch('/api/end_turn', {
+            fetch(`/api/games/${gameId}/end_turn`, {
                 method: 'POST',
-                headers: { 'Content-Type': 'application/json' }
+                headers: actionHeaders()
             })
             .then(response => {
                 if (!response.ok) {
@@ -442,34 +675,18 @@ function mousePressed() {
             })
             .then(data => {
                 console.log('End turn response received, game state:', data);
-                showAiThinkingMessage = false; // Hide "AI is thinking..."
 
                 if(data.message) console.log("Message from server: " + data.message);
-                if (data.player_hand) playerHand = data.player_hand.map(cardData => new UnoCard(cardData.color, cardData.value));
-
-                if (data.discard_pile_top_card && data.discard_pile_top_card.color && data.discard_pile_top_card.value) {
-                    discardTopCard = new UnoCard(data.discard_pile_top_card.color, data.discard_pile_top_card.value);
-                } else { discardTopCard = null; } 
+                // A pushed state may already have reported the AI's move; this one is skipped then
+                applyActionState(data);
 
-                deckCardCount = data.deck_card_count !== undefined ? data.deck_card_count : 0;
-                currentPlayerName = data.current_player || 'N/A'; 
-                currentChosenColorDisplay = data.current_chosen_color || '';
-                awaiting_color_choice_frontend = data.awaiting_color_choice !== undefined ? data.awaiting_color_choice : awaiting_color_choice_frontend;
-                playersList = data.players_list || [];
-                playDirectionDisplay = data.play_direction || '';
-                aiLastBanter = data.ai_last_banter || '';
-                pendingDrawAmountFE = data.pending_draw_amount !== undefined ? data.pending_draw_amount : 0;
-                opponentCardCountFE = data.opponent_card_count !== undefined ? data.opponent_card_count : 0;
-                gameWinnerFE = data.game_winner || null;
-
-                if (gameWinnerFE) {
-                    redraw();
-                    noLoop();
-                }
+                // The AI move arrives later; keep the "thinking" overlay up until it does
+                waitForAiTurn();
             })
             .catch(error => {
                 console.error('Error during end turn action:', error);
                 showAiThinkingMessage = false;
+                requestRedraw();
                 fetchAndUpdateGameState();
             });
         } else {
@@ -0,0 +1,45 @@
+# Stub AI moves shared by the offline stand-ins for the LLM: fake_ollama's HTTP server and the
+# replay/synthetic transports in llm_transport. Each reads the game state out of the AI prompt
+# and answers with a legal action, with no model behind it.
+
+import json
+import random
+
+from cards import BLACK, CARD_COLOR, COLOR_CODES, COLORS, is_valid_play, parse_card_id
+
+def extract_game_state(payload):
+    # The AI prompt embeds its state as the first JSON object in the last user message
+    messages = payload.get("messages") or [{}]
+    content = messages[-1].get("content", "")
+    start = content.find("{")
+    if start < 0:
+        return None
+    try:
+        state, _ = json.JSONDecoder().raw_decode(content[start:])
+    except json.JSONDecodeError:
+        return None
+    return state
+
+# About as long as the remarks real models produce, so streamed banter takes realistic time
+STUB_PLAY_BANTER = "Stub says: take that! I have been saving this one for exactly this moment..."
+CHUNK_CHARS = 4 # Roughly one token
+
+def first_legal_move(payload):
+    # Default responder: play the first legal card in the hand, otherwise draw
+    state = extract_game_state(payload) or {}
+    legal_moves = state.get("legal_moves")
+    if legal_moves: # The prompt lists only the legal candidates
+        guid, label = next(iter(legal_moves.items()))
+        declared = random.choice(COLORS) if label.startswith("black") else None
+        return {"action_type": "PLAY_CARD", "card_guid_to_play": guid, "declared_color": declared,
+                "call_uno": state.get("hand_size") == 2, "banter": STUB_PLAY_BANTER}
+    top_card = parse_card_id((state.get("discard_top_card") or {}).get("guid"))
+    chosen_color = COLOR_CODES.get(state.get("current_game_color"))
+    for card_json in state.get("my_hand", []):
+        card = parse_card_id(card_json.get("guid"))
+        if card is not None and is_valid_play(card, top_card, chosen_color):
+            declared = random.choice(COLORS) if CARD_COLOR[card] == BLACK else None
+            return {"action_type": "PLAY_CARD", "card_guid_to_play": card, "declared_color": declared,
+                    "call_uno": len(state.get("my_hand", [])) == 2, "banter": STUB_PLAY_BANTER}
+    return {"action_type": "DRAW_CARD", "card_guid_to_play": None, "declared_color": None,
+            "call_uno": False, "banter": "Stub says: nothing to play..."}
@@ -0,0 +1,40 @@
+# Checks for the LLM action validator: legal answers map to AIAction, everything else raises InvalidAction.
+# Run with: python -m pytest
+
+import json
+
+import pytest
+
+from action_schema import ActionValidator, InvalidAction
+from cards import BLACK, CARD_COLOR, COLOR_CODES
+
+WILD = next(card for card in range(108) if CARD_COLOR[card] == BLACK)
+LEGAL = [3, WILD]
+
+def answer(**fields):
+    return json.dumps(dict({"action_type": "PLAY_CARD", "card_guid_to_play": str(WILD), "declared_color": "green",
+                            "call_uno": False, "banter": "Green it is."}, **fields))
+
+def test_wild_with_color():
+    action = ActionValidator().parse(answer(), LEGAL)
+    assert (action.card, action.declared_color) == (WILD, COLOR_CODES["green"])
+    repr(action)
+
+def test_wild_without_color_is_left_to_apply():
+    assert ActionValidator().parse(answer(declared_color=None), LEGAL).declared_color is None
+
+@pytest.mark.parametrize("color", ["black", "purple", 4, True])
+def test_wild_with_unplayable_color(color):
+    with pytest.raises(InvalidAction) as error:
+        ActionValidator().parse(answer(declared_color=color), LEGAL)
+    assert error.value.field == "declared_color"
+
+@pytest.mark.parametrize("guid", ["4", 4, True, None, "red 3"])
+def test_card_not_legal(guid):
+    with pytest.raises(InvalidAction) as error:
+        ActionValidator().parse(answer(card_guid_to_play=guid), LEGAL)
+    assert error.value.field == "card_guid_to_play"
+
+def test_draw():
+    action = ActionValidator().parse(answer(action_type="DRAW_CARD", card_guid_to_play=None, declared_color=None), LEGAL)
+    assert action.card is None and action.action_type == "DRAW_CARD"
@@ -0,0 +1,49 @@
+# Checks for speculative AI decisions whose LLM call gave nothing usable.
+# Run with: python -m pytest
+
+from concurrent.futures import Future
+
+import ai_player
+from ai_player import AI_FALLBACKS, AI_SPECULATIONS, AITurn, AITurnRunner, Speculation, fallback_move
+
+def test_speculative_fallback_is_not_counted():
+    turn = AITurn("Player2")
+    turn.speculative = True
+    before = AI_FALLBACKS.value(reason="timeout")
+    fallback_move(turn, "The LLM timed out", "timeout")
+    assert turn.source == "fallback"
+    assert AI_FALLBACKS.value(reason="timeout") == before
+    fallback_move(AITurn("Player2"), "The LLM timed out", "timeout")
+    assert AI_FALLBACKS.value(reason="timeout") == before + 1
+
+def test_fallback_speculation_is_not_adopted():
+    decided = AITurn("Player2")
+    decided.speculative = True
+    decided.llm_action = fallback_move(decided, "The LLM timed out", "timeout")
+    speculation = Speculation("key", decided)
+    speculation.future = Future()
+    speculation.future.set_result(None)
+    runner = AITurnRunner(max_workers=1, max_speculative=0)
+    try:
+        before = AI_SPECULATIONS.value(outcome="fallback")
+        turn = AITurn("Player2")
+        assert not runner._use_speculation(turn, speculation) # The real turn asks the LLM itself
+        assert turn.llm_action is None and turn.source == "llm"
+        assert AI_SPECULATIONS.value(outcome="fallback") == before + 1
+    finally:
+        runner.shutdown()
+
+def test_llm_speculation_is_adopted():
+    decided = AITurn("Player2")
+    decided.llm_action = ai_player.AIAction(banter="Drawing.")
+    decided.banter = "Drawing."
+    speculation = Speculation("key", decided)
+    speculation.future = Future()
+    speculation.future.set_result(None)
+    runner = AITurnRunner(max_workers=1, max_speculative=0)
+    try:
+        turn = AITurn("Player2")
+        assert runner._use_speculation(turn, speculation)
+        assert turn.llm_action is decided.llm_action and turn.source == "llm"
+    finally:
+        runner.shutdown()
@@ -0,0 +1,57 @@
+# Property test for the card piles: whatever is played, drawn or reshuffled, the hands, the draw
+# pile and the discard pile together always hold each of the 108 card ids exactly once.
+# Run with: python -m pytest
+
+import random
+
+import pytest
+
+from cards import DrawPile, create_deck, shuffle_deck
+from game_engine import GameState
+
+ALL_CARDS = sorted(create_deck())
+
+def all_cards(game):
+    cards = list(game.draw_pile.cards) + list(game.draw_pile.discard)
+    for hand in game.player_hands.values():
+        cards.extend(hand)
+    return sorted(cards)
+
+@pytest.mark.parametrize("seed", range(200))
+def test_play_draw_reshuffle_conserve_cards(seed):
+    random.seed(seed) # The deck shuffle and reshuffles draw from `random`
+    rng = random.Random(seed)
+    game = GameState(f"conservation-{seed}")
+    game.start()
+    assert len(ALL_CARDS) == 108 and all_cards(game) == ALL_CARDS
+    for _ in range(300):
+        player = rng.choice(game.players)
+        hand = game.player_hands[player]
+        op = rng.random()
+        if op < 0.5 and hand:
+            game.play_card(player, rng.choice(hand), rng.randrange(4)) # Validity is not the point here
+        elif op < 0.95:
+            drawn = game.draw_cards(player, rng.randint(1, 12)) # Large draws empty the pile and force reshuffles
+            assert len(set(drawn)) == len(drawn)
+        else:
+            game.draw_pile.reshuffle() # A no-op unless the draw pile is empty
+        assert all_cards(game) == ALL_CARDS
+        if game.draw_pile.discard:
+            assert game.draw_pile.discard[-1] == game.discard_pile_top_card
+
+@pytest.mark.parametrize("seed", range(50))
+def test_swap_reshuffle_keeps_top_card(seed):
+    random.seed(seed)
+    rng = random.Random(seed)
+    pile = DrawPile(shuffle_deck(create_deck()))
+    held = []
+    for _ in range(500):
+        if held and rng.random() < 0.5:
+            pile.put_on_discard(held.pop(rng.randrange(len(held))))
+        else:
+            top = pile.discard[-1] if pile.discard else None
+            empty = not pile.cards
+            held.extend(pile.draw(rng.randint(1, 8)))
+            if empty and top is not None and len(pile.discard) >= 1:
+                assert pile.discard[0] == top # The top card stays behind as the whole discard pile
+        assert sorted(pile.cards + pile.discard + held) == ALL_CARDS
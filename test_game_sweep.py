@@ -0,0 +1,55 @@
+# Checks for GameEngine.sweep on games spilled to disk by the resident cap.
+# Run with: python -m pytest
+
+import os
+import time
+
+from game_engine import GameEngine
+from persistence import GameSpill
+
+def age_spill_files(spill, seconds):
+    old = time.time() - seconds
+    for name in os.listdir(spill.directory):
+        os.utime(os.path.join(spill.directory, name), (old, old))
+
+def spilled_games(tmp_path, idle_ttl, finished_ttl):
+    # A finished and an unfinished game, both spilled; a third one stays resident
+    spill = GameSpill(str(tmp_path))
+    engine = GameEngine(idle_ttl, finished_ttl, max_resident=1, spill=spill)
+    finished = engine.create_game()
+    with finished.lock:
+        finished.game_winner = finished.players[0]
+        finished.mark_changed()
+    unfinished = engine.create_game()
+    engine.create_game()
+    assert len(spill) == 2
+    return engine, spill, finished.game_id, unfinished.game_id
+
+def test_finished_ttl_applies_to_spilled_games(tmp_path):
+    engine, spill, finished, unfinished = spilled_games(tmp_path, idle_ttl=None, finished_ttl=60)
+    age_spill_files(spill, 120)
+    assert engine.sweep() == 1
+    assert spill.load(finished) is None
+    assert engine.get_game(unfinished) is not None
+
+def test_finished_spilled_game_does_not_wait_for_idle_ttl(tmp_path):
+    engine, spill, finished, unfinished = spilled_games(tmp_path, idle_ttl=3600, finished_ttl=60)
+    age_spill_files(spill, 120)
+    assert engine.sweep() == 1
+    assert spill.load(finished) is None and spill.load(unfinished) is not None
+    age_spill_files(spill, 7200)
+    assert engine.sweep() == 1
+    assert len(spill) == 0
+
+def test_spilled_again_since_read_is_kept(tmp_path):
+    engine, spill, finished, _ = spilled_games(tmp_path, idle_ttl=None, finished_ttl=60)
+    age_spill_files(spill, 120)
+    load = spill.load
+    def load_then_touch(game_id):
+        game = load(game_id)
+        os.utime(spill._path(game_id)) # As if looked up and spilled again between the read and the removal
+        return game
+    spill.load = load_then_touch
+    assert engine.sweep() == 0
+    spill.load = load
+    assert spill.load(finished) is not None
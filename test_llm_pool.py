@@ -0,0 +1,24 @@
+# Checks for the LLM backend pool's failure accounting.
+# Run with: python -m pytest
+
+import pytest
+
+from fake_ollama import FakeOllamaServer
+from llm_client import LLMClientError
+from llm_pool import LLMPool
+
+PAYLOAD = {"model": "test", "messages": [{"role": "user", "content": "{}"}], "stream": False}
+
+def test_exhausted_budget_does_not_count_against_the_backend():
+    with FakeOllamaServer() as stub:
+        pool = LLMPool([{"url": stub.url}], failure_threshold=3, health_interval=0)
+        try:
+            for _ in range(5):
+                with pytest.raises(LLMClientError):
+                    pool.chat(PAYLOAD, latency_budget=0)
+            backend = pool.backends[0]
+            assert (backend.failures, backend.open_until, backend.outstanding) == (0, 0.0, 0)
+            assert stub.calls == 0
+            pool.chat(PAYLOAD, latency_budget=5) # The circuit is still closed
+        finally:
+            pool.close()